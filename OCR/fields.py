@@ -0,0 +1,208 @@
+"""
+Rule-based receipt field candidates from Tesseract line layout.
+
+Each field gets at most one candidate: {"value", "confidence", "line"}.
+Confidence is a rule weight (how telling the matched pattern is) scaled by
+Tesseract's mean word confidence for the line, so a clean "Grand Total"
+line scores high and a smudged bare "Total" scores low. Callers decide the
+threshold for trusting a candidate over an LLM. Weak evidence is capped
+below 0.8: a header line without a business suffix ("WELCOME", "BIG
+BAZAAR") and a day/month-ambiguous date ("01/02/2025") never score above
+0.7, whatever the OCR confidence.
+"""
+
+import re
+from datetime import date
+
+AMOUNT_RE = re.compile(r"(?<![\d.])(\d{1,3}(?:,\d{2,3})+(?:\.\d{1,2})?|\d+\.\d{1,2}|\d+)(?![\d.])")
+
+TOTAL_KEYWORDS = [
+    (re.compile(r"\bgrand\s*total\b", re.I), 1.0),
+    (re.compile(r"\b(net\s*payable|amount\s*payable|total\s*payable|amount\s*due|balance\s*due|total\s*amount|net\s*amount)\b", re.I), 0.9),
+    (re.compile(r"\btotal\b", re.I), 0.7),
+]
+NOT_TOTAL_RE = re.compile(r"\b(sub\s*-?\s*total|item\s*total|total\s*(items?|qty|quantity|savings?|discount|tax)|items?\s*total)\b", re.I)
+
+CURRENCY_PATTERNS = [
+    (re.compile(r"₹|\bRs\.?(?=\s*\d)|\bINR\b", re.I), "INR"),
+    (re.compile(r"\bUSD\b|US\$"), "USD"),
+    (re.compile(r"€|\bEUR\b"), "EUR"),
+    (re.compile(r"£|\bGBP\b"), "GBP"),
+    (re.compile(r"\bAED\b"), "AED"),
+    (re.compile(r"\bSGD\b|S\$"), "SGD"),
+    (re.compile(r"\$"), "USD"),
+]
+
+MONTHS = {m: i + 1 for i, m in enumerate(
+    ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"]
+)}
+DATE_PATTERNS = [
+    # 2025-09-12
+    (re.compile(r"\b(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})\b"), "ymd"),
+    # 12/09/2025, 12-09-25 (day first, as on Indian receipts)
+    (re.compile(r"\b(\d{1,2})[-/.](\d{1,2})[-/.](\d{4}|\d{2})\b"), "dmy"),
+    # 12 Sep 2025, 12-Sep-25
+    (re.compile(r"\b(\d{1,2})[\s-]*([A-Za-z]{3})[a-z]*[\s,-]*(\d{4}|\d{2})\b"), "d_mon_y"),
+    # Sep 12, 2025
+    (re.compile(r"\b([A-Za-z]{3})[a-z]*\s+(\d{1,2}),?\s+(\d{4})\b"), "mon_d_y"),
+]
+DATE_KEYWORD_RE = re.compile(r"\b(date|dated|dt)\b", re.I)
+
+MERCHANT_SKIP_RE = re.compile(
+    r"\b(tax\s*invoice|invoice|receipt|bill|order|gstin?|phone|ph|tel|mob|www|http|date|time|cashier|table"
+    r"|welcome|thank|thanks|visit|customer\s*copy|duplicate|original)\b|@|\d{5,}",
+    re.I,
+)
+BUSINESS_SUFFIX_RE = re.compile(
+    r"\b(ltd|limited|pvt|private|inc|llc|llp|co|corp|store|stores|mart|supermarket|restaurant|cafe|hotel|pharmacy|traders|enterprises)\b\.?",
+    re.I,
+)
+
+
+def _conf(line):
+    return max(0.0, min(line["conf"], 100.0)) / 100
+
+
+def _amount(text):
+    try:
+        return float(text.replace(",", ""))
+    except ValueError:
+        return None
+
+
+def total_candidate(lines):
+    matches = []
+    for line in lines:
+        text = line["text"]
+        if NOT_TOTAL_RE.search(text) and not TOTAL_KEYWORDS[0][0].search(text):
+            continue
+        weight = next((w for pattern, w in TOTAL_KEYWORDS if pattern.search(text)), None)
+        if weight is None:
+            continue
+        amounts = [a for a in (_amount(m) for m in AMOUNT_RE.findall(text)) if a is not None]
+        if amounts:
+            matches.append((line, weight, amounts[-1]))
+
+    # The grand total is the largest of the total-like figures (subtotals,
+    # pre-discount totals); cash tendered and IDs are not considered
+    largest = max((value for _, _, value in matches), default=None)
+
+    best = None
+    for line, weight, value in matches:
+        if value != largest:
+            weight -= 0.2
+        if any(pattern.search(line["text"]) for pattern, _ in CURRENCY_PATTERNS):
+            weight += 0.1
+        confidence = round(min(max(weight, 0), 1.0) * _conf(line), 3)
+        if best is None or confidence > best["confidence"]:
+            best = {"value": f"{value:.2f}", "confidence": confidence, "line": line["text"]}
+    return best
+
+
+def currency_candidate(lines, total_line=None):
+    best = None
+    for line in lines:
+        for pattern, code in CURRENCY_PATTERNS:
+            if pattern.search(line["text"]):
+                weight = 0.95 if line["text"] == total_line else 0.85
+                confidence = round(weight * _conf(line), 3)
+                if best is None or confidence > best["confidence"]:
+                    best = {"value": code, "confidence": confidence, "line": line["text"]}
+                break
+    return best
+
+
+def _parse_date(match, kind):
+    a, b, c = match.groups()
+    ambiguous = False
+    if kind == "ymd":
+        year, month, day = int(a), int(b), int(c)
+    elif kind == "dmy":
+        day, month, year = int(a), int(b), int(c)
+        ambiguous = day <= 12 and month <= 12 and day != month
+    elif kind == "d_mon_y":
+        day, month, year = int(a), MONTHS.get(b[:3].lower()), int(c)
+    else:
+        month, day, year = MONTHS.get(a[:3].lower()), int(b), int(c)
+    if month is None:
+        return None, False
+    if year < 100:
+        year += 2000
+    try:
+        return date(year, month, day), ambiguous
+    except ValueError:
+        return None, False
+
+
+def date_candidate(lines):
+    best = None
+    for line in lines:
+        for pattern, kind in DATE_PATTERNS:
+            match = pattern.search(line["text"])
+            if not match:
+                continue
+            parsed, ambiguous = _parse_date(match, kind)
+            if parsed is None or not 2000 <= parsed.year <= date.today().year + 1:
+                continue
+            weight = 0.95 if DATE_KEYWORD_RE.search(line["text"]) else 0.8
+            if ambiguous:
+                # 01/02/2025 is read day first, but could be 2 January
+                weight = 0.6
+            confidence = round(weight * _conf(line), 3)
+            if best is None or confidence > best["confidence"]:
+                best = {"value": parsed.isoformat(), "confidence": confidence, "line": line["text"]}
+            break
+    return best
+
+
+def merchant_candidate(lines):
+    # The header: first text-like line near the top of the first page
+    for rank, line in enumerate(line for line in lines if line["page"] == 0):
+        if rank >= 5:
+            break
+        text = line["text"].strip(" -*=|:")
+        letters = sum(ch.isalpha() for ch in text)
+        if len(text) < 3 or letters < 0.6 * len(text.replace(" ", "")) or MERCHANT_SKIP_RE.search(text):
+            continue
+        # A title line ("TAX INVOICE") above the name is common; further down is less likely
+        weight = 0.6 - 0.05 * max(rank - 1, 0)
+        if text.isupper():
+            weight += 0.1
+        # Only a business suffix makes the first line convincing on its own
+        if BUSINESS_SUFFIX_RE.search(text):
+            weight += 0.3
+        return {"value": text, "confidence": round(min(weight, 1.0) * _conf(line), 3), "line": line["text"]}
+    return None
+
+
+def extract_candidates(lines):
+    """``lines``: [{"text", "conf", "page"}] in reading order."""
+    total = total_candidate(lines)
+    return {
+        "merchant_name": merchant_candidate(lines),
+        "total_amount": total,
+        "currency": currency_candidate(lines, total["line"] if total else None),
+        "purchase_date": date_candidate(lines),
+    }
+
+
+def lines_from_data(data, page=0):
+    """Group pytesseract.image_to_data(..., output_type=DICT) words into lines."""
+    lines = {}
+    for i, word in enumerate(data["text"]):
+        word = word.strip()
+        conf = float(data["conf"][i])
+        if not word or conf < 0:
+            continue
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        line = lines.setdefault(key, {"words": [], "confs": [], "top": data["top"][i]})
+        line["words"].append(word)
+        line["confs"].append(conf)
+    return [
+        {
+            "text": " ".join(line["words"]),
+            "conf": sum(line["confs"]) / len(line["confs"]),
+            "page": page,
+        }
+        for line in sorted(lines.values(), key=lambda line: line["top"])
+    ]
@@ -1,15 +1,25 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from PIL import Image
+from fastapi import FastAPI, File, Form, UploadFile, HTTPException
+from PIL import Image, ImageOps
 from pillow_heif import register_heif_opener
 import pytesseract
+import base64
 import io
+import logging
+import os
+from pathlib import Path
 import numpy as np
 import cv2
 from pdf2image import convert_from_bytes
 
+from fields import extract_candidates, lines_from_data
+
 register_heif_opener()
 
 app = FastAPI()
+logger = logging.getLogger(__name__)
+
+# Directory shared with the backend's local storage; enables path= requests
+SHARED_ROOT = os.getenv("OCR_SHARED_ROOT")
 
 
 def preprocess_image(image: Image.Image):
@@ -44,49 +54,119 @@ def clean_text(text: str):
     )
 
 
-def run_tesseract_variants(image_array: np.ndarray, lang: str):
+def run_tesseract_variants(image_array: np.ndarray, lang: str, page: int = 0, with_lines: bool = False):
     # Try multiple page segmentation modes; keep the longest cleaned result.
+    # with_lines also reads word boxes + confidences (image_to_data) for the
+    # winning mode only, for field extraction; the text stays Tesseract's own.
     candidate_psms = [4, 6, 11]
     best_text = ""
+    best_config = None
 
     for psm in candidate_psms:
         config = f"--oem 1 --psm {psm}"
         raw = pytesseract.image_to_string(image_array, lang=lang, config=config)
         cleaned = clean_text(raw)
-        if len(cleaned) > len(best_text):
+        if best_config is None or len(cleaned) > len(best_text):
             best_text = cleaned
+            best_config = config
+
+    lines = []
+    if with_lines:
+        data = pytesseract.image_to_data(
+            image_array, lang=lang, config=best_config, output_type=pytesseract.Output.DICT
+        )
+        lines = lines_from_data(data, page)
+
+    return best_text, lines
+
+
+PREVIEW_MAX_SIDE = int(os.getenv("OCR_PREVIEW_MAX_SIDE", "1600"))
+THUMBNAIL_MAX_SIDE = int(os.getenv("OCR_THUMBNAIL_MAX_SIDE", "320"))
+PREVIEW_QUALITY = int(os.getenv("OCR_PREVIEW_QUALITY", "70"))
+
 
-    return best_text
+def encode_jpeg(image: Image.Image, max_side: int):
+    # Downscale a copy of the already-decoded page; the OCR input is untouched
+    copy = image.convert("RGB")
+    copy.thumbnail((max_side, max_side), Image.LANCZOS)
+    buf = io.BytesIO()
+    copy.save(buf, format="JPEG", quality=PREVIEW_QUALITY, optimize=True, progressive=True)
+    return base64.b64encode(buf.getvalue()).decode("ascii")
+
+
+def build_previews(first_page: Image.Image):
+    return {
+        "preview": encode_jpeg(first_page, PREVIEW_MAX_SIDE),
+        "thumbnail": encode_jpeg(first_page, THUMBNAIL_MAX_SIDE),
+        "preview_content_type": "image/jpeg",
+    }
+
+
+def read_shared_file(path: str):
+    if not SHARED_ROOT:
+        raise HTTPException(status_code=400, detail="path uploads are disabled")
+    root = Path(SHARED_ROOT).resolve()
+    resolved = Path(path).resolve()
+    if not resolved.is_relative_to(root) or not resolved.is_file():
+        raise HTTPException(status_code=400, detail="path is outside the shared root or missing")
+    return resolved.name, resolved.read_bytes()
 
 
 @app.post("/ocr")
 async def run_ocr(
-    data: UploadFile = File(...),
-    lang: str = "eng"
+    data: UploadFile | None = File(None),
+    path: str | None = Form(None),
+    lang: str = "eng",
+    previews: bool = False,
+    fields: bool = False,
 ):
+    # Either the file itself, or the path of a file on the shared volume
+    if path:
+        original_name, file_bytes = read_shared_file(path)
+    elif data is not None:
+        original_name, file_bytes = data.filename, await data.read()
+    else:
+        raise HTTPException(status_code=400, detail="data or path is required")
+
     try:
-        file_bytes = await data.read()
-        filename = data.filename.lower()
+        filename = original_name.lower()
 
         # PDF
         if filename.endswith(".pdf"):
             images = convert_from_bytes(file_bytes, dpi=300)
             text_parts = []
-            for img in images:
+            lines = []
+            for page, img in enumerate(images):
                 processed = preprocess_image(img)
-                text_parts.append(run_tesseract_variants(processed, lang))
+                page_text, page_lines = run_tesseract_variants(processed, lang, page, with_lines=fields)
+                text_parts.append(page_text)
+                lines.extend(page_lines)
             text = "\n".join(text_parts)
+            first_page = images[0] if images else None
 
         # Images (jpg, png, heic, etc.)
         else:
             image = Image.open(io.BytesIO(file_bytes))
             processed = preprocess_image(image)
-            text = run_tesseract_variants(processed, lang)
+            text, lines = run_tesseract_variants(processed, lang, with_lines=fields)
+            first_page = ImageOps.exif_transpose(image)
 
-        return {
-            "filename": data.filename,
+        result = {
+            "filename": original_name,
             "text": clean_text(text)
         }
+        # Optional: rule-based field candidates with confidences
+        if fields:
+            result["fields"] = extract_candidates(lines)
 
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+
+    # Optional: preview + thumbnail from the decode done for OCR. The OCR
+    # result stands on its own, so a failure here only drops the previews.
+    if previews and first_page is not None:
+        try:
+            result.update(build_previews(first_page))
+        except Exception:
+            logger.warning("could not render previews for %s", original_name, exc_info=True)
+    return result
@@ -1,9 +1,10 @@
 "use client";
 
-import { useEffect, useState } from "react";
+import { useCallback, useEffect, useState } from "react";
 import { useRouter } from "next/navigation";
 import { protectedFetch } from "@/lib/protectedFetch";
 import { logout } from "@/lib/auth";
+import { applyReceiptEvent, subscribeReceiptEvents } from "@/lib/receiptEvents";
 import { toast, ToastContainer } from "react-toastify";
 import "react-toastify/dist/ReactToastify.css";
 
@@ -18,34 +19,50 @@ export default function Dashboard() {
   const [receipts, setReceipts] = useState<Receipt[]>([]);
   const [loading, setLoading] = useState(true);
 
-  // Auth check + initial fetch
-  useEffect(() => {
-    const fetchReceipts = async () => {
-      try {
-        const res = await protectedFetch("/receipts/");
-        
-        if (!res.ok) {
-          if (res.status === 401) {
-            toast.error("Session expired. Please login again.");
-            router.push("/auth");
-            return;
-          }
-          throw new Error("Failed to fetch receipts");
+  // Resume point for the live stream (X-Last-Event-ID of the list fetch)
+  const [lastEventId, setLastEventId] = useState<string | null>(null);
+
+  const fetchReceipts = useCallback(async () => {
+    try {
+      const res = await protectedFetch("/receipts/");
+      
+      if (!res.ok) {
+        if (res.status === 401) {
+          toast.error("Session expired. Please login again.");
+          router.push("/auth");
+          return;
         }
-        
-        const data = await res.json();
-        setReceipts(Array.isArray(data) ? data : []);
-      } catch (error) {
-        console.error("Error fetching receipts:", error);
-        toast.error("Failed to load receipts. Please try again.");
-        setReceipts([]);
-      } finally {
-        setLoading(false);
+        throw new Error("Failed to fetch receipts");
       }
-    };
+      
+      const data = await res.json();
+      setReceipts(Array.isArray(data) ? data : []);
+      setLastEventId(res.headers.get("X-Last-Event-ID") ?? "0");
+    } catch (error) {
+      console.error("Error fetching receipts:", error);
+      toast.error("Failed to load receipts. Please try again.");
+      setReceipts([]);
+    } finally {
+      setLoading(false);
+    }
+  }, [router]);
 
+  // Auth check + initial fetch
+  useEffect(() => {
     fetchReceipts();
-  }, [router]);
+  }, [fetchReceipts]);
+
+  // Live updates: status changes from the pipeline, edits from other tabs
+  useEffect(() => {
+    if (lastEventId === null) return;
+    return subscribeReceiptEvents(lastEventId, {
+      onEvent: (event) => setReceipts(prev => applyReceiptEvent(prev, event)),
+      onReset: () => {
+        setLastEventId(null);
+        fetchReceipts();
+      },
+    });
+  }, [lastEventId, fetchReceipts]);
 
   async function handleLogout() {
     try {
@@ -62,7 +79,8 @@ export default function Dashboard() {
 
   function handleNewReceipt(receipt: Receipt) {
     if (receipt && receipt.id) {
-      setReceipts(prev => [receipt, ...prev]);
+      // The stream may have delivered it already
+      setReceipts(prev => [receipt, ...prev.filter(r => r.id !== receipt.id)]);
     }
   }
 
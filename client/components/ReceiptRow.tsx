@@ -7,9 +7,12 @@ export default function ReceiptRow({ receipt }: { receipt: Receipt }) {
     return null;
   }
 
-  async function handleView() {
+  // Opens the compressed preview; the full-size original only on request
+  async function handleView(original = false) {
     try {
-      const res = await protectedFetch(`/receipts/${receipt.id}/view-url/`);
+      const res = await protectedFetch(
+        `/receipts/${receipt.id}/view-url/${original ? "?original=1" : ""}`
+      );
 
       if (!res.ok) {
         if (res.status === 404) {
@@ -86,12 +89,19 @@ export default function ReceiptRow({ receipt }: { receipt: Receipt }) {
 
         {/* 👁 View button ALWAYS visible */}
         <button
-          onClick={handleView}
+          onClick={() => handleView()}
           className="px-4 py-2 text-sm font-semibold rounded-lg bg-blue-500/20 text-blue-400 border border-blue-500/30 hover:bg-blue-500/30 transition"
         >
           View
         </button>
 
+        <button
+          onClick={() => handleView(true)}
+          className="text-xs text-gray-400 hover:text-gray-200 underline transition"
+        >
+          Original
+        </button>
+
         <StatusBadge status={receipt.status} />
       </div>
     </div>
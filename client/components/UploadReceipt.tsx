@@ -8,12 +8,20 @@ import { ReceiptStatus, Receipt } from "@/types/receipt";
 type UploadInitResponse = {
   uploads: {
     receipt_id: number;
-    object_name: string;
-    upload_url: string;
+    object_name: string | null;
+    upload_url: string | null;
     status: string;
+    duplicate_of: number | null;
   }[];
 };
 
+async function sha256Hex(file: File): Promise<string> {
+  const digest = await crypto.subtle.digest("SHA-256", await file.arrayBuffer());
+  return Array.from(new Uint8Array(digest))
+    .map((b) => b.toString(16).padStart(2, "0"))
+    .join("");
+}
+
 export default function UploadReceipt({
   onUploaded,
 }: {
@@ -48,6 +56,9 @@ export default function UploadReceipt({
     setUploading(true);
 
     try {
+      // Content hashes let the backend link re-uploads without a transfer
+      const hashes = await Promise.all(files.map(sha256Hex));
+
       // =============================
       // 1️⃣ INIT UPLOAD (BACKEND)
       // =============================
@@ -55,9 +66,10 @@ export default function UploadReceipt({
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({
-          files: files.map((f) => ({
+          files: files.map((f, i) => ({
             filename: f.name,
             content_type: f.type,
+            sha256: hashes[i],
           })),
         }),
       });
@@ -81,6 +93,9 @@ export default function UploadReceipt({
         const upload = data.uploads[i];
         const file = files[i];
 
+        // Already uploaded before: linked to the existing receipt
+        if (!upload.upload_url) continue;
+
         const res = await fetch(upload.upload_url, {
           method: "PUT",
           headers: {
@@ -99,31 +114,33 @@ export default function UploadReceipt({
       // =============================
       // 3️⃣ CONFIRM UPLOAD (BACKEND)
       // =============================
-      const completeRes = await protectedFetch("/receipts/complete/", {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({
-          receipt_ids: uploadedReceiptIds,
-        }),
-      });
+      if (uploadedReceiptIds.length > 0) {
+        const completeRes = await protectedFetch("/receipts/complete/", {
+          method: "POST",
+          headers: { "Content-Type": "application/json" },
+          body: JSON.stringify({
+            receipt_ids: uploadedReceiptIds,
+          }),
+        });
 
-      if (!completeRes.ok) {
-        throw new Error("Failed to confirm upload");
+        if (!completeRes.ok) {
+          throw new Error("Failed to confirm upload");
+        }
       }
 
       // =============================
       // 4️⃣ UPDATE UI
       // =============================
-      uploadedReceiptIds.forEach((id) => {
+      data.uploads.forEach((u) => {
         onUploaded({
-          id,
-          status: data.uploads.find((u) => u.receipt_id === id)?.status as ReceiptStatus,
+          id: u.receipt_id,
+          status: u.status as ReceiptStatus,
         });
       });
 
       toast.success(
-        `${uploadedReceiptIds.length} receipt${
-          uploadedReceiptIds.length > 1 ? "s" : ""
+        `${data.uploads.length} receipt${
+          data.uploads.length > 1 ? "s" : ""
         } uploaded successfully`
       );
     } catch (err) {
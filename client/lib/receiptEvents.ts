@@ -0,0 +1,100 @@
+import { API_BASE } from "./api";
+import { refreshToken } from "./auth";
+import { protectedFetch } from "./protectedFetch";
+import { Receipt } from "@/types/receipt";
+
+export type ReceiptEvent = {
+  id: number;
+  receipt_id: number;
+  kind: "updated" | "deleted";
+  receipt: Receipt;
+};
+
+type Handlers = {
+  onEvent: (event: ReceiptEvent) => void;
+  // History behind lastEventId was pruned: refetch the list
+  onReset: () => void;
+};
+
+const POLL_INTERVAL_MS = 10000;
+const MAX_STREAM_FAILURES = 3;
+
+// Live receipt changes: an EventSource on /receipts/events/, falling back
+// to polling /receipts/changes/ when the stream keeps failing (proxies
+// that buffer, expired sessions). Returns an unsubscribe function.
+export function subscribeReceiptEvents(lastEventId: string, handlers: Handlers): () => void {
+  let cursor = Number(lastEventId) || 0;
+  let source: EventSource | null = null;
+  let pollTimer: ReturnType<typeof setTimeout> | null = null;
+  let failures = 0;
+  let closed = false;
+
+  function open() {
+    // EventSource resends Last-Event-ID itself on reconnects; the query
+    // parameter covers the first connection and the ones we reopen
+    source = new EventSource(`${API_BASE}/receipts/events/?last_event_id=${cursor}`, {
+      withCredentials: true,
+    });
+
+    source.addEventListener("receipt", (e) => {
+      const message = e as MessageEvent;
+      failures = 0;
+      const event: ReceiptEvent = JSON.parse(message.data);
+      cursor = Math.max(cursor, event.id);
+      handlers.onEvent(event);
+    });
+
+    source.addEventListener("reset", () => {
+      handlers.onReset();
+    });
+
+    source.onerror = async () => {
+      // CONNECTING: the browser is retrying on its own
+      if (!source || source.readyState !== EventSource.CLOSED || closed) return;
+      source = null;
+      failures += 1;
+      // A closed stream is usually a 401: refresh the cookie and retry
+      const refreshed = await refreshToken().catch(() => false);
+      if (closed) return;
+      if (refreshed && failures < MAX_STREAM_FAILURES) {
+        open();
+      } else {
+        poll();
+      }
+    };
+  }
+
+  async function poll() {
+    try {
+      const res = await protectedFetch(`/receipts/changes/?since=${cursor}`);
+      if (res.ok) {
+        const data = await res.json();
+        if (data.reset) handlers.onReset();
+        (data.events as ReceiptEvent[]).forEach(handlers.onEvent);
+        cursor = data.last_event_id;
+        if (data.has_more && !closed) return poll();
+      }
+    } catch (error) {
+      console.error("Error polling receipt changes:", error);
+    }
+    if (!closed) pollTimer = setTimeout(poll, POLL_INTERVAL_MS);
+  }
+
+  open();
+
+  return () => {
+    closed = true;
+    source?.close();
+    if (pollTimer) clearTimeout(pollTimer);
+  };
+}
+
+// Apply one event to a list of receipts, newest first
+export function applyReceiptEvent(receipts: Receipt[], event: ReceiptEvent): Receipt[] {
+  if (event.kind === "deleted") return receipts.filter((r) => r.id !== event.receipt_id);
+  const index = receipts.findIndex((r) => r.id === event.receipt_id);
+  if (index === -1) return [event.receipt, ...receipts];
+  const next = [...receipts];
+  next[index] = event.receipt;
+  return next;
+}
@@ -1,7 +1,18 @@
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.db import models
 
-class UserManager(BaseUserManager):
+class UserQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        rows = super().update(**kwargs)
+        if rows:
+            # No save signals here, but cached users (authapp.utils) must still go
+            from .utils import user_cache_changed
+
+            user_cache_changed()
+        return rows
+
+
+class UserManager(BaseUserManager.from_queryset(UserQuerySet)):
     def create_user(self, email, password=None):
         if not email:
             raise ValueError("Email is required")
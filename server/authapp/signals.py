@@ -0,0 +1,15 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import User
+from .utils import user_cache, user_cache_changed
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def drop_cached_user(sender, instance, update_fields=None, **kwargs):
+    # Covers deactivation, password changes and deletes, in every process
+    user_cache.invalidate(instance.pk)
+    # Every login writes last_login, which authentication doesn't depend on
+    if update_fields is None or set(update_fields) != {"last_login"}:
+        user_cache_changed()
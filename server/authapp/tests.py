@@ -0,0 +1,33 @@
+from django.test import TestCase, override_settings
+
+from .models import User
+from .utils import _UserCache
+
+
+@override_settings(AUTH_USER_CACHE_SECONDS=300, AUTH_USER_CACHE_CHECK_SECONDS=0)
+class UserCacheTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="cached@example.com", password="x")
+        # Another process's cache: the signals here never touch it
+        self.other = _UserCache()
+        self.other.get(self.user.id)  # reads the current epoch
+        self.other.set(self.user.id, self.user)
+
+    def test_queryset_update_reaches_other_processes(self):
+        self.assertIsNotNone(self.other.get(self.user.id))
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.filter(id=self.user.id).update(is_active=False)
+        self.assertIsNone(self.other.get(self.user.id))
+
+    def test_save_reaches_other_processes(self):
+        self.assertIsNotNone(self.other.get(self.user.id))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertIsNone(self.other.get(self.user.id))
+
+    def test_last_login_keeps_the_cache(self):
+        self.assertIsNotNone(self.other.get(self.user.id))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save(update_fields=["last_login"])
+        self.assertIsNotNone(self.other.get(self.user.id))
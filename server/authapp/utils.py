@@ -1,6 +1,120 @@
+import copy
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+logger = logging.getLogger(__name__)
+
+
+# Bumped in the shared cache whenever a user changes; every process drops
+# its cached users when it sees a new value
+EPOCH_KEY = "auth-user-cache-epoch"
+
+
+def user_cache_changed():
+    """Make every process drop its cached users once the current transaction commits."""
+    transaction.on_commit(lambda: cache.set(EPOCH_KEY, time.time_ns(), None))
+
+
+class _UserCache:
+    """
+    Per-process TTL cache of user id -> User, so an authenticated request
+    does no auth queries on a hit. User saves, deletes and QuerySet.update()
+    bump an epoch in the shared cache (see authapp.signals and
+    authapp.models); each process reads it at most every
+    AUTH_USER_CACHE_CHECK_SECONDS and starts over when it changed, which
+    bounds how long a deactivated user keeps authenticating anywhere.
+    AUTH_USER_CACHE_SECONDS only backs up an unreadable shared cache.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._epoch = None
+        self._epoch_checked_at = float("-inf")
+
+    def _check_epoch(self):
+        now = time.monotonic()
+        if now - self._epoch_checked_at < settings.AUTH_USER_CACHE_CHECK_SECONDS:
+            return
+        self._epoch_checked_at = now
+        try:
+            epoch = cache.get(EPOCH_KEY, 0)
+        except Exception:
+            logger.warning("auth user cache epoch unavailable", exc_info=True)
+            return
+        if epoch != self._epoch:
+            self.clear()
+            self._epoch = epoch
+
+    # Keys are str(): token claims carry the id as a string, signals pass the pk
+
+    def get(self, user_id):
+        self._check_epoch()
+        entry = self._entries.get(str(user_id))
+        if entry is None:
+            return None
+        expires, user = entry
+        if expires < time.monotonic():
+            self.invalidate(user_id)
+            return None
+        # Copy so per-request mutations never leak into the shared instance
+        return copy.copy(user)
+
+    def set(self, user_id, user):
+        with self._lock:
+            if len(self._entries) >= settings.AUTH_USER_CACHE_MAX_ENTRIES:
+                now = time.monotonic()
+                for key in [k for k, (expires, _) in self._entries.items() if expires < now]:
+                    del self._entries[key]
+                if len(self._entries) >= settings.AUTH_USER_CACHE_MAX_ENTRIES:
+                    self._entries.clear()
+            self._entries[str(user_id)] = (time.monotonic() + settings.AUTH_USER_CACHE_SECONDS, copy.copy(user))
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(str(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = _UserCache()
+
+
+class CachedUserJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        if not settings.AUTH_USER_CACHE_SECONDS:
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken("Token contained no recognizable user identification")
+
+        user = user_cache.get(user_id)
+        if user is None:
+            user = super().get_user(validated_token)
+            user_cache.set(user_id, user)
+            return user
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed("The user's password has been changed.", code="password_changed")
+
+        return user
+
 
-class CookieJWTAuthentication(JWTAuthentication):
+class CookieJWTAuthentication(CachedUserJWTAuthentication):
     def authenticate(self, request):
         raw_token = request.COOKIES.get("access")
 
@@ -82,6 +82,9 @@ CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
 ]
 
+# Lets the dashboard read the list's event cursor
+CORS_EXPOSE_HEADERS = ["X-Last-Event-ID"]
+
 CSRF_TRUSTED_ORIGINS = [
     "http://localhost:3000",
 ]
@@ -89,7 +92,7 @@ CSRF_TRUSTED_ORIGINS = [
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
         "authapp.utils.CookieJWTAuthentication",
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "authapp.utils.CachedUserJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": (
         "rest_framework.permissions.IsAuthenticated",
@@ -103,6 +106,23 @@ SIMPLE_JWT = {
     "AUTH_HEADER_TYPES": ("Bearer",),
 }
 
+# Authenticated user lookups are cached per process; 0 disables the cache.
+# Processes look for user changes in the shared cache every
+# AUTH_USER_CACHE_CHECK_SECONDS; the TTL only applies if that cache fails
+AUTH_USER_CACHE_SECONDS = int(os.getenv("AUTH_USER_CACHE_SECONDS", "30"))
+AUTH_USER_CACHE_CHECK_SECONDS = float(os.getenv("AUTH_USER_CACHE_CHECK_SECONDS", "1"))
+AUTH_USER_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_USER_CACHE_MAX_ENTRIES", "10000"))
+
+# File storage: gcs | local (signed Django URLs, files under LOCAL_STORAGE_ROOT)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "gcs")
+SIGNED_URL_EXPIRY_SECONDS = int(os.getenv("SIGNED_URL_EXPIRY_SECONDS", "3600"))
+LOCAL_STORAGE_ROOT = os.getenv("LOCAL_STORAGE_ROOT", str(BASE_DIR / "media"))
+LOCAL_STORAGE_MAX_UPLOAD_BYTES = int(os.getenv("LOCAL_STORAGE_MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+# nginx "internal" location aliased to LOCAL_STORAGE_ROOT; empty = Django streams the files
+LOCAL_STORAGE_ACCEL_PREFIX = os.getenv("LOCAL_STORAGE_ACCEL_PREFIX", "")
+# Absolute origin used to build local signed URLs
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "http://localhost:8000")
+
 #GCS Settings
 GCS_BUCKET_NAME = os.getenv("GCS_BUCKET_NAME")
 # N8N Webhook URL
@@ -114,6 +134,7 @@ N8N_SECRET = os.getenv("N8N_WEBHOOK_SECRET")
 # ===============================
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta")
 GEMINI_EMBED_MODEL = os.getenv(
     "GEMINI_EMBED_MODEL",
 )
@@ -132,3 +153,106 @@ QDRANT_COLLECTION = os.getenv(
     "receipts",
 )
 
+# Search-time HNSW beam width and int8 oversampling (0 = collection defaults);
+# pick them with manage.py bootstrap_collection --benchmark
+QDRANT_SEARCH_HNSW_EF = int(os.getenv("QDRANT_SEARCH_HNSW_EF", "0"))
+QDRANT_SEARCH_OVERSAMPLING = float(os.getenv("QDRANT_SEARCH_OVERSAMPLING", "0"))
+
+# Retrieval backend for AIQueryView: "qdrant" or "local" (in-process
+# per-user index over ReceiptEmbedding rows in Postgres; n8n-ingested
+# receipts are mirrored from Qdrant by their READY callback)
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "qdrant")
+LOCAL_INDEX_MAX_USERS = int(os.getenv("LOCAL_INDEX_MAX_USERS", "256"))
+LOCAL_INDEX_TTL_SECONDS = int(os.getenv("LOCAL_INDEX_TTL_SECONDS", "300"))
+
+# Overall budget for one AI query (embed + search + generate), in seconds
+AI_QUERY_DEADLINE_SECONDS = float(os.getenv("AI_QUERY_DEADLINE_SECONDS", "45"))
+AI_ANSWER_CACHE_SECONDS = int(os.getenv("AI_ANSWER_CACHE_SECONDS", "300"))
+
+# Shared cache for AI answers and their per-user invalidation versions. It
+# must be visible to every web worker and the ingestion worker, so a bump in
+# one process invalidates answers everywhere: "db" (table created by the
+# receipts migrations), "redis" (REDIS_URL, needs redis-py) or "locmem"
+# (single-process development only)
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "db")
+if CACHE_BACKEND == "redis":
+    CACHES = {"default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+    }}
+elif CACHE_BACKEND == "locmem":
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+else:
+    CACHES = {"default": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "django_cache",
+        "OPTIONS": {"MAX_ENTRIES": int(os.getenv("CACHE_MAX_ENTRIES", "50000"))},
+    }}
+# Distinct AI queries a user may have running per process (identical ones
+# are coalesced and don't count); 0 disables the cap
+AI_QUERY_MAX_CONCURRENT_PER_USER = int(os.getenv("AI_QUERY_MAX_CONCURRENT_PER_USER", "3"))
+
+# Live receipt events (GET /receipts/events/): streams end after
+# RECEIPT_STREAM_MAX_SECONDS and browsers reconnect with Last-Event-ID;
+# prune_receipt_events keeps RECEIPT_EVENTS_RETENTION_HOURS of history
+RECEIPT_STREAM_MAX_SECONDS = int(os.getenv("RECEIPT_STREAM_MAX_SECONDS", "300"))
+RECEIPT_STREAM_HEARTBEAT_SECONDS = int(os.getenv("RECEIPT_STREAM_HEARTBEAT_SECONDS", "15"))
+RECEIPT_STREAM_RETRY_MS = int(os.getenv("RECEIPT_STREAM_RETRY_MS", "3000"))
+RECEIPT_EVENTS_RETENTION_HOURS = int(os.getenv("RECEIPT_EVENTS_RETENTION_HOURS", "72"))
+
+# Tracing: fraction of requests logged with full span detail, and the
+# latency above which a request is always logged as slow
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "5000"))
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "receipts": {
+            "handlers": ["console"],
+            "level": os.getenv("RECEIPTS_LOG_LEVEL", "INFO"),
+        },
+    },
+}
+
+# ===============================
+# INGESTION PIPELINE
+# ===============================
+
+# "n8n" posts to N8N_WEBHOOK_URL; "native" queues an IngestionJob for
+# manage.py run_ingestion_worker
+INGESTION_BACKEND = os.getenv("INGESTION_BACKEND", "n8n")
+OCR_SERVICE_URL = os.getenv("OCR_SERVICE_URL", "http://ocr:8000/ocr")
+# Ask the OCR service for a preview + thumbnail and store them next to the original
+INGESTION_PREVIEWS = os.getenv("INGESTION_PREVIEWS", "True") == "True"
+# Skip LLM extraction when the OCR service's rule-based merchant/total/date
+# candidates all reach this confidence (0-1); above 1 disables the heuristics
+INGESTION_HEURISTIC_MIN_CONFIDENCE = float(os.getenv("INGESTION_HEURISTIC_MIN_CONFIDENCE", "0.8"))
+# OCR service mounts LOCAL_STORAGE_ROOT at the same path: send paths, not bytes
+OCR_SHARED_STORAGE = os.getenv("OCR_SHARED_STORAGE", "False") == "True"
+
+INGESTION_MAX_IN_FLIGHT = int(os.getenv("INGESTION_MAX_IN_FLIGHT", "16"))
+INGESTION_STAGE_CONCURRENCY = {
+    "download": int(os.getenv("INGESTION_DOWNLOAD_CONCURRENCY", "8")),
+    "ocr": int(os.getenv("INGESTION_OCR_CONCURRENCY", "2")),
+    "extract": int(os.getenv("INGESTION_EXTRACT_CONCURRENCY", "8")),
+    # concurrent embed + upsert flushes of the shared batcher
+    "embed": int(os.getenv("INGESTION_EMBED_CONCURRENCY", "4")),
+}
+INGESTION_MAX_ATTEMPTS = int(os.getenv("INGESTION_MAX_ATTEMPTS", "5"))
+INGESTION_RETRY_BASE_SECONDS = int(os.getenv("INGESTION_RETRY_BASE_SECONDS", "30"))
+INGESTION_RETRY_MAX_SECONDS = int(os.getenv("INGESTION_RETRY_MAX_SECONDS", "1800"))
+INGESTION_LEASE_SECONDS = int(os.getenv("INGESTION_LEASE_SECONDS", "900"))
+
+# Token budget per OCR-text chunk (receipts.chunking)
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "512"))
+
+# Batched embedding/indexing: chunks from many receipts share one
+# batchEmbedContents call (max 100 texts) and bulk wait=false upserts
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "100"))
+EMBED_FLUSH_INTERVAL_MS = int(os.getenv("EMBED_FLUSH_INTERVAL_MS", "250"))
+QDRANT_UPSERT_BATCH_SIZE = int(os.getenv("QDRANT_UPSERT_BATCH_SIZE", "512"))
@@ -0,0 +1,13 @@
+# Production ASGI serving: gunicorn -c gunicorn.conf.py config.asgi:application
+import multiprocessing
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+
+# Async AI queries can legitimately run up to AI_QUERY_DEADLINE_SECONDS;
+# keep the worker timeout comfortably above it.
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "90"))
+graceful_timeout = 30
+keepalive = 5
@@ -1,6 +1,13 @@
 from django.contrib import admin
-from .models import Receipt
+from .models import Receipt, IngestionJob
 
 @admin.register(Receipt)
 class ReceiptAdmin(admin.ModelAdmin):
     list_display = ("id", "user", "status", "created_at")
+
+
+@admin.register(IngestionJob)
+class IngestionJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "receipt", "kind", "status", "stage", "rerun", "attempts", "run_after", "locked_by")
+    list_filter = ("status", "kind", "stage")
+    raw_id_fields = ("receipt",)
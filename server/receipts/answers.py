@@ -0,0 +1,51 @@
+"""
+Short-lived cache of AI answers per user and normalised question.
+
+Keys embed a per-user version that is bumped whenever one of the user's
+receipts changes, so a cached answer never outlives the data it was
+grounded on.
+"""
+
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+def normalise_question(question):
+    return " ".join(question.lower().split())
+
+
+def _version_key(user_id):
+    return f"ai-answer-version:{user_id}"
+
+
+def _answer_key(user_id, version, question):
+    digest = hashlib.sha1(normalise_question(question).encode()).hexdigest()
+    return f"ai-answer:{user_id}:{version}:{digest}"
+
+
+def bump_answer_version(user_id):
+    cache.set(_version_key(user_id), time.time_ns(), None)
+
+
+def get_answer_version(user_id):
+    """The user's data version, shared by every process (see receipts.retrieval)."""
+    return cache.get(_version_key(user_id), 0)
+
+
+async def aget_cached_answer(user_id, question):
+    """(version, cached answer or None); pass the version to aset_cached_answer."""
+    version = await cache.aget(_version_key(user_id), 0)
+    return version, await cache.aget(_answer_key(user_id, version, question))
+
+
+async def aset_cached_answer(user_id, version, question, answer):
+    # Stored under the version read before the search: an answer racing a
+    # write lands under the old version and is never served
+    await cache.aset(
+        _answer_key(user_id, version, question),
+        answer,
+        settings.AI_ANSWER_CACHE_SECONDS,
+    )
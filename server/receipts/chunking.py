@@ -0,0 +1,106 @@
+"""
+Receipt chunking for embeddings.
+
+A receipt becomes one summary chunk plus its OCR text packed into chunks
+of at most CHUNK_MAX_TOKENS, cut at line boundaries (a single overlong
+line is cut at word boundaries). Nothing is truncated.
+
+Every chunk carries a content hash, and its Qdrant point id is derived
+from (receipt id, hash). Re-processing a receipt therefore only embeds
+chunks whose hash is new; unchanged chunks keep their point and vector.
+"""
+
+import hashlib
+import math
+import re
+import uuid
+
+from django.conf import settings
+
+POINT_NAMESPACE = uuid.UUID("6f1c2a4e-3b1d-5c7e-9a8f-0d2e4b6c8a10")
+
+# Text shorter than this is already covered by the summary chunk's snippet
+MIN_TEXT_CHARS = 50
+
+
+def estimate_tokens(text):
+    # ~4 characters per token for the Latin-script text receipts carry
+    return max(1, math.ceil(len(text) / 4))
+
+
+def chunk_hash(chunk_type, text):
+    return hashlib.sha256(f"{chunk_type}\n{text}".encode("utf-8")).hexdigest()
+
+
+def point_id(receipt_id, content_hash):
+    return str(uuid.uuid5(POINT_NAMESPACE, f"{receipt_id}:{content_hash}"))
+
+
+def _split_long_line(line, max_tokens):
+    pieces, current = [], []
+    for word in line.split(" "):
+        candidate = " ".join([*current, word])
+        if current and estimate_tokens(candidate) > max_tokens:
+            pieces.append(" ".join(current))
+            current = [word]
+        else:
+            current.append(word)
+    if current:
+        pieces.append(" ".join(current))
+    # A single word longer than the budget is cut hard
+    max_chars = max_tokens * 4
+    return [p[i:i + max_chars] for p in pieces for i in range(0, len(p), max_chars)]
+
+
+def split_text(text, max_tokens):
+    """Greedily pack whole lines into chunks of at most ``max_tokens``."""
+    lines = []
+    for line in (text or "").splitlines():
+        line = re.sub(r"\s+", " ", line).strip()
+        if not line:
+            continue
+        if estimate_tokens(line) > max_tokens:
+            lines.extend(_split_long_line(line, max_tokens))
+        else:
+            lines.append(line)
+
+    chunks, current, used = [], [], 0
+    for line in lines:
+        cost = estimate_tokens(line) + (1 if current else 0)  # the joining newline
+        if current and used + cost > max_tokens:
+            chunks.append("\n".join(current))
+            current, used = [], 0
+            cost = estimate_tokens(line)
+        current.append(line)
+        used += cost
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def build_chunks(fields, ocr_text, max_tokens=None):
+    max_tokens = max_tokens or settings.CHUNK_MAX_TOKENS
+    merchant = fields.get("merchant_name") or "Unknown merchant"
+    amount = fields.get("total_amount") or "unknown amount"
+    currency = fields.get("currency") or ""
+    date = fields["purchase_date"].date().isoformat() if fields.get("purchase_date") else "unknown date"
+    snippet = re.sub(r"\s+", " ", ocr_text or "").strip()[:200]
+
+    chunks = [{
+        "chunk_type": "receipt_summary",
+        "chunk_text": f"Receipt from {merchant}. Total {currency} {amount}. Purchase date {date}. OCR context: {snippet}",
+    }]
+
+    if len(re.sub(r"\s+", " ", ocr_text or "").strip()) > MIN_TEXT_CHARS:
+        for text in split_text(ocr_text, max_tokens):
+            chunks.append({"chunk_type": "receipt_full_text", "chunk_text": text})
+
+    seen = set()
+    unique = []
+    for chunk in chunks:
+        chunk["chunk_hash"] = chunk_hash(chunk["chunk_type"], chunk["chunk_text"])
+        # Identical chunks would share a point id and add nothing to search
+        if chunk["chunk_hash"] not in seen:
+            seen.add(chunk["chunk_hash"])
+            unique.append(chunk)
+    return unique
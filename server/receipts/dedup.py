@@ -0,0 +1,136 @@
+"""
+Per-user exact-duplicate detection by SHA-256 of the uploaded file.
+
+A duplicate is linked to the earliest live receipt with the same hash
+(``duplicate_of``) and takes its results instead of going through OCR,
+extraction and indexing. Duplicates are not indexed themselves, so search
+and answers keep returning the original. If the original is still being
+processed, the duplicate waits in PENDING and ``sync_duplicates`` copies
+the outcome over once the original is READY or FAILED.
+
+A receipt's own hash is always computed from the stored object: by the
+native pipeline right after download, or at upload-complete for the n8n
+backend. The hash a client sends at upload-init is only used to look up
+an existing original (the upload is then skipped altogether) and is
+never recorded as the hash of a new receipt. Only originals whose upload
+was confirmed can be linked to, so a PENDING receipt whose upload never
+finished doesn't capture later uploads of the same file.
+"""
+
+import hashlib
+import re
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import events
+from .models import Receipt, ReceiptContent
+from .signals import receipts_changed
+
+SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+RESULT_FIELDS = ("merchant_name", "total_amount", "currency", "purchase_date", "preview_key", "thumbnail_key")
+
+WAITING_STATUSES = ("PENDING", "UPLOADED", "PROCESSING")
+
+# An original's file is known to be in storage
+ORIGINAL_STATUSES = ("UPLOADED", "PROCESSING", "READY")
+
+
+def normalize_sha256(value):
+    if not isinstance(value, str):
+        return None
+    value = value.strip().lower()
+    return value if SHA256_RE.match(value) else None
+
+
+def sha256_of(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def find_original(user_id, sha256, before_id=None):
+    """Earliest uploaded, non-duplicate receipt of ``user_id`` with this hash."""
+    queryset = Receipt.objects.filter(
+        user_id=user_id,
+        content_sha256=sha256,
+        duplicate_of__isnull=True,
+        status__in=ORIGINAL_STATUSES,
+    )
+    if before_id is not None:
+        queryset = queryset.filter(id__lt=before_id)
+    return queryset.order_by("id").first()
+
+
+def _copy_content(original_id, duplicate_ids):
+    content = ReceiptContent.objects.filter(receipt_id=original_id).first()
+    if content is None or not duplicate_ids:
+        return
+    ReceiptContent.objects.bulk_create(
+        [
+            ReceiptContent(
+                receipt_id=duplicate_id,
+                ocr_text_z=content.ocr_text_z,
+                raw_extracted_json_z=content.raw_extracted_json_z,
+            )
+            for duplicate_id in duplicate_ids
+        ],
+        update_conflicts=True,
+        unique_fields=["receipt"],
+        update_fields=["ocr_text_z", "raw_extracted_json_z"],
+    )
+
+
+def link_duplicate(receipt, original):
+    """
+    Point ``receipt`` at ``original`` and save it. Results are copied right
+    away when the original is already READY; otherwise ``receipt`` stays
+    PENDING until sync_duplicates runs for the original.
+    """
+    receipt.duplicate_of = original
+    receipt.content_sha256 = original.content_sha256
+    receipt.file_key = original.file_key
+    if original.status == "READY":
+        for field in RESULT_FIELDS:
+            setattr(receipt, field, getattr(original, field))
+        receipt.status = "READY"
+    else:
+        receipt.status = "PENDING"
+    receipt.save()
+
+    if receipt.status == "READY":
+        _copy_content(original.id, [receipt.id])
+
+
+def sync_duplicates(original_ids):
+    """
+    Mirror finished originals onto their duplicates: a READY original's
+    results overwrite every duplicate (pipelines may write fields in more
+    than one call), a FAILED original fails the duplicates still waiting.
+    """
+    originals = Receipt.objects.filter(
+        id__in=list(original_ids),
+        status__in=("READY", "FAILED"),
+        duplicates__isnull=False,
+    ).distinct()
+
+    user_ids = set()
+    with transaction.atomic():
+        for original in originals:
+            duplicates = Receipt.objects.filter(duplicate_of=original)
+            if original.status == "READY":
+                duplicate_ids = list(duplicates.values_list("id", flat=True))
+                duplicates.update(
+                    status="READY",
+                    updated_at=timezone.now(),
+                    **{field: getattr(original, field) for field in RESULT_FIELDS},
+                )
+                _copy_content(original.id, duplicate_ids)
+            else:
+                duplicate_ids = list(duplicates.filter(status__in=WAITING_STATUSES).values_list("id", flat=True))
+                Receipt.objects.filter(id__in=duplicate_ids).update(status="FAILED", updated_at=timezone.now())
+            events.record_ids(duplicate_ids)
+            user_ids.add(original.user_id)
+
+        if user_ids:
+            # .update() skips post_save
+            transaction.on_commit(lambda: receipts_changed(user_ids))
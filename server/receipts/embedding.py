@@ -0,0 +1,150 @@
+"""
+Cross-receipt embedding and indexing batcher.
+
+Ingestion threads submit a receipt's chunks and block on the returned
+future. A background thread groups pending chunks from many receipts and
+flushes them when EMBED_BATCH_SIZE texts are waiting or the oldest has
+waited EMBED_FLUSH_INTERVAL_MS: one batchEmbedContents call per
+EMBED_BATCH_SIZE texts, then Qdrant upserts of up to
+QDRANT_UPSERT_BATCH_SIZE points with wait=false.
+"""
+
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from django.conf import settings
+
+from . import metrics
+from .gemini import embed_texts_sync
+from .qdrant import upsert_points
+
+
+class _Item:
+    __slots__ = ("ids", "texts", "payloads", "future", "queued_at")
+
+    def __init__(self, ids, texts, payloads):
+        self.ids = ids
+        self.texts = texts
+        self.payloads = payloads
+        self.future = Future()
+        self.queued_at = time.monotonic()
+
+
+class EmbeddingBatcher:
+    def __init__(
+        self,
+        batch_size=None,
+        flush_interval_ms=None,
+        max_concurrent_flushes=None,
+        upsert_batch_size=None,
+        collection=None,
+        upsert_wait=False,
+        embed_model=None,
+    ):
+        self.batch_size = batch_size or settings.EMBED_BATCH_SIZE
+        self.flush_interval = (flush_interval_ms or settings.EMBED_FLUSH_INTERVAL_MS) / 1000
+        self.upsert_batch_size = upsert_batch_size or settings.QDRANT_UPSERT_BATCH_SIZE
+        self.collection = collection
+        self.upsert_wait = upsert_wait
+        self.embed_model = embed_model
+
+        self._cond = threading.Condition()
+        self._pending = []
+        self._pending_texts = 0
+        self._closed = False
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_concurrent_flushes or settings.INGESTION_STAGE_CONCURRENCY["embed"],
+            thread_name_prefix="embed-flush",
+        )
+        self._thread = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, ids, texts, payloads):
+        """Queue points for embedding + upsert; the future resolves to their vectors."""
+        item = _Item(ids, texts, payloads)
+        if not texts:
+            item.future.set_result([])
+            return item.future
+
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("EmbeddingBatcher is closed")
+            self._pending.append(item)
+            self._pending_texts += len(texts)
+            self._cond.notify()
+        return item.future
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        self._pool.shutdown(wait=True)
+
+    def _take_batch(self):
+        batch = []
+        count = 0
+        while self._pending and (not batch or count + len(self._pending[0].texts) <= self.batch_size):
+            item = self._pending.pop(0)
+            batch.append(item)
+            count += len(item.texts)
+        self._pending_texts -= count
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._pending_texts >= self.batch_size:
+                        break
+                    if self._pending:
+                        remaining = self.flush_interval - (time.monotonic() - self._pending[0].queued_at)
+                        if remaining <= 0 or self._closed:
+                            break
+                        self._cond.wait(remaining)
+                    elif self._closed:
+                        return
+                    else:
+                        self._cond.wait()
+                batch = self._take_batch()
+            self._pool.submit(self._flush, batch)
+
+    def _flush(self, batch):
+        texts = [text for item in batch for text in item.texts]
+        try:
+            start = time.perf_counter()
+            vectors = []
+            for i in range(0, len(texts), self.batch_size):
+                vectors.extend(embed_texts_sync(texts[i:i + self.batch_size], model=self.embed_model))
+                metrics.counter("ingestion.embed.requests").inc()
+            metrics.histogram("ingestion.embed_batch_ms").observe((time.perf_counter() - start) * 1000)
+            metrics.counter("ingestion.embed.texts").inc(len(texts))
+
+            points = []
+            offset = 0
+            for item in batch:
+                for point_id, payload in zip(item.ids, item.payloads):
+                    points.append({"id": point_id, "vector": vectors[offset], "payload": payload})
+                    offset += 1
+
+            start = time.perf_counter()
+            for i in range(0, len(points), self.upsert_batch_size):
+                upsert_points(
+                    points[i:i + self.upsert_batch_size],
+                    collection=self.collection,
+                    wait=self.upsert_wait,
+                )
+                metrics.counter("ingestion.index.requests").inc()
+            metrics.histogram("ingestion.index_batch_ms").observe((time.perf_counter() - start) * 1000)
+            metrics.counter("ingestion.index.points").inc(len(points))
+        except Exception as e:
+            metrics.counter("ingestion.embed.failed_batches").inc()
+            for item in batch:
+                item.future.set_exception(e)
+            return
+
+        offset = 0
+        for item in batch:
+            item.future.set_result(vectors[offset:offset + len(item.texts)])
+            offset += len(item.texts)
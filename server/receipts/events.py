@@ -0,0 +1,361 @@
+"""
+Live receipt changes for the dashboard.
+
+Receipt writes only mark the receipt as changed; when the writing
+transaction commits, one ReceiptEvent per changed receipt is appended,
+rendered from the committed row, and ``NOTIFY receipt_events, '<user id>'``
+goes out. A receipt saved several times in one transaction (upload init
+creates it, then sets its file key) therefore yields one event. One
+listener thread per process LISTENs on that channel and wakes the streams
+of that user; the streams then read new events from the table, so the
+table stays the single source of truth, a missed notification only delays
+an event until the next heartbeat, and resuming from a Last-Event-ID is a
+plain ``id > N`` query.
+
+That query is exact because events are appended in a short transaction
+holding a per-user advisory lock: a user's event ids commit in id order,
+so no event can become visible below an id a reader already returned.
+Events are written after the change commits, so a process dying between
+the two loses the event; the client catches up on its next list fetch.
+"""
+
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, connections, transaction
+
+from .models import Receipt, ReceiptEvent
+from .serializers import ReceiptListSerializer
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "receipt_events"
+# First key of pg_advisory_xact_lock(int, int); the second is the user id
+LOCK_NAMESPACE = 0x52455645
+FETCH_LIMIT = 500
+
+
+# ---------------------------------------------------------------------------
+# Writing
+# ---------------------------------------------------------------------------
+
+class _Batch:
+    """
+    Receipts changed by one transaction: receipt id -> user id (None when
+    unknown; only needed to address a deletion). It is the transaction's
+    on_commit callback, so a rollback discards it with the changes.
+    """
+
+    def __init__(self):
+        self.receipts = {}
+        self.flushed = False
+
+    def add(self, changes):
+        for receipt_id, user_id in changes:
+            if user_id is not None or receipt_id not in self.receipts:
+                self.receipts[receipt_id] = user_id
+
+    def __call__(self):
+        self.flushed = True
+        _flush(self.receipts)
+
+
+_local = threading.local()
+
+
+def _mark(changes):
+    # Only a weak reference is kept here: the pending on_commit callbacks
+    # hold the batch, so once Django runs it or discards it (rollback, or
+    # rollback of the savepoint it was registered in) the reference dies
+    # and the next change starts a new batch.
+    ref = getattr(_local, "batch", None)
+    batch = ref() if ref is not None else None
+    if batch is not None and not batch.flushed:
+        batch.add(changes)
+        return
+    # First change in this transaction (or in autocommit, where it runs right away)
+    batch = _Batch()
+    batch.add(changes)
+    _local.batch = weakref.ref(batch)
+    transaction.on_commit(batch, robust=True)
+
+
+def _flush(receipts):
+    if not receipts:
+        return
+    # Rendered from committed rows: the final state, whatever the writer saved
+    current = {r.id: r for r in Receipt.objects.filter(id__in=list(receipts))}
+    new_events = []
+    for receipt_id, user_id in receipts.items():
+        receipt = current.get(receipt_id)
+        if receipt is not None:
+            new_events.append(ReceiptEvent(
+                user_id=receipt.user_id,
+                receipt_id=receipt_id,
+                data=ReceiptListSerializer(receipt).data,
+            ))
+        elif user_id is not None:
+            new_events.append(ReceiptEvent(
+                user_id=user_id,
+                receipt_id=receipt_id,
+                kind="deleted",
+                data={"id": receipt_id},
+            ))
+    if not new_events:
+        return
+
+    user_ids = sorted({event.user_id for event in new_events})
+    with transaction.atomic():
+        _lock(user_ids)
+        ReceiptEvent.objects.bulk_create(new_events)
+        _notify(user_ids)
+
+
+def _lock(user_ids):
+    # Serializes a user's event writers, so their ids commit in order
+    if connection.vendor != "postgresql":
+        return
+    with connection.cursor() as cursor:
+        for user_id in user_ids:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s, %s)", [LOCK_NAMESPACE, user_id % 2**31])
+
+
+def _notify(user_ids):
+    if connection.vendor != "postgresql":
+        return
+    with connection.cursor() as cursor:
+        for user_id in user_ids:
+            cursor.execute("SELECT pg_notify(%s, %s)", [CHANNEL, str(user_id)])
+
+
+def record(receipts):
+    """Emit an "updated" event per receipt once the current transaction commits."""
+    _mark((receipt.id, receipt.user_id) for receipt in receipts)
+
+
+def record_ids(receipt_ids):
+    """``record`` for receipts changed with .update() or bulk_update()."""
+    _mark((receipt_id, None) for receipt_id in receipt_ids)
+
+
+def record_deleted(receipt):
+    """Emit a "deleted" event once the current transaction commits."""
+    _mark([(receipt.id, receipt.user_id)])
+
+
+def prune(older_than):
+    """Delete events created before ``older_than``, always keeping the newest one."""
+    newest = ReceiptEvent.objects.order_by("-id").values_list("id", flat=True).first()
+    if newest is None:
+        return 0
+    deleted, _ = ReceiptEvent.objects.filter(created_at__lt=older_than, id__lt=newest).delete()
+    return deleted
+
+
+# ---------------------------------------------------------------------------
+# Reading
+# ---------------------------------------------------------------------------
+
+def latest_id(user_id):
+    return ReceiptEvent.objects.filter(user_id=user_id).order_by("-id").values_list("id", flat=True).first() or 0
+
+
+def is_stale(after_id):
+    """True if events after ``after_id`` may already have been pruned."""
+    if not after_id:
+        return False
+    oldest = ReceiptEvent.objects.order_by("id").values_list("id", flat=True).first()
+    return oldest is None or after_id < oldest - 1
+
+
+def fetch(user_id, after_id, limit=FETCH_LIMIT):
+    """Events after ``after_id``, oldest first."""
+    return list(
+        ReceiptEvent.objects.filter(user_id=user_id, id__gt=after_id)
+        .order_by("id")
+        .values("id", "receipt_id", "kind", "data")[:limit]
+    )
+
+
+def serialize(event):
+    return {"id": event["id"], "receipt_id": event["receipt_id"], "kind": event["kind"], "receipt": event["data"]}
+
+
+def format_sse(event):
+    return f"id: {event['id']}\nevent: receipt\ndata: {json.dumps(serialize(event))}\n\n"
+
+
+def _fetch_and_release(user_id, after_id):
+    # Streams are long-lived and fetch rarely: don't pin a DB connection
+    try:
+        return fetch(user_id, after_id)
+    finally:
+        connection.close()
+
+
+# ---------------------------------------------------------------------------
+# LISTEN side
+# ---------------------------------------------------------------------------
+
+class Subscription:
+    def __init__(self, user_id, loop=None):
+        self.user_id = user_id
+        self._loop = loop
+        self._event = asyncio.Event() if loop else threading.Event()
+
+    def notify(self):
+        if self._loop is None:
+            self._event.set()
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._event.set)
+        except RuntimeError:
+            pass  # loop already closed; the stream is going away
+
+    def clear(self):
+        self._event.clear()
+
+    def wait(self, timeout):
+        return self._event.wait(timeout)
+
+    async def await_(self, timeout):
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+            return True
+        except TimeoutError:
+            return False
+
+
+class EventHub:
+    """Per-process LISTEN connection fanning notifications out to subscribed streams."""
+
+    def __init__(self):
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self, user_id, loop=None):
+        subscription = Subscription(user_id, loop)
+        with self._lock:
+            self._subscriptions.setdefault(user_id, set()).add(subscription)
+            if self._thread is None and connection.vendor == "postgresql":
+                self._thread = threading.Thread(target=self._listen, name="receipt-events", daemon=True)
+                self._thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def _dispatch(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                targets = [s for subs in self._subscriptions.values() for s in subs]
+            else:
+                targets = list(self._subscriptions.get(user_id, ()))
+        for subscription in targets:
+            subscription.notify()
+
+    def _listen(self):
+        backoff = 1
+        while True:
+            wrapper = connections.create_connection("default")
+            try:
+                wrapper.ensure_connection()
+                raw = wrapper.connection
+                raw.autocommit = True
+                with raw.cursor() as cursor:
+                    cursor.execute(f"LISTEN {CHANNEL}")
+                backoff = 1
+                # Anything committed while we were (re)connecting
+                self._dispatch()
+                while True:
+                    if select.select([raw], [], [], 60) == ([], [], []):
+                        continue
+                    raw.poll()
+                    user_ids = set()
+                    while raw.notifies:
+                        payload = raw.notifies.pop(0).payload
+                        try:
+                            user_ids.add(int(payload))
+                        except ValueError:
+                            pass
+                    for user_id in user_ids:
+                        self._dispatch(user_id)
+            except Exception:
+                logger.warning("receipt event listener failed; reconnecting in %ss", backoff, exc_info=True)
+            finally:
+                try:
+                    wrapper.close()
+                except Exception:
+                    pass
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+
+hub = EventHub()
+
+
+# ---------------------------------------------------------------------------
+# Streams
+# ---------------------------------------------------------------------------
+
+def _preamble(after_id, stale):
+    yield f"retry: {settings.RECEIPT_STREAM_RETRY_MS}\n\n"
+    if stale:
+        # The client must refetch its list once; then continue from here
+        yield "event: reset\ndata: {}\n\n"
+
+
+def stream(user_id, after_id, stale=False):
+    """Server-sent events for WSGI: a blocking generator."""
+    subscription = hub.subscribe(user_id)
+    deadline = time.monotonic() + settings.RECEIPT_STREAM_MAX_SECONDS
+    try:
+        yield from _preamble(after_id, stale)
+        while time.monotonic() < deadline:
+            subscription.clear()
+            events = _fetch_and_release(user_id, after_id)
+            for event in events:
+                yield format_sse(event)
+            if events:
+                after_id = events[-1]["id"]
+            if len(events) >= FETCH_LIMIT:
+                continue
+            if not subscription.wait(settings.RECEIPT_STREAM_HEARTBEAT_SECONDS):
+                yield ": keepalive\n\n"
+    finally:
+        hub.unsubscribe(subscription)
+
+
+async def astream(user_id, after_id, stale=False):
+    """Server-sent events for ASGI: waiting costs no thread."""
+    subscription = hub.subscribe(user_id, loop=asyncio.get_running_loop())
+    deadline = time.monotonic() + settings.RECEIPT_STREAM_MAX_SECONDS
+    try:
+        for chunk in _preamble(after_id, stale):
+            yield chunk
+        while time.monotonic() < deadline:
+            subscription.clear()
+            events = await sync_to_async(_fetch_and_release)(user_id, after_id)
+            for event in events:
+                yield format_sse(event)
+            if events:
+                after_id = events[-1]["id"]
+            if len(events) >= FETCH_LIMIT:
+                continue
+            if not await subscription.await_(settings.RECEIPT_STREAM_HEARTBEAT_SECONDS):
+                yield ": keepalive\n\n"
+    finally:
+        hub.unsubscribe(subscription)
@@ -0,0 +1,225 @@
+"""
+Local stand-ins for the external services, used by ``manage.py loadtest``.
+
+Each fake is a threaded HTTP server on 127.0.0.1 that answers the subset
+of the real API the backend calls, after a configurable latency and with
+a configurable share of 503 errors:
+
+- ``gemini``: embedContent, batchEmbedContents, generateContent
+- ``qdrant``: points/search, points upsert, points/batch, collections
+- ``n8n``: the receipt webhook
+
+Point settings at ``fake.url`` (GEMINI_BASE_URL, QDRANT_URL,
+N8N_WEBHOOK_URL) to route the app through them.
+"""
+
+import json
+import random
+from abc import ABC, abstractmethod
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+
+@dataclass
+class UpstreamConfig:
+    latency_ms: float = 0.0
+    # Uniform jitter as a fraction of latency_ms (0.5 -> 50%..150%)
+    jitter: float = 0.0
+    error_rate: float = 0.0
+    vector_size: int = 768
+    search_hits: int = 5
+    answer_chars: int = 400
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default of 5 drops connections under load-test concurrency
+    request_queue_size = 1024
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        try:
+            return json.loads(raw) if raw else {}
+        except ValueError:
+            return {}
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up (deadline, cancelled request)
+            pass
+
+    def _handle(self, method):
+        fake = self.server.fake
+        body = self._read_json()
+        fake.record()
+        fake.delay()
+        if fake.should_fail():
+            self._send(503, {"error": {"code": 503, "message": "fake upstream error"}})
+            return
+        status, response = fake.respond(method, urlsplit(self.path).path, body)
+        self._send(status, response)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+    def do_PATCH(self):
+        self._handle("PATCH")
+
+
+class FakeUpstream(ABC):
+    name = "upstream"
+
+    def __init__(self, config=None, seed=0):
+        self.config = config or UpstreamConfig()
+        self.requests = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._server = _Server(("127.0.0.1", 0), _Handler)
+        self._server.fake = self
+        self._thread = threading.Thread(target=self._server.serve_forever, name=f"fake-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def record(self):
+        with self._lock:
+            self.requests += 1
+
+    def delay(self):
+        latency = self.config.latency_ms
+        if latency <= 0:
+            return
+        if self.config.jitter:
+            with self._lock:
+                latency *= 1 + self._random.uniform(-self.config.jitter, self.config.jitter)
+        time.sleep(max(latency, 0) / 1000)
+
+    def should_fail(self):
+        if self.config.error_rate <= 0:
+            return False
+        with self._lock:
+            failed = self._random.random() < self.config.error_rate
+            if failed:
+                self.errors += 1
+        return failed
+
+    def vector(self):
+        with self._lock:
+            return [self._random.uniform(-1, 1) for _ in range(self.config.vector_size)]
+
+    def stats(self):
+        return {"requests": self.requests, "errors": self.errors, **self.config.__dict__}
+
+    @abstractmethod
+    def respond(self, method, path, body):
+        """Return ``(status, json_body)`` for a request that got past latency and errors."""
+
+
+class FakeGemini(FakeUpstream):
+    name = "gemini"
+
+    def respond(self, method, path, body):
+        if path.endswith(":batchEmbedContents"):
+            return 200, {"embeddings": [{"values": self.vector()} for _ in body.get("requests", [])]}
+        if path.endswith(":embedContent"):
+            return 200, {"embedding": {"values": self.vector()}}
+        if path.endswith(":generateContent"):
+            if body.get("generationConfig", {}).get("responseMimeType") == "application/json":
+                text = json.dumps({
+                    "merchant_name": "LOADTEST MART",
+                    "total_amount": 123.45,
+                    "currency": "INR",
+                    "purchase_date": "2025-01-15",
+                })
+            else:
+                text = ("Load test answer. " * (self.config.answer_chars // 18 + 1))[: self.config.answer_chars]
+            return 200, {"candidates": [{"content": {"parts": [{"text": text}]}}]}
+        return 404, {"error": {"code": 404, "message": f"unknown path {path}"}}
+
+
+class FakeQdrant(FakeUpstream):
+    name = "qdrant"
+
+    def respond(self, method, path, body):
+        if path.endswith("/points/search"):
+            user_id = None
+            for condition in body.get("filter", {}).get("must", []):
+                if condition.get("key") == "user_id":
+                    user_id = condition["match"]["value"]
+            with self._lock:
+                receipt_ids = [self._random.randint(1, 10**6) for _ in range(self.config.search_hits)]
+            hits = [
+                {
+                    "id": f"00000000-0000-0000-0000-{index:012d}",
+                    "score": 0.9 - index * 0.01,
+                    "payload": {
+                        "user_id": user_id,
+                        "receipt_id": receipt_id,
+                        "chunk_index": 0,
+                        "content": f"Receipt from LOADTEST MART. Total INR {100 + index}.00.",
+                    },
+                }
+                for index, receipt_id in enumerate(receipt_ids[: body.get("limit", self.config.search_hits)])
+            ]
+            return 200, {"result": hits, "status": "ok", "time": 0.0}
+        if path.endswith("/points") or path.endswith("/points/batch") or path.endswith("/index"):
+            return 200, {"result": {"operation_id": 0, "status": "acknowledged"}, "status": "ok"}
+        if path.rstrip("/") == "/aliases":
+            return 200, {"result": {"aliases": []}, "status": "ok"}
+        if path.startswith("/collections/"):
+            return 200, {"result": {"status": "green", "points_count": 0, "config": {"params": {
+                "vectors": {"size": self.config.vector_size, "distance": "Cosine"},
+            }}}, "status": "ok"}
+        return 404, {"status": {"error": f"unknown path {path}"}}
+
+
+class FakeN8n(FakeUpstream):
+    name = "n8n"
+
+    def respond(self, method, path, body):
+        return 200, {"message": "Workflow was started"}
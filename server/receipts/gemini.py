@@ -0,0 +1,131 @@
+"""
+Gemini and HTTP client helpers.
+
+The async functions serve the AI query path; the ``*_sync`` variants are
+used by ingestion workers, which run stages on plain threads.
+"""
+
+import asyncio
+import json
+import threading
+import weakref
+
+import httpx
+import requests
+from django.conf import settings
+
+# One pooled client per event loop: uvicorn runs a single long-lived loop,
+# while runserver/WSGI spins up a fresh loop per async request.
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client():
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=200, max_keepalive_connections=50),
+        )
+        _clients[loop] = client
+    return client
+
+
+async def embed_text(text, timeout=15):
+    url = f"{settings.GEMINI_BASE_URL}/{settings.GEMINI_EMBED_MODEL}:embedContent"
+    resp = await get_async_client().post(
+        url,
+        params={"key": settings.GEMINI_API_KEY},
+        json={"content": {"parts": [{"text": text}]}},
+        timeout=timeout,
+    )
+    resp.raise_for_status()
+    return resp.json()["embedding"]["values"]
+
+
+async def generate_text(prompt, temperature=0.2, timeout=30):
+    url = f"{settings.GEMINI_BASE_URL}/models/{settings.GEMINI_TEXT_MODEL}:generateContent"
+    resp = await get_async_client().post(
+        url,
+        params={"key": settings.GEMINI_API_KEY},
+        json={
+            "contents": [{"parts": [{"text": prompt}]}],
+            "generationConfig": {"temperature": temperature},
+        },
+        timeout=timeout,
+    )
+    resp.raise_for_status()
+    return (
+        resp.json().get("candidates", [{}])[0]
+        .get("content", {})
+        .get("parts", [{}])[0]
+        .get("text", "Unable to generate answer.")
+    )
+
+
+_local = threading.local()
+
+
+def get_session():
+    """Per-thread pooled requests session for worker threads."""
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        _local.session = session
+    return session
+
+
+def embed_text_sync(text, timeout=15):
+    url = f"{settings.GEMINI_BASE_URL}/{settings.GEMINI_EMBED_MODEL}:embedContent"
+    resp = get_session().post(
+        url,
+        params={"key": settings.GEMINI_API_KEY},
+        json={"content": {"parts": [{"text": text}]}},
+        timeout=timeout,
+    )
+    resp.raise_for_status()
+    return resp.json()["embedding"]["values"]
+
+
+def embed_texts_sync(texts, model=None, timeout=60):
+    """Embed many texts with one batchEmbedContents call (at most EMBED_BATCH_SIZE per call)."""
+    if not texts:
+        return []
+    model = model or settings.GEMINI_EMBED_MODEL
+    resp = get_session().post(
+        f"{settings.GEMINI_BASE_URL}/{model}:batchEmbedContents",
+        params={"key": settings.GEMINI_API_KEY},
+        json={
+            "requests": [
+                {"model": model, "content": {"parts": [{"text": text}]}}
+                for text in texts
+            ]
+        },
+        timeout=timeout,
+    )
+    resp.raise_for_status()
+    return [e["values"] for e in resp.json()["embeddings"]]
+
+
+def generate_json_sync(prompt, timeout=60):
+    """Ask the text model for a JSON object; returns the raw text and the parsed value (or None)."""
+    url = f"{settings.GEMINI_BASE_URL}/models/{settings.GEMINI_TEXT_MODEL}:generateContent"
+    resp = get_session().post(
+        url,
+        params={"key": settings.GEMINI_API_KEY},
+        json={
+            "contents": [{"parts": [{"text": prompt}]}],
+            "generationConfig": {"temperature": 0, "responseMimeType": "application/json"},
+        },
+        timeout=timeout,
+    )
+    resp.raise_for_status()
+    raw = (
+        resp.json().get("candidates", [{}])[0]
+        .get("content", {})
+        .get("parts", [{}])[0]
+        .get("text", "{}")
+    )
+    try:
+        return raw, json.loads(raw)
+    except ValueError:
+        return raw, None
@@ -0,0 +1,190 @@
+"""
+Postgres-backed job queue for the native ingestion pipeline.
+
+Jobs are claimed with SELECT ... FOR UPDATE SKIP LOCKED in a short
+transaction and then processed outside it, so long OCR/LLM calls never
+hold row locks. Throughput scales by running more
+``manage.py run_ingestion_worker`` processes against the same table.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import metrics
+from .dedup import sync_duplicates
+from .models import IngestionJob, Receipt
+
+
+class LeaseLost(Exception):
+    """The job's lease expired and another worker reclaimed it; drop this attempt."""
+
+
+# What a receipt's chunks are built from (receipts.chunking.build_chunks)
+INDEXED_FIELDS = frozenset({"merchant_name", "total_amount", "currency", "purchase_date", "ocr_text"})
+
+
+def enqueue(receipt_ids, kind="ingest"):
+    """Queue receipts for ingestion; receipts with an open job are skipped."""
+    jobs = [IngestionJob(receipt_id=rid, kind=kind) for rid in receipt_ids]
+    IngestionJob.objects.bulk_create(jobs, ignore_conflicts=True)
+    metrics.counter("ingestion.enqueued").inc(len(jobs))
+
+
+def touches_index(fields):
+    return not INDEXED_FIELDS.isdisjoint(fields)
+
+
+def enqueue_reindex(receipt_ids):
+    """
+    Re-embed READY receipts whose indexed fields or OCR text a callback
+    changed. Only chunks whose text changed are embedded again (see
+    receipts.pipeline.embed_and_index). n8n indexes on its own.
+    """
+    if settings.INGESTION_BACKEND != "native":
+        return
+    ids = list(
+        Receipt.objects.filter(id__in=list(receipt_ids), status="READY", duplicate_of__isnull=True)
+        .values_list("id", flat=True)
+    )
+    if not ids:
+        return
+    # A running job may have read the old text: have it run again (see
+    # mark_done). Flag first, so a job finishing in between is either
+    # flagged or already closed when the insert below runs.
+    flagged = IngestionJob.objects.filter(receipt_id__in=ids, status="RUNNING").update(rerun=True)
+    metrics.counter("ingestion.rerun_requested").inc(flagged)
+    enqueue(ids, kind="reindex")
+
+
+def claim_jobs(worker_id, limit):
+    now = timezone.now()
+    lease_expired = now - timedelta(seconds=settings.INGESTION_LEASE_SECONDS)
+
+    with transaction.atomic():
+        jobs = list(
+            IngestionJob.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status="QUEUED", run_after__lte=now)
+                | Q(status="RUNNING", locked_at__lt=lease_expired)
+            )
+            .order_by("run_after", "id")[:limit]
+        )
+        if not jobs:
+            return []
+
+        IngestionJob.objects.filter(id__in=[j.id for j in jobs]).update(
+            status="RUNNING",
+            locked_by=worker_id,
+            locked_at=now,
+            attempts=F("attempts") + 1,
+        )
+
+    for job in jobs:
+        job.status = "RUNNING"
+        job.locked_by = worker_id
+        job.locked_at = now
+        job.attempts += 1
+
+    metrics.counter("ingestion.claimed").inc(len(jobs))
+    return jobs
+
+
+def _owned(job):
+    # Only while this claim still holds the lease: a reclaim (even by the
+    # same worker) bumps attempts
+    return IngestionJob.objects.filter(id=job.id, status="RUNNING", locked_by=job.locked_by, attempts=job.attempts)
+
+
+def set_stage(job, stage):
+    """
+    Record the stage a job enters and renew its lease, so only a single
+    stage has to fit in INGESTION_LEASE_SECONDS. Raises LeaseLost if the
+    job was reclaimed, before this attempt spends more on it.
+    """
+    now = timezone.now()
+    job.stage = stage
+    if not _owned(job).update(stage=stage, locked_at=now):
+        raise LeaseLost(job.id)
+    job.locked_at = now
+
+
+def mark_done(job):
+    """
+    Close a job; call inside the transaction that writes its results.
+    Raises LeaseLost, rolling those writes back, if the job was reclaimed.
+    A job flagged ``rerun`` while it ran is queued again as a reindex.
+    """
+    updated = _owned(job).filter(rerun=False).update(
+        status="DONE",
+        locked_by="",
+        last_error="",
+        finished_at=timezone.now(),
+    )
+    if updated:
+        metrics.counter("ingestion.done").inc()
+        return
+
+    requeued = _owned(job).filter(rerun=True).update(
+        kind="reindex",
+        status="QUEUED",
+        stage="",
+        rerun=False,
+        attempts=0,
+        locked_by="",
+        locked_at=None,
+        last_error="",
+        run_after=timezone.now(),
+    )
+    if not requeued:
+        raise LeaseLost(job.id)
+    metrics.counter("ingestion.rerun").inc()
+
+
+def mark_failed(job, error, permanent=False):
+    """Schedule a retry with exponential backoff, or dead-letter the job."""
+    message = f"[{job.stage or 'claim'}] {error!r}"[:4000]
+
+    if permanent or job.attempts >= settings.INGESTION_MAX_ATTEMPTS:
+        with transaction.atomic():
+            updated = _owned(job).update(
+                status="DEAD",
+                locked_by="",
+                last_error=message,
+                finished_at=timezone.now(),
+            )
+            if not updated:
+                # Another worker owns the job now; its outcome decides
+                metrics.counter("ingestion.lease_lost").inc()
+                return
+            receipt = (
+                Receipt.objects.select_for_update()
+                .filter(id=job.receipt_id, status__in=["PENDING", "UPLOADED", "PROCESSING"])
+                .first()
+            )
+            if receipt is not None:
+                receipt.status = "FAILED"
+                receipt.save(update_fields=["status", "updated_at"])
+                sync_duplicates([receipt.id])
+        metrics.counter("ingestion.dead").inc()
+        return
+
+    delay = min(
+        settings.INGESTION_RETRY_BASE_SECONDS * (2 ** (job.attempts - 1)),
+        settings.INGESTION_RETRY_MAX_SECONDS,
+    )
+    updated = _owned(job).update(
+        status="QUEUED",
+        rerun=False,  # the retry reads the receipt afresh
+        locked_by="",
+        locked_at=None,
+        last_error=message,
+        run_after=timezone.now() + timedelta(seconds=delay),
+    )
+    if not updated:
+        metrics.counter("ingestion.lease_lost").inc()
+        return
+    metrics.counter("ingestion.retried").inc()
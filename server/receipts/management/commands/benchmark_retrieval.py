@@ -0,0 +1,90 @@
+import random
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from receipts.models import ReceiptEmbedding
+from receipts.retrieval import LocalRetrievalBackend, QdrantRetrievalBackend, bytes_to_vector
+
+
+def _percentile(samples, pct):
+    return float(np.percentile(samples, pct)) * 1000 if samples else 0.0
+
+
+def _keys(hits):
+    return {
+        (h["payload"].get("receipt_id"), h["payload"].get("chunk_index"))
+        for h in hits
+    }
+
+
+class Command(BaseCommand):
+    help = "Compare search latency and recall of the local and Qdrant retrieval backends."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=20, help="Number of users to sample")
+        parser.add_argument("--queries", type=int, default=20, help="Queries per user")
+        parser.add_argument("--k", type=int, default=5)
+        parser.add_argument("--noise", type=float, default=0.05, help="Gaussian noise added to sampled chunk vectors")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options["seed"])
+        random.seed(options["seed"])
+        k = options["k"]
+
+        user_ids = list(
+            ReceiptEmbedding.objects.values("user_id")
+            .annotate(n=Count("id"))
+            .filter(n__gte=k)
+            .values_list("user_id", flat=True)
+        )
+        user_ids = random.sample(user_ids, min(options["users"], len(user_ids)))
+        if not user_ids:
+            self.stdout.write(self.style.WARNING("No users with enough embeddings; run sync_local_index first."))
+            return
+
+        local = LocalRetrievalBackend(max_users=len(user_ids))
+        qdrant = QdrantRetrievalBackend()
+
+        cold = []
+        timings = {"local": [], "qdrant": []}
+        recall_hits = 0
+        recall_total = 0
+
+        for user_id in user_ids:
+            vectors = [
+                bytes_to_vector(v)
+                for v in ReceiptEmbedding.objects.filter(user_id=user_id).values_list("vector", flat=True)
+            ]
+
+            t = time.perf_counter()
+            local.search(user_id, vectors[0], k)
+            cold.append(time.perf_counter() - t)
+
+            for _ in range(options["queries"]):
+                base = vectors[rng.integers(len(vectors))]
+                query = base + rng.normal(0, options["noise"], base.shape).astype(np.float32)
+
+                t = time.perf_counter()
+                exact = local.search(user_id, query, k)
+                timings["local"].append(time.perf_counter() - t)
+
+                t = time.perf_counter()
+                remote = qdrant.search(user_id, query.tolist(), k)
+                timings["qdrant"].append(time.perf_counter() - t)
+
+                recall_hits += len(_keys(exact) & _keys(remote))
+                recall_total += len(exact)
+
+        self.stdout.write(f"users={len(user_ids)} queries/user={options['queries']} k={k}")
+        self.stdout.write(f"local cold load: p50={_percentile(cold, 50):.2f}ms p99={_percentile(cold, 99):.2f}ms")
+        for name, samples in timings.items():
+            self.stdout.write(
+                f"{name:>6}: p50={_percentile(samples, 50):.2f}ms "
+                f"p95={_percentile(samples, 95):.2f}ms p99={_percentile(samples, 99):.2f}ms"
+            )
+        recall = recall_hits / recall_total if recall_total else 0.0
+        self.stdout.write(f"qdrant recall@{k} vs local exact: {recall:.4f}")
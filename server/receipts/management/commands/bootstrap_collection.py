@@ -0,0 +1,237 @@
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from receipts import qdrant
+
+
+def _percentile(samples, pct):
+    return float(np.percentile(samples, pct)) * 1000 if samples else 0.0
+
+
+class Command(BaseCommand):
+    help = (
+        "Create or migrate the receipts Qdrant collection: payload indexes on "
+        "user_id, receipt_id and purchase_date, HNSW parameters and optional int8 "
+        "scalar quantization. A new collection is created as <name>_v1 behind the "
+        "alias <name>, so reindex_receipts can switch it later. --benchmark reports "
+        "recall vs p50/p99 latency per search configuration."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--collection", default=settings.QDRANT_COLLECTION, help="Alias (or existing collection) to bootstrap")
+        parser.add_argument("--vector-size", type=int, help="Required when the collection doesn't exist yet")
+        parser.add_argument("--distance", default="Cosine")
+        parser.add_argument("--hnsw-m", type=int, default=16, help="Edges per node in the global graph")
+        parser.add_argument("--hnsw-ef-construct", type=int, default=128)
+        parser.add_argument(
+            "--hnsw-payload-m", type=int, default=16,
+            help="Edges per node in the per-value graphs of indexed payload fields (0 disables)",
+        )
+        parser.add_argument(
+            "--quantization", choices=["int8", "none"],
+            help="int8 scalar quantization or none; an existing collection keeps its setting when omitted",
+        )
+        parser.add_argument("--quantile", type=float, default=0.99, help="int8 quantization quantile")
+        parser.add_argument(
+            "--on-disk", action="store_true",
+            help="Keep original vectors on disk and only the quantized ones in RAM",
+        )
+        parser.add_argument("--skip-setup", action="store_true", help="Only run the benchmark")
+        parser.add_argument("--benchmark", action="store_true")
+        parser.add_argument("--queries", type=int, default=200, help="Benchmark queries, sampled from stored points")
+        parser.add_argument("--k", type=int, default=5)
+        parser.add_argument("--ef", default="32,64,128,256", help="Comma-separated hnsw_ef values to benchmark")
+        parser.add_argument("--oversampling", type=float, default=2.0, help="Quantized search oversampling when rescoring")
+        parser.add_argument("--noise", type=float, default=0.05, help="Gaussian noise added to sampled vectors")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        name = options["collection"]
+        # Collection settings and indexes belong to the collection, not the alias
+        collection = qdrant.list_aliases().get(name)
+        if collection is None:
+            if qdrant.get_collection(name) is not None:
+                # Created by an older version; reindex_receipts needs an alias here
+                collection = name
+                self.stdout.write(self.style.WARNING(
+                    f"'{name}' is a collection, not an alias: reindex_receipts can't switch it."
+                ))
+            elif options["skip_setup"]:
+                raise CommandError(f"No collection or alias named '{name}'")
+            else:
+                # Qdrant can't rename collections: give the data a versioned name from the start
+                collection = f"{name}_v1"
+
+        if not options["skip_setup"]:
+            self._ensure_collection(collection, options)
+            self._ensure_payload_indexes(collection)
+            self._wait_until_green(collection)
+            if collection != name and qdrant.list_aliases().get(name) != collection:
+                qdrant.switch_alias(name, collection)
+                self.stdout.write(f"Pointed alias {name} at {collection}")
+
+        if options["benchmark"]:
+            self._benchmark(collection, options)
+
+    def _hnsw_config(self, options):
+        return {
+            "m": options["hnsw_m"],
+            "ef_construct": options["hnsw_ef_construct"],
+            "payload_m": options["hnsw_payload_m"],
+        }
+
+    def _quantization_config(self, options):
+        if options["quantization"] != "int8":
+            return None
+        return {
+            "scalar": {
+                "type": "int8",
+                "quantile": options["quantile"],
+                "always_ram": True,
+            }
+        }
+
+    def _ensure_collection(self, collection, options):
+        info = qdrant.get_collection(collection)
+        hnsw = self._hnsw_config(options)
+        quantization = self._quantization_config(options)
+
+        if info is None:
+            if not options["vector_size"]:
+                raise CommandError(f"Collection '{collection}' doesn't exist; pass --vector-size")
+            body = {
+                "vectors": {
+                    "size": options["vector_size"],
+                    "distance": options["distance"],
+                    "on_disk": options["on_disk"],
+                },
+                "hnsw_config": hnsw,
+            }
+            if quantization:
+                body["quantization_config"] = quantization
+            qdrant.create_collection(collection, body)
+            self.stdout.write(f"Created collection {collection} (hnsw {hnsw}, quantization {options['quantization'] or 'none'})")
+            return
+
+        vectors = info["config"]["params"]["vectors"]
+        if options["vector_size"] and vectors.get("size") != options["vector_size"]:
+            raise CommandError(
+                f"'{collection}' stores {vectors.get('size')}-dimensional vectors; "
+                f"use reindex_receipts to move to {options['vector_size']}."
+            )
+
+        # Changing HNSW or quantization makes Qdrant rebuild the segments in
+        # the background; searches keep working meanwhile
+        body = {"hnsw_config": hnsw}
+        if options["quantization"]:
+            body["quantization_config"] = quantization or "Disabled"
+        if options["on_disk"]:
+            body["vectors"] = {"": {"on_disk": True}}
+        qdrant.update_collection(collection, body)
+        self.stdout.write(
+            f"Updated collection {collection} (hnsw {hnsw}, quantization {options['quantization'] or 'unchanged'})"
+        )
+
+    def _ensure_payload_indexes(self, collection):
+        existing = qdrant.get_collection(collection).get("payload_schema", {})
+        for field, schema in qdrant.PAYLOAD_INDEXES.items():
+            if existing.get(field, {}).get("data_type") == schema:
+                continue
+            qdrant.create_payload_index(collection, field, schema)
+            self.stdout.write(f"Indexed payload field {field} ({schema})")
+
+    def _wait_until_green(self, collection, timeout=1800):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            info = qdrant.get_collection(collection)
+            if info.get("status") == "green":
+                self.stdout.write(
+                    f"{collection}: {info.get('points_count')} points, "
+                    f"{info.get('indexed_vectors_count')} indexed, status green"
+                )
+                return
+            time.sleep(2)
+        raise CommandError(f"{collection} did not reach status green within {timeout}s")
+
+    def _sample_points(self, collection, count, rng):
+        points, offset = [], None
+        # Read a few times more points than needed so queries span many users
+        while len(points) < count * 5:
+            body = {"limit": 256, "with_payload": ["user_id"], "with_vector": True}
+            if offset is not None:
+                body["offset"] = offset
+            page, offset = qdrant.scroll(body, collection=collection)
+            points.extend(p for p in page if p.get("payload", {}).get("user_id") is not None)
+            if offset is None:
+                break
+        if not points:
+            return []
+        picks = rng.choice(len(points), size=min(count, len(points)), replace=False)
+        return [points[i] for i in picks]
+
+    def _benchmark(self, collection, options):
+        rng = np.random.default_rng(options["seed"])
+        k = options["k"]
+        quantized = bool(qdrant.get_collection(collection)["config"].get("quantization_config"))
+
+        sample = self._sample_points(collection, options["queries"], rng)
+        if not sample:
+            self.stdout.write(self.style.WARNING(f"{collection} has no points to benchmark with."))
+            return
+
+        queries = []
+        for point in sample:
+            vector = np.asarray(point["vector"], dtype=np.float32)
+            vector = vector + rng.normal(0, options["noise"], vector.shape).astype(np.float32)
+            queries.append((point["payload"]["user_id"], vector.tolist()))
+
+        def run(params):
+            results, timings = [], []
+            for user_id, vector in queries:
+                body = {
+                    "vector": vector,
+                    "limit": k,
+                    "filter": {"must": [{"key": "user_id", "match": {"value": user_id}}]},
+                    "params": params,
+                }
+                t = time.perf_counter()
+                hits = qdrant.search(body, collection=collection)
+                timings.append(time.perf_counter() - t)
+                results.append({hit["id"] for hit in hits})
+            return results, timings
+
+        exact, exact_timings = run({"exact": True})
+
+        configs = []
+        for ef in (int(value) for value in options["ef"].split(",") if value.strip()):
+            if quantized:
+                configs.append((f"ef={ef} original", {"hnsw_ef": ef, "quantization": {"ignore": True}}))
+                configs.append((f"ef={ef} int8", {"hnsw_ef": ef, "quantization": {"rescore": False}}))
+                configs.append((
+                    f"ef={ef} int8+rescore x{options['oversampling']:g}",
+                    {"hnsw_ef": ef, "quantization": {"rescore": True, "oversampling": options["oversampling"]}},
+                ))
+            else:
+                configs.append((f"ef={ef}", {"hnsw_ef": ef}))
+
+        self.stdout.write(f"collection={collection} queries={len(queries)} k={k} quantized={quantized}")
+        self.stdout.write(
+            f"{'exact':>32}: recall=1.0000 "
+            f"p50={_percentile(exact_timings, 50):.2f}ms p99={_percentile(exact_timings, 99):.2f}ms"
+        )
+        for label, params in configs:
+            results, timings = run(params)
+            hits = sum(len(found & truth) for found, truth in zip(results, exact))
+            total = sum(len(truth) for truth in exact)
+            recall = hits / total if total else 0.0
+            self.stdout.write(
+                f"{label:>32}: recall={recall:.4f} "
+                f"p50={_percentile(timings, 50):.2f}ms p99={_percentile(timings, 99):.2f}ms"
+            )
+        self.stdout.write(
+            "Set QDRANT_SEARCH_HNSW_EF (and QDRANT_SEARCH_OVERSAMPLING for int8) to the "
+            "cheapest configuration with acceptable recall."
+        )
@@ -0,0 +1,383 @@
+import json
+import random
+import tempfile
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone as dt_timezone
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test import Client, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from receipts import storage
+from receipts.fake_upstreams import FakeGemini, FakeN8n, FakeQdrant, UpstreamConfig
+from receipts.models import Receipt
+
+ENDPOINTS = ("upload_init", "upload_complete", "list", "view_url", "ai_query")
+DEFAULT_MIX = "list=40,view_url=25,ai_query=15,upload_init=10,upload_complete=10"
+USER_DOMAIN = "loadtest.invalid"
+
+# Queries of the request in flight. Context variables follow the request
+# into sync_to_async/async_to_sync threads, which use their own connections.
+_request_queries = ContextVar("loadtest_request_queries", default=None)
+
+
+def _count_queries(execute, sql, params, many, context):
+    queries = _request_queries.get()
+    if queries is not None:
+        queries.append(sql)
+    return execute(sql, params, many, context)
+
+
+def _watch_connection(sender, connection, **kwargs):
+    if _count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_queries)
+
+
+def _pairs(value, cast=float):
+    """Parse "name=value,name=value" options."""
+    result = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, sep, raw = item.partition("=")
+        if not sep:
+            raise CommandError(f"expected name=value, got '{item}'")
+        result[name.strip()] = cast(raw)
+    return result
+
+
+def _percentile(samples, pct):
+    return round(float(np.percentile(samples, pct)), 3) if samples else None
+
+
+class _Stats:
+    def __init__(self):
+        self.latencies_ms = []
+        self.queries = []
+        self.statuses = {}
+        self._lock = threading.Lock()
+
+    def add(self, latency_ms, queries, status):
+        with self._lock:
+            self.latencies_ms.append(latency_ms)
+            self.queries.append(queries)
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    def summary(self, elapsed):
+        count = len(self.latencies_ms)
+        errors = sum(n for status, n in self.statuses.items() if status >= 400)
+        return {
+            "requests": count,
+            "errors": errors,
+            "error_rate": round(errors / count, 4) if count else 0.0,
+            "status_codes": {str(status): n for status, n in sorted(self.statuses.items())},
+            "throughput_rps": round(count / elapsed, 2) if elapsed else 0.0,
+            "latency_ms": {
+                "mean": round(float(np.mean(self.latencies_ms)), 3) if count else None,
+                "p50": _percentile(self.latencies_ms, 50),
+                "p95": _percentile(self.latencies_ms, 95),
+                "p99": _percentile(self.latencies_ms, 99),
+                "max": round(max(self.latencies_ms), 3) if count else None,
+            },
+            "db_queries": {
+                "mean": round(float(np.mean(self.queries)), 3) if count else None,
+                "p95": _percentile(self.queries, 95),
+                "max": max(self.queries) if count else None,
+            },
+        }
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive a weighted mix of upload-init, upload-complete, list, view-url and "
+        "ai/query requests through the Django stack in-process, with Gemini, Qdrant "
+        "and n8n replaced by local fakes (storage uses the local backend). Reports "
+        "throughput, p50/p95/p99 latency and DB queries per endpoint as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run")
+        parser.add_argument("--concurrency", type=int, default=8, help="Client threads")
+        parser.add_argument("--warmup", type=int, default=2, help="Unrecorded requests per endpoint and thread")
+        parser.add_argument("--mix", default=DEFAULT_MIX, help="Endpoint weights, e.g. list=40,ai_query=15")
+        parser.add_argument("--users", type=int, default=20)
+        parser.add_argument("--receipts-per-user", type=int, default=50)
+        parser.add_argument("--files-per-upload", type=int, default=1)
+        parser.add_argument("--questions", type=int, default=50, help="Distinct questions per user (repeats hit the answer cache)")
+        parser.add_argument("--latency", default="gemini=80,qdrant=10,n8n=20", help="Mean upstream latency in ms")
+        parser.add_argument("--jitter", type=float, default=0.2, help="Uniform latency jitter as a fraction")
+        parser.add_argument("--error-rate", default="", help="Upstream 503 rate, e.g. gemini=0.01")
+        parser.add_argument("--vector-size", type=int, default=768)
+        parser.add_argument("--search-hits", type=int, default=5)
+        parser.add_argument("--answer-chars", type=int, default=400)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Write the JSON report to this file (default: stdout)")
+        parser.add_argument("--baseline", help="Earlier JSON report; exit non-zero on regressions against it")
+        parser.add_argument(
+            "--max-regression", type=float, default=0.2,
+            help="Allowed relative p95/p99 latency increase over the baseline",
+        )
+        parser.add_argument("--keep-data", action="store_true", help="Don't delete the load-test users and receipts")
+        parser.add_argument(
+            "--allow-db-writes", action="store_true",
+            help="Required: users and receipts are created in (and deleted from) the configured database",
+        )
+
+    def handle(self, *args, **options):
+        if not options["allow_db_writes"]:
+            raise CommandError(
+                f"loadtest creates and deletes users and receipts in the '{connection.settings_dict['NAME']}' "
+                f"database. Point DATABASES at a scratch database and pass --allow-db-writes."
+            )
+        mix = _pairs(options["mix"])
+        unknown = set(mix) - set(ENDPOINTS)
+        if unknown:
+            raise CommandError(f"unknown endpoints in --mix: {', '.join(sorted(unknown))}")
+        latency = _pairs(options["latency"])
+        error_rate = _pairs(options["error_rate"])
+
+        fakes = {
+            fake.name: fake
+            for fake in (
+                FakeGemini(self._upstream_config("gemini", latency, error_rate, options), seed=options["seed"]),
+                FakeQdrant(self._upstream_config("qdrant", latency, error_rate, options), seed=options["seed"] + 1),
+                FakeN8n(self._upstream_config("n8n", latency, error_rate, options), seed=options["seed"] + 2),
+            )
+        }
+        for fake in fakes.values():
+            fake.start()
+
+        run_id = uuid.uuid4().hex[:8]
+        try:
+            with tempfile.TemporaryDirectory(prefix="loadtest-") as storage_root, override_settings(
+                GEMINI_BASE_URL=fakes["gemini"].url,
+                GEMINI_API_KEY="loadtest",
+                GEMINI_EMBED_MODEL="models/loadtest-embed",
+                GEMINI_TEXT_MODEL="loadtest-text",
+                QDRANT_URL=fakes["qdrant"].url,
+                N8N_WEBHOOK_URL=f"{fakes['n8n'].url}/webhook/receipt",
+                INGESTION_BACKEND="n8n",
+                RETRIEVAL_BACKEND="qdrant",
+                STORAGE_BACKEND="local",
+                LOCAL_STORAGE_ROOT=storage_root,
+            ):
+                storage._storage = None
+                users = self._seed(run_id, options)
+                try:
+                    report = self._run(users, mix, options)
+                finally:
+                    if not options["keep_data"]:
+                        get_user_model().objects.filter(email__startswith=f"loadtest-{run_id}-").delete()
+                storage._storage = None
+        finally:
+            for fake in fakes.values():
+                fake.stop()
+
+        report["run_id"] = run_id
+        report["upstreams"] = {name: fake.stats() for name, fake in fakes.items()}
+        report["config"] = {
+            key: options[key]
+            for key in (
+                "duration", "concurrency", "users", "receipts_per_user", "files_per_upload",
+                "questions", "mix", "latency", "jitter", "error_rate", "seed",
+            )
+        }
+
+        text = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(text + "\n")
+            self._print_table(report)
+        else:
+            self.stdout.write(text)
+
+        if options["baseline"]:
+            self._compare(report, options["baseline"], options["max_regression"])
+
+    def _upstream_config(self, name, latency, error_rate, options):
+        return UpstreamConfig(
+            latency_ms=latency.get(name, 0.0),
+            jitter=options["jitter"],
+            error_rate=error_rate.get(name, 0.0),
+            vector_size=options["vector_size"],
+            search_hits=options["search_hits"],
+            answer_chars=options["answer_chars"],
+        )
+
+    def _seed(self, run_id, options):
+        User = get_user_model()
+        users = User.objects.bulk_create([
+            User(email=f"loadtest-{run_id}-{n}@{USER_DOMAIN}")
+            for n in range(options["users"])
+        ])
+
+        now = datetime.now(dt_timezone.utc)
+        receipts = []
+        for user in users:
+            for n in range(options["receipts_per_user"]):
+                key = f"{user.id}/loadtest-{n}/receipt.jpg"
+                receipts.append(Receipt(
+                    user=user,
+                    status="READY",
+                    file_key=key,
+                    preview_key=f"{key}.preview.jpg",
+                    thumbnail_key=f"{key}.thumb.jpg",
+                    merchant_name=f"LOADTEST MART {n % 10}",
+                    total_amount=100 + n,
+                    purchase_date=now,
+                ))
+        Receipt.objects.bulk_create(receipts, batch_size=1000)
+
+        receipt_ids = {}
+        for user_id, receipt_id in Receipt.objects.filter(user__in=users).values_list("user_id", "id"):
+            receipt_ids.setdefault(user_id, []).append(receipt_id)
+
+        return [
+            {
+                "id": user.id,
+                "token": str(AccessToken.for_user(user)),
+                "receipt_ids": receipt_ids.get(user.id, []),
+            }
+            for user in users
+        ]
+
+    def _run(self, users, mix, options):
+        stats = {name: _Stats() for name in mix}
+        names = list(mix)
+        weights = [mix[name] for name in names]
+        started = time.perf_counter()
+        deadline = started + options["duration"]
+        failures = []
+
+        def worker(index):
+            rng = random.Random(options["seed"] * 1000 + index)
+            user = users[index % len(users)]
+            client = Client(HTTP_AUTHORIZATION=f"Bearer {user['token']}")
+            pending = []
+            warm = {name: options["warmup"] for name in names}
+
+            try:
+                while time.perf_counter() < deadline:
+                    name = rng.choices(names, weights)[0]
+                    queries = []
+                    token = _request_queries.set(queries)
+                    t = time.perf_counter()
+                    try:
+                        status = self._request(client, name, user, pending, rng, options)
+                    finally:
+                        _request_queries.reset(token)
+                    elapsed_ms = (time.perf_counter() - t) * 1000
+                    if warm[name] > 0:
+                        warm[name] -= 1
+                        continue
+                    stats[name].add(elapsed_ms, len(queries), status)
+            except Exception as e:
+                failures.append(e)
+            finally:
+                connection.close()
+
+        # Count queries on every connection a request touches, including
+        # those opened by the threads async views run their sync code in
+        connection_created.connect(_watch_connection)
+        for conn in connections.all(initialized_only=True):
+            _watch_connection(None, conn)
+        threads = [
+            threading.Thread(target=worker, args=(i,), name=f"loadtest-{i}")
+            for i in range(options["concurrency"])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        connection_created.disconnect(_watch_connection)
+        elapsed = time.perf_counter() - started
+
+        if failures:
+            raise CommandError(f"load-test client failed: {failures[0]!r}")
+
+        endpoints = {name: s.summary(elapsed) for name, s in stats.items()}
+        total = sum(e["requests"] for e in endpoints.values())
+        return {
+            "started_at": datetime.now(dt_timezone.utc).isoformat(),
+            "elapsed_s": round(elapsed, 3),
+            "requests": total,
+            "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+            "endpoints": endpoints,
+        }
+
+    def _request(self, client, name, user, pending, rng, options):
+        if name == "upload_complete" and not pending:
+            # Nothing uploaded yet on this thread: the init is part of the flow
+            name = "upload_init"
+
+        if name == "upload_init":
+            files = [
+                {
+                    "filename": f"receipt-{uuid.uuid4().hex[:8]}.jpg",
+                    "content_type": "image/jpeg",
+                    "sha256": uuid.uuid4().hex * 2,
+                }
+                for _ in range(options["files_per_upload"])
+            ]
+            resp = client.post("/receipts/upload/", {"files": files}, content_type="application/json")
+            if resp.status_code == 200:
+                pending.extend(u["receipt_id"] for u in resp.json()["uploads"])
+            return resp.status_code
+
+        if name == "upload_complete":
+            ids, pending[:] = list(pending), []
+            resp = client.post("/receipts/complete/", {"receipt_ids": ids}, content_type="application/json")
+            return resp.status_code
+
+        if name == "list":
+            return client.get("/receipts/").status_code
+
+        if name == "view_url":
+            receipt_id = rng.choice(user["receipt_ids"]) if user["receipt_ids"] else 0
+            return client.get(f"/receipts/{receipt_id}/view-url/").status_code
+
+        question = f"How much did I spend at LOADTEST MART {rng.randrange(options['questions'])}?"
+        resp = client.post("/receipts/ai/query/", {"question": question}, content_type="application/json")
+        return resp.status_code
+
+    def _print_table(self, report):
+        self.stdout.write(
+            f"{report['requests']} requests in {report['elapsed_s']}s ({report['throughput_rps']} req/s)"
+        )
+        for name, e in report["endpoints"].items():
+            latency = e["latency_ms"]
+            self.stdout.write(
+                f"{name:>16}: {e['requests']:>6} req {e['throughput_rps']:>8} req/s "
+                f"p50={latency['p50']}ms p95={latency['p95']}ms p99={latency['p99']}ms "
+                f"errors={e['error_rate']:.2%} queries={e['db_queries']['mean']}"
+            )
+
+    def _compare(self, report, path, max_regression):
+        with open(path) as f:
+            baseline = json.load(f)
+
+        regressions = []
+        for name, current in report["endpoints"].items():
+            previous = baseline.get("endpoints", {}).get(name)
+            if not previous or not current["requests"]:
+                continue
+            for pct in ("p95", "p99"):
+                before, after = previous["latency_ms"][pct], current["latency_ms"][pct]
+                if before and after > before * (1 + max_regression):
+                    regressions.append(f"{name} {pct} latency {before}ms -> {after}ms")
+            # Query counts are deterministic per request shape: any increase is a regression
+            before, after = previous["db_queries"]["mean"], current["db_queries"]["mean"]
+            if before is not None and after > before + 0.5:
+                regressions.append(f"{name} DB queries/request {before} -> {after}")
+            before, after = previous["error_rate"], current["error_rate"]
+            if after > before + 0.01:
+                regressions.append(f"{name} error rate {before:.2%} -> {after:.2%}")
+
+        if regressions:
+            raise CommandError("Regressions against baseline:\n  " + "\n  ".join(regressions))
+        self.stdout.write(self.style.SUCCESS(f"No regressions against {path}"))
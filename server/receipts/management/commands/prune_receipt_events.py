@@ -0,0 +1,21 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from receipts import events
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete receipt events older than the retention window. Clients resuming "
+        "from a pruned event id get a reset and refetch their list."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hours", type=int, default=settings.RECEIPT_EVENTS_RETENTION_HOURS)
+
+    def handle(self, *args, **options):
+        deleted = events.prune(timezone.now() - timedelta(hours=options["hours"]))
+        self.stdout.write(f"Deleted {deleted} receipt events older than {options['hours']}h")
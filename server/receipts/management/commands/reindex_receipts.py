@@ -0,0 +1,265 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from receipts import qdrant
+from receipts.embedding import EmbeddingBatcher
+from receipts.models import Receipt, ReceiptEvent, ReindexCheckpoint
+from receipts.chunking import build_chunks, point_id
+from receipts.pipeline import chunk_payload
+
+# Catch-up passes re-read this far before the previous pass started, for
+# writes whose updated_at predates the pass but that committed after it
+CATCH_UP_OVERLAP = timedelta(seconds=60)
+CATCH_UP_PASSES = 3
+
+
+def _last_with_points(page, default=None):
+    return next((entry for entry in reversed(page) if entry[1]), default)
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-chunk and re-embed READY receipts into a new Qdrant collection, "
+        "then atomically point the alias (QDRANT_COLLECTION) at it. Receipts "
+        "changed while the backfill ran are copied again just before the switch. "
+        "Progress is checkpointed so an interrupted run resumes where it stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("target", help="Name of the new collection, e.g. receipts_v2")
+        parser.add_argument("--alias", default=settings.QDRANT_COLLECTION, help="Alias to switch when done")
+        parser.add_argument("--embed-model", default=settings.GEMINI_EMBED_MODEL)
+        parser.add_argument("--vector-size", type=int, help="Defaults to the size of the collection behind --alias")
+        parser.add_argument("--workers", type=int, default=8, help="Concurrent embed + upsert flushes")
+        parser.add_argument("--batch-size", type=int, default=settings.EMBED_BATCH_SIZE, help="Texts per embedding call")
+        parser.add_argument("--page-size", type=int, default=500, help="Receipts per checkpoint")
+        parser.add_argument("--no-switch", action="store_true", help="Populate the collection but leave the alias alone")
+        parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint for this target")
+
+    def handle(self, *args, **options):
+        target = options["target"]
+        alias = options["alias"]
+
+        aliases = qdrant.list_aliases()
+        if alias not in aliases and qdrant.get_collection(alias) is not None:
+            raise CommandError(
+                f"'{alias}' is a collection, not an alias. Rename it or create an alias "
+                f"for it and point QDRANT_COLLECTION at the alias before reindexing."
+            )
+
+        checkpoint, created = ReindexCheckpoint.objects.get_or_create(
+            target_collection=target,
+            defaults={"alias": alias, "embed_model": options["embed_model"]},
+        )
+        if options["restart"] and not created:
+            checkpoint.last_receipt_id = 0
+            checkpoint.processed = 0
+            checkpoint.finished_at = None
+            # The catch-up before the switch starts from here
+            checkpoint.started_at = timezone.now()
+        checkpoint.alias = alias
+        checkpoint.embed_model = options["embed_model"]
+        checkpoint.save()
+
+        if checkpoint.finished_at is None:
+            self._ensure_collection(target, aliases.get(alias), options["vector_size"])
+            self._backfill(checkpoint, options)
+        else:
+            self.stdout.write(f"{target} already fully indexed at {checkpoint.finished_at:%Y-%m-%d %H:%M}")
+
+        if options["no_switch"]:
+            return
+
+        self._catch_up(checkpoint, options)
+        self._wait_until_indexed(target)
+        qdrant.switch_alias(alias, target)
+        self.stdout.write(self.style.SUCCESS(
+            f"Alias '{alias}' now points at '{target}'. "
+            f"Set GEMINI_EMBED_MODEL={checkpoint.embed_model} for query-time embeddings"
+            f"{' and run sync_local_index' if settings.RETRIEVAL_BACKEND == 'local' else ''}."
+        ))
+
+    def _ensure_collection(self, target, current, vector_size):
+        if qdrant.get_collection(target) is not None:
+            return
+
+        source = qdrant.get_collection(current) if current else None
+        if source is not None:
+            body = {"vectors": source["config"]["params"]["vectors"]}
+            if vector_size:
+                body["vectors"]["size"] = vector_size
+            # Keep the tuning done by bootstrap_collection
+            body["hnsw_config"] = source["config"]["hnsw_config"]
+            if source["config"].get("quantization_config"):
+                body["quantization_config"] = source["config"]["quantization_config"]
+        elif vector_size:
+            body = {"vectors": {"size": vector_size, "distance": "Cosine"}}
+        else:
+            raise CommandError("No existing collection to copy settings from; pass --vector-size")
+
+        qdrant.create_collection(target, body)
+        for field, schema in qdrant.PAYLOAD_INDEXES.items():
+            qdrant.create_payload_index(target, field, schema)
+        self.stdout.write(f"Created collection {target} ({body['vectors']})")
+
+    def _ready_receipts(self):
+        return (
+            Receipt.objects.filter(status="READY")
+            .order_by("id")
+            .select_related("content")
+            .only(
+                "id", "user_id", "merchant_name", "total_amount", "currency", "purchase_date",
+                "content__ocr_text_z",
+            )
+        )
+
+    def _batcher(self, checkpoint, options):
+        return EmbeddingBatcher(
+            batch_size=options["batch_size"],
+            max_concurrent_flushes=options["workers"],
+            collection=checkpoint.target_collection,
+            embed_model=checkpoint.embed_model,
+        )
+
+    def _submit(self, batcher, receipt):
+        fields = {
+            "merchant_name": receipt.merchant_name,
+            "total_amount": receipt.total_amount,
+            "currency": receipt.currency,
+            "purchase_date": receipt.purchase_date,
+        }
+        content = getattr(receipt, "content", None)
+        chunks = build_chunks(fields, content.ocr_text if content else None)
+        ids = [point_id(receipt.id, chunk["chunk_hash"]) for chunk in chunks]
+        payloads = [chunk_payload(receipt, fields, index, chunk) for index, chunk in enumerate(chunks)]
+        return receipt.id, ids, payloads, batcher.submit(
+            ids=ids,
+            texts=[chunk["chunk_text"] for chunk in chunks],
+            payloads=payloads,
+        )
+
+    def _apply_all(self, collection, entry):
+        """
+        Upserts go out with wait=false. Qdrant applies a collection's updates
+        in order, so re-sending the last written points with wait=true
+        returns only once every earlier upsert has been applied too.
+        """
+        _, ids, payloads, future = entry
+        points = [
+            {"id": point, "vector": vector, "payload": payload}
+            for point, vector, payload in zip(ids, future.result(), payloads)
+        ]
+        qdrant.upsert_points(points, collection=collection, wait=True)
+
+    def _backfill(self, checkpoint, options):
+        queryset = self._ready_receipts().filter(id__gt=checkpoint.last_receipt_id)
+        remaining = queryset.count()
+        self.stdout.write(
+            f"Reindexing {remaining} receipts into {checkpoint.target_collection} "
+            f"(resuming after receipt {checkpoint.last_receipt_id}, model {checkpoint.embed_model})"
+        )
+
+        batcher = self._batcher(checkpoint, options)
+        started = time.monotonic()
+        done_this_run = 0
+        page, last = [], None
+
+        try:
+            # iterator() streams through a server-side cursor on Postgres
+            for receipt in queryset.iterator(chunk_size=options["page_size"]):
+                page.append(self._submit(batcher, receipt))
+
+                if len(page) >= options["page_size"]:
+                    done_this_run += self._commit_page(checkpoint, page)
+                    last, page = _last_with_points(page, last), []
+                    self._report(done_this_run, remaining, started)
+
+            if page:
+                done_this_run += self._commit_page(checkpoint, page)
+                last = _last_with_points(page, last)
+                self._report(done_this_run, remaining, started)
+        finally:
+            batcher.close()
+
+        if last is not None:
+            self._apply_all(checkpoint.target_collection, last)
+        checkpoint.finished_at = timezone.now()
+        checkpoint.save(update_fields=["finished_at", "updated_at"])
+
+    def _commit_page(self, checkpoint, page):
+        # Raises on the first failed batch; the checkpoint still points at
+        # the last fully indexed page, so a rerun picks up from there.
+        for *_, future in page:
+            future.result()
+
+        checkpoint.last_receipt_id = page[-1][0]
+        checkpoint.processed += len(page)
+        checkpoint.save(update_fields=["last_receipt_id", "processed", "updated_at"])
+        return len(page)
+
+    def _catch_up(self, checkpoint, options):
+        """
+        Copy receipts written since the backfill started (newly READY,
+        re-embedded, failed or deleted) again, in passes until one finds
+        nothing or CATCH_UP_PASSES ran; the alias is switched right after.
+        """
+        target = checkpoint.target_collection
+        since = checkpoint.started_at
+        for _ in range(CATCH_UP_PASSES):
+            pass_started = timezone.now()
+            changed = list(
+                Receipt.objects.filter(updated_at__gte=since - CATCH_UP_OVERLAP).values_list("id", flat=True)
+            )
+            deleted = list(
+                ReceiptEvent.objects.filter(kind="deleted", created_at__gte=since - CATCH_UP_OVERLAP)
+                .values_list("receipt_id", flat=True)
+            )
+            if not changed and not deleted:
+                return
+            self.stdout.write(f"Catching up {len(changed)} changed and {len(deleted)} deleted receipts")
+
+            batcher = self._batcher(checkpoint, options)
+            last = None
+            try:
+                stale = changed + deleted
+                for start in range(0, len(stale), options["page_size"]):
+                    ids = stale[start:start + options["page_size"]]
+                    # Old points first (chunks may have changed), then whatever is still READY
+                    qdrant.batch_update(
+                        [{"delete": {"filter": {"must": [{"key": "receipt_id", "match": {"any": ids}}]}}}],
+                        collection=target,
+                        wait=True,
+                    )
+                    page = [self._submit(batcher, receipt) for receipt in self._ready_receipts().filter(id__in=ids)]
+                    for *_, future in page:
+                        future.result()
+                    last = _last_with_points(page, last)
+            finally:
+                batcher.close()
+
+            if last is not None:
+                self._apply_all(target, last)
+            since = pass_started
+
+    def _report(self, done, total, started):
+        elapsed = time.monotonic() - started
+        rate = done / elapsed if elapsed else 0.0
+        eta = (total - done) / rate if rate else float("inf")
+        self.stdout.write(
+            f"{done}/{total} receipts ({rate:.1f}/s, elapsed {elapsed:.0f}s, ETA {eta:.0f}s)"
+        )
+
+    def _wait_until_indexed(self, target, timeout=600):
+        # Every upsert is applied (see _apply_all); wait for the HNSW index too
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            info = qdrant.get_collection(target)
+            if info and info.get("status") == "green":
+                self.stdout.write(f"{target}: {info.get('points_count')} points, status green")
+                return
+            time.sleep(2)
+        raise CommandError(f"{target} did not reach status green within {timeout}s; alias left unchanged")
@@ -0,0 +1,107 @@
+import os
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from receipts import ingestion, metrics
+from receipts.embedding import EmbeddingBatcher
+from receipts.pipeline import PermanentError, StageLimiter, process_job
+
+
+class Command(BaseCommand):
+    help = "Claim ingestion jobs from the queue table and run them through the native pipeline."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-in-flight", type=int, default=settings.INGESTION_MAX_IN_FLIGHT,
+            help="Jobs processed concurrently by this worker process",
+        )
+        parser.add_argument("--poll-interval", type=float, default=2.0, help="Seconds to sleep when the queue is empty")
+        parser.add_argument("--once", action="store_true", help="Exit once the queue is drained")
+        parser.add_argument("--stats-interval", type=float, default=60.0, help="Seconds between throughput reports (0 disables)")
+
+    def handle(self, *args, **options):
+        worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        max_in_flight = options["max_in_flight"]
+        limiter = StageLimiter(settings.INGESTION_STAGE_CONCURRENCY)
+        batcher = EmbeddingBatcher()
+        stopping = threading.Event()
+
+        def request_stop(signum, frame):
+            self.stdout.write("Shutting down after in-flight jobs finish...")
+            stopping.set()
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+
+        self.stdout.write(
+            f"Ingestion worker {worker_id} started "
+            f"(max_in_flight={max_in_flight}, stages={settings.INGESTION_STAGE_CONCURRENCY}, "
+            f"embed_batch={batcher.batch_size})"
+        )
+        last_report = time.monotonic()
+        last_counters = {}
+
+        in_flight = set()
+        with ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="ingest") as pool:
+            while not stopping.is_set():
+                capacity = max_in_flight - len(in_flight)
+                jobs = ingestion.claim_jobs(worker_id, capacity) if capacity else []
+                for job in jobs:
+                    in_flight.add(pool.submit(self._run, job, limiter, batcher))
+
+                if in_flight:
+                    done, in_flight = wait(
+                        in_flight,
+                        timeout=options["poll_interval"] if not jobs else 0,
+                        return_when=FIRST_COMPLETED,
+                    )
+                    in_flight = set(in_flight)
+                elif options["once"]:
+                    break
+                else:
+                    stopping.wait(options["poll_interval"])
+
+                if options["stats_interval"] and time.monotonic() - last_report >= options["stats_interval"]:
+                    last_counters = self._report(time.monotonic() - last_report, last_counters)
+                    last_report = time.monotonic()
+
+            wait(in_flight)
+
+        batcher.close()
+        self._report(time.monotonic() - last_report, last_counters)
+        connection.close()
+
+    def _report(self, elapsed, previous):
+        counters = metrics.snapshot()["counters"]
+        rates = ", ".join(
+            f"{name.removeprefix('ingestion.')}={value - previous.get(name, 0)} ({(value - previous.get(name, 0)) / elapsed:.1f}/s)"
+            for name, value in counters.items()
+            if name.startswith("ingestion.")
+        )
+        self.stdout.write(f"[stats {elapsed:.0f}s] {rates}")
+        return counters
+
+    def _run(self, job, limiter, batcher):
+        close_old_connections()
+        try:
+            process_job(job, limiter, batcher)
+            self.stdout.write(f"receipt {job.receipt_id}: READY (job {job.id}, attempt {job.attempts})")
+        except ingestion.LeaseLost:
+            # Results were rolled back; the worker that reclaimed the job finishes it
+            metrics.counter("ingestion.lease_lost").inc()
+            self.stderr.write(f"receipt {job.receipt_id}: lease on job {job.id} lost at {job.stage}, dropping attempt")
+        except PermanentError as e:
+            ingestion.mark_failed(job, e, permanent=True)
+            self.stderr.write(f"receipt {job.receipt_id}: dead-lettered at {job.stage}: {e}")
+        except Exception as e:
+            ingestion.mark_failed(job, e)
+            self.stderr.write(f"receipt {job.receipt_id}: attempt {job.attempts} failed at {job.stage}: {e!r}")
+        finally:
+            connection.close()
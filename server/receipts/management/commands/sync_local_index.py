@@ -0,0 +1,45 @@
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from receipts.retrieval import embedding_rows, save_embedding_rows
+
+
+class Command(BaseCommand):
+    help = "Mirror chunk embeddings from the Qdrant collection into ReceiptEmbedding rows for the local retrieval backend."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--page-size", type=int, default=256)
+
+    def handle(self, *args, **options):
+        scroll_url = (
+            f"{settings.QDRANT_URL}/collections/"
+            f"{settings.QDRANT_COLLECTION}/points/scroll"
+        )
+        offset = None
+        total = 0
+
+        while True:
+            body = {
+                "limit": options["page_size"],
+                "with_payload": True,
+                "with_vector": True,
+            }
+            if offset is not None:
+                body["offset"] = offset
+
+            resp = requests.post(scroll_url, json=body, timeout=30)
+            resp.raise_for_status()
+            result = resp.json()["result"]
+            points = result.get("points", [])
+
+            rows = embedding_rows(points)
+            save_embedding_rows(rows)
+            total += len(rows)
+            self.stdout.write(f"synced {total} chunks")
+
+            offset = result.get("next_page_offset")
+            if offset is None:
+                break
+
+        self.stdout.write(self.style.SUCCESS(f"Done: {total} chunks mirrored from {settings.QDRANT_COLLECTION}"))
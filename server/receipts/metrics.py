@@ -0,0 +1,107 @@
+"""
+In-process counters and latency histograms.
+
+Everything here is per worker process and lock-protected; the snapshot is
+served by MetricsView for scraping or ad-hoc inspection.
+"""
+
+import bisect
+import threading
+
+# Upper bounds in milliseconds; the implicit last bucket is +Inf.
+DEFAULT_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+
+class Counter:
+    def __init__(self, name):
+        self.name = name
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def snapshot(self):
+        return self._value
+
+
+class Histogram:
+    def __init__(self, name, buckets=DEFAULT_BUCKETS_MS):
+        self.name = name
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value_ms):
+        idx = bisect.bisect_left(self.buckets, value_ms)
+        with self._lock:
+            self._counts[idx] += 1
+            self._sum += value_ms
+            self._count += 1
+
+    def percentile(self, pct):
+        """Bucket upper bound at or above the given percentile (approximate)."""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._count
+        if not total:
+            return None
+        target = total * pct / 100.0
+        running = 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            running += n
+            if running >= target:
+                return bound
+        return float("inf")
+
+    def snapshot(self):
+        with self._lock:
+            counts = list(self._counts)
+            total = self._count
+            total_sum = self._sum
+        return {
+            "count": total,
+            "sum_ms": round(total_sum, 3),
+            "buckets": {
+                **{str(b): c for b, c in zip(self.buckets, counts)},
+                "+Inf": counts[-1],
+            },
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+        }
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def _get_or_create(name, factory):
+    metric = _registry.get(name)
+    if metric is None:
+        with _registry_lock:
+            metric = _registry.get(name)
+            if metric is None:
+                metric = factory(name)
+                _registry[name] = metric
+    return metric
+
+
+def counter(name):
+    return _get_or_create(name, Counter)
+
+
+def histogram(name):
+    return _get_or_create(name, Histogram)
+
+
+def snapshot():
+    with _registry_lock:
+        metrics = dict(_registry)
+    return {
+        "counters": {n: m.snapshot() for n, m in sorted(metrics.items()) if isinstance(m, Counter)},
+        "histograms": {n: m.snapshot() for n, m in sorted(metrics.items()) if isinstance(m, Histogram)},
+    }
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:24
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('receipts', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReceiptEmbedding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chunk_index', models.PositiveIntegerField()),
+                ('chunk_type', models.CharField(blank=True, default='', max_length=64)),
+                ('content', models.TextField()),
+                ('vector', models.BinaryField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('receipt', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='embeddings', to='receipts.receipt')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='receipt_embeddings', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user'], name='receipt_emb_user_idx')],
+                'constraints': [models.UniqueConstraint(fields=('receipt', 'chunk_index'), name='uniq_receipt_chunk')],
+            },
+        ),
+    ]
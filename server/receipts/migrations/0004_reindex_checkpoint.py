@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('receipts', '0003_ingestion_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReindexCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('target_collection', models.CharField(max_length=255, unique=True)),
+                ('alias', models.CharField(max_length=255)),
+                ('embed_model', models.CharField(max_length=255)),
+                ('last_receipt_id', models.BigIntegerField(default=0)),
+                ('processed', models.PositiveIntegerField(default=0)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
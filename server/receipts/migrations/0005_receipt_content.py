@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:32
+
+import json
+import zlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def move_content(apps, schema_editor):
+    Receipt = apps.get_model("receipts", "Receipt")
+    ReceiptContent = apps.get_model("receipts", "ReceiptContent")
+
+    def z(value):
+        return None if value is None else zlib.compress(value.encode("utf-8"), 6)
+
+    rows = (
+        Receipt.objects.filter(models.Q(ocr_text__isnull=False) | models.Q(raw_extracted_json__isnull=False))
+        .values_list("id", "ocr_text", "raw_extracted_json")
+        .iterator(chunk_size=1000)
+    )
+    batch = []
+    for receipt_id, ocr_text, raw in rows:
+        batch.append(ReceiptContent(
+            receipt_id=receipt_id,
+            ocr_text_z=z(ocr_text),
+            raw_extracted_json_z=None if raw is None else z(json.dumps(raw, default=str)),
+        ))
+        if len(batch) >= 1000:
+            ReceiptContent.objects.bulk_create(batch)
+            batch = []
+    ReceiptContent.objects.bulk_create(batch)
+
+
+def restore_content(apps, schema_editor):
+    Receipt = apps.get_model("receipts", "Receipt")
+    ReceiptContent = apps.get_model("receipts", "ReceiptContent")
+
+    for content in ReceiptContent.objects.iterator(chunk_size=1000):
+        ocr_text = None if content.ocr_text_z is None else zlib.decompress(bytes(content.ocr_text_z)).decode("utf-8")
+        raw = None if content.raw_extracted_json_z is None else json.loads(zlib.decompress(bytes(content.raw_extracted_json_z)))
+        Receipt.objects.filter(id=content.receipt_id).update(ocr_text=ocr_text, raw_extracted_json=raw)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('receipts', '0004_reindex_checkpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReceiptContent',
+            fields=[
+                ('receipt', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='content', serialize=False, to='receipts.receipt')),
+                ('ocr_text_z', models.BinaryField(blank=True, null=True)),
+                ('raw_extracted_json_z', models.BinaryField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(move_content, restore_content),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:32
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # Kept separate from 0005 so the column drop runs in its own transaction,
+    # after the deferred FK checks of the copied ReceiptContent rows.
+
+    dependencies = [
+        ('receipts', '0005_receipt_content'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='receipt',
+            name='ocr_text',
+        ),
+        migrations.RemoveField(
+            model_name='receipt',
+            name='raw_extracted_json',
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('receipts', '0007_receipt_content_sha256'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='receipt',
+            name='preview_key',
+            field=models.CharField(blank=True, max_length=1024, null=True),
+        ),
+        migrations.AddField(
+            model_name='receipt',
+            name='thumbnail_key',
+            field=models.CharField(blank=True, max_length=1024, null=True),
+        ),
+    ]
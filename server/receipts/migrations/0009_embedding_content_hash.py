@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('receipts', '0008_receipt_previews'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='receiptembedding',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('receipts', '0009_embedding_content_hash'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReceiptEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('receipt_id', models.BigIntegerField()),
+                ('kind', models.CharField(choices=[('updated', 'Updated'), ('deleted', 'Deleted')], default='updated', max_length=16)),
+                ('data', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='receipt_events', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'id'], name='receipt_event_user_idx'), models.Index(fields=['created_at'], name='receipt_event_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:57
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('receipts', '0010_receipt_events'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='receipt',
+            index=models.Index(fields=['user', 'purchase_date', 'id'], name='receipt_user_purchase_idx'),
+        ),
+    ]
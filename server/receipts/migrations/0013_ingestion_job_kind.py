@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('receipts', '0012_cache_table'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestionjob',
+            name='kind',
+            field=models.CharField(choices=[('ingest', 'Ingest'), ('reindex', 'Reindex')], default='ingest', max_length=16),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('receipts', '0013_ingestion_job_kind'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestionjob',
+            name='rerun',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -1,4 +1,8 @@
+import json
+import zlib
+
 from django.db import models
+from django.utils import timezone
 from django.conf import settings
 
 class Receipt(models.Model):
@@ -11,15 +15,210 @@ class Receipt(models.Model):
 
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="receipts")
     file_key = models.CharField(max_length=1024)  # S3 key (user_id/receipt_id/filename)
-    ocr_text = models.TextField(null=True, blank=True)
     merchant_name = models.CharField(max_length=255, null=True, blank=True)
     total_amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
     currency = models.CharField(max_length=10, default="INR")
     purchase_date = models.DateTimeField(null=True, blank=True)
-    raw_extracted_json = models.JSONField(null=True, blank=True)
     status = models.CharField(max_length=32, choices=STATUS_CHOICES, default="PENDING")
+    content_sha256 = models.CharField(max_length=64, null=True, blank=True)  # hex digest of the uploaded file
+    preview_key = models.CharField(max_length=1024, null=True, blank=True)  # compressed preview next to file_key
+    thumbnail_key = models.CharField(max_length=1024, null=True, blank=True)
+    duplicate_of = models.ForeignKey("self", on_delete=models.SET_NULL, null=True, blank=True, related_name="duplicates")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "content_sha256"], name="receipt_user_sha256_idx"),
+            models.Index(fields=["user", "purchase_date", "id"], name="receipt_user_purchase_idx"),
+        ]
+
     def __str__(self):
         return f"Receipt {self.id} ({self.user.email})"
+
+
+def _compress(value):
+    return None if value is None else zlib.compress(value.encode("utf-8"), 6)
+
+
+def _decompress(value):
+    return None if value is None else zlib.decompress(bytes(value)).decode("utf-8")
+
+
+class ReceiptContent(models.Model):
+    """
+    Large per-receipt payloads (OCR text and the raw extraction JSON), kept
+    zlib-compressed in a side table so list/detail queries on Receipt never
+    drag them along. Load explicitly, e.g. select_related("content").
+    """
+
+    CONTENT_FIELDS = ("ocr_text", "raw_extracted_json")
+
+    receipt = models.OneToOneField(Receipt, on_delete=models.CASCADE, primary_key=True, related_name="content")
+    ocr_text_z = models.BinaryField(null=True, blank=True)
+    raw_extracted_json_z = models.BinaryField(null=True, blank=True)
+
+    @property
+    def ocr_text(self):
+        return _decompress(self.ocr_text_z)
+
+    @ocr_text.setter
+    def ocr_text(self, value):
+        self.ocr_text_z = _compress(value)
+
+    @property
+    def raw_extracted_json(self):
+        raw = _decompress(self.raw_extracted_json_z)
+        return None if raw is None else json.loads(raw)
+
+    @raw_extracted_json.setter
+    def raw_extracted_json(self, value):
+        self.raw_extracted_json_z = None if value is None else _compress(json.dumps(value, default=str))
+
+    @classmethod
+    def bulk_upsert(cls, values_by_receipt, fields):
+        """
+        Write ``fields`` (names from CONTENT_FIELDS) for many receipts in one
+        statement; other content fields of existing rows are left untouched.
+        """
+        objs = []
+        for receipt_id, values in values_by_receipt.items():
+            obj = cls(receipt_id=receipt_id)
+            for field in fields:
+                setattr(obj, field, values.get(field))
+            objs.append(obj)
+
+        cls.objects.bulk_create(
+            objs,
+            update_conflicts=True,
+            unique_fields=["receipt"],
+            update_fields=[f"{field}_z" for field in fields],
+        )
+
+    def __str__(self):
+        return f"Content of receipt {self.receipt_id}"
+
+
+class ReceiptEmbedding(models.Model):
+    """
+    One embedded chunk of a receipt, stored next to the receipt so the
+    local retrieval backend can search without a Qdrant round trip.
+    """
+
+    receipt = models.ForeignKey(Receipt, on_delete=models.CASCADE, related_name="embeddings")
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="receipt_embeddings")
+    chunk_index = models.PositiveIntegerField()
+    chunk_type = models.CharField(max_length=64, blank=True, default="")
+    content = models.TextField()
+    content_hash = models.CharField(max_length=64, blank=True, default="")  # receipts.chunking.chunk_hash
+    vector = models.BinaryField()  # little-endian float32, len(vector) == 4 * dim
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["receipt", "chunk_index"], name="uniq_receipt_chunk"),
+        ]
+        indexes = [
+            models.Index(fields=["user"], name="receipt_emb_user_idx"),
+        ]
+
+    def __str__(self):
+        return f"Embedding {self.receipt_id}:{self.chunk_index}"
+
+
+class IngestionJob(models.Model):
+    """
+    Queue entry for the in-process ingestion pipeline.
+
+    Workers claim QUEUED rows with SELECT ... FOR UPDATE SKIP LOCKED (see
+    receipts.ingestion); a RUNNING row whose lease expired is claimable
+    again. After max_attempts failures the job is dead-lettered (DEAD) and
+    kept for inspection. ``reindex`` jobs re-embed a READY receipt from its
+    stored fields and OCR text after a callback changed them; ``rerun``
+    marks a RUNNING job whose receipt changed meanwhile, which then goes
+    back to the queue as a reindex instead of finishing.
+    """
+
+    STATUS_CHOICES = [
+        ("QUEUED", "Queued"),
+        ("RUNNING", "Running"),
+        ("DONE", "Done"),
+        ("DEAD", "Dead"),
+    ]
+    KIND_CHOICES = [
+        ("ingest", "Ingest"),
+        ("reindex", "Reindex"),
+    ]
+
+    receipt = models.ForeignKey(Receipt, on_delete=models.CASCADE, related_name="ingestion_jobs")
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES, default="ingest")
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default="QUEUED")
+    stage = models.CharField(max_length=32, blank=True, default="")
+    rerun = models.BooleanField(default=False)
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=128, blank=True, default="")
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["receipt"],
+                condition=models.Q(status__in=["QUEUED", "RUNNING"]),
+                name="uniq_open_ingestion_job",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["status", "run_after"], name="ingest_job_claim_idx"),
+        ]
+
+    def __str__(self):
+        return f"IngestionJob {self.id} (receipt {self.receipt_id}, {self.status})"
+
+
+class ReindexCheckpoint(models.Model):
+    """Progress of a reindex_receipts run, so an interrupted run can resume."""
+
+    target_collection = models.CharField(max_length=255, unique=True)
+    alias = models.CharField(max_length=255)
+    embed_model = models.CharField(max_length=255)
+    last_receipt_id = models.BigIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Reindex into {self.target_collection} (after receipt {self.last_receipt_id})"
+
+
+class ReceiptEvent(models.Model):
+    """
+    Append-only log of receipt changes, one row per receipt changed by a
+    committed transaction, read by the event stream and the changes-since
+    endpoint (see receipts.events). ``data`` is the receipt as the list
+    endpoint renders it, so clients can merge it straight into their list.
+    """
+
+    KIND_CHOICES = [
+        ("updated", "Updated"),
+        ("deleted", "Deleted"),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="receipt_events")
+    receipt_id = models.BigIntegerField()  # no FK: deletions are events too
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES, default="updated")
+    data = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "id"], name="receipt_event_user_idx"),
+            models.Index(fields=["created_at"], name="receipt_event_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"ReceiptEvent {self.id} ({self.kind} receipt {self.receipt_id})"
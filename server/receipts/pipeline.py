@@ -0,0 +1,510 @@
+"""
+Native ingestion pipeline: download -> OCR -> extract -> embed + index.
+
+Download, OCR and extract are each gated by their own semaphore
+(INGESTION_STAGE_CONCURRENCY), so a worker can, say, keep 2 OCR calls and
+8 LLM calls in flight at once. Embedding and indexing go through the
+shared EmbeddingBatcher, which batches chunks across receipts. A file the
+user has already uploaded is linked to the earlier receipt right after
+download and skips the remaining stages (see receipts.dedup). The OCR
+call also returns a compressed preview and thumbnail rendered from the
+same decode, stored next to the original, and rule-based field
+candidates; when those are confident enough the LLM extraction call is
+skipped. Extracted fields, OCR text, the READY status and the job
+completion are written in a single transaction at the end; chunk
+embeddings are stored as soon as they are indexed, so a retry only embeds
+what is still missing. ``reindex`` jobs re-embed READY receipts whose
+fields or OCR text a callback changed.
+"""
+
+import base64
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import ingestion, metrics, qdrant
+from .chunking import build_chunks, point_id
+from .dedup import find_original, link_duplicate, sha256_of, sync_duplicates
+from .gemini import generate_json_sync, get_session
+from .models import Receipt, ReceiptContent, ReceiptEmbedding
+from .retrieval import bytes_to_vector, vector_to_bytes
+from .signals import receipts_changed
+from .storage import ObjectNotFound, get_storage
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("download", "ocr", "extract")
+
+EXTRACT_PROMPT = """You are a receipt parser. Extract structured data and return ONLY valid JSON. No explanations. No markdown.
+
+Extract the following fields from the receipt text below:
+- merchant_name (string)
+- total_amount (number)
+- currency (ISO code like INR)
+- purchase_date (ISO 8601 date if available)
+
+Receipt text:
+
+{ocr_text}"""
+
+
+class PermanentError(Exception):
+    """A failure retrying will not fix; the job is dead-lettered immediately."""
+
+
+class StageLimiter:
+    def __init__(self, limits):
+        self._semaphores = {
+            stage: threading.BoundedSemaphore(max(1, int(limits.get(stage, 1))))
+            for stage in STAGES
+        }
+
+    @contextmanager
+    def __call__(self, job, stage):
+        with self._semaphores[stage]:
+            ingestion.set_stage(job, stage)
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                metrics.histogram(f"ingestion.{stage}_ms").observe((time.perf_counter() - start) * 1000)
+
+
+# ---------------------------------------------------------------------------
+# Pure helpers (ported from the n8n "Code" nodes)
+# ---------------------------------------------------------------------------
+
+def clean_ocr_text(text):
+    text = re.sub(r"\r\n|\r", "\n", text or "")
+    text = re.sub(r"\n{2,}", "\n", text)
+    text = re.sub(r"[ \t]{2,}", " ", text)
+    text = re.sub(r"[^\x20-\x7E\n₹]", "", text)
+    return text.strip()
+
+
+def normalize_amount(value):
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        value = str(value)
+    if not isinstance(value, str):
+        return None
+    cleaned = re.sub(r"[^\d.-]", "", value)
+    try:
+        amount = Decimal(cleaned).quantize(Decimal("0.01"))
+    except InvalidOperation:
+        return None
+    # Receipt.total_amount is max_digits=12, decimal_places=2
+    return amount if abs(amount) < Decimal("1e10") else None
+
+
+def normalize_date(value):
+    if not value or not isinstance(value, str):
+        return None
+    value = value.strip()
+    for fmt in ("%Y-%m-%d", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M:%SZ", "%d/%m/%Y", "%d-%m-%Y"):
+        try:
+            parsed = datetime.strptime(value, fmt)
+            break
+        except ValueError:
+            continue
+    else:
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+
+def normalize_currency(value):
+    if not value or not isinstance(value, str):
+        return None
+    value = value.strip().upper()
+    return value[:10] or None
+
+
+# ---------------------------------------------------------------------------
+# Stages
+# ---------------------------------------------------------------------------
+
+def download(receipt):
+    # Local storage reads straight from disk
+    try:
+        return get_storage().read(receipt.file_key)
+    except ObjectNotFound:
+        raise PermanentError(f"object {receipt.file_key} not found")
+
+
+def run_ocr(file_key, data):
+    """
+    OCR response: ``text``, plus base64 ``preview``/``thumbnail`` JPEGs and
+    rule-based field candidates (``fields``) when requested.
+    """
+    path = get_storage().local_path(file_key) if settings.OCR_SHARED_STORAGE else None
+    if path is not None:
+        # Co-located OCR service opens the file itself
+        request = {"data": {"path": str(path)}}
+    else:
+        request = {"files": {"data": (file_key.rsplit("/", 1)[-1], data)}}
+    resp = get_session().post(
+        settings.OCR_SERVICE_URL,
+        params={
+            "previews": "true" if settings.INGESTION_PREVIEWS else "false",
+            "fields": "true" if settings.INGESTION_HEURISTIC_MIN_CONFIDENCE <= 1 else "false",
+        },
+        timeout=300,
+        **request,
+    )
+    if resp.status_code == 400:
+        raise PermanentError(f"OCR rejected file: {resp.text[:500]}")
+    resp.raise_for_status()
+    return resp.json()
+
+
+def store_previews(receipt, ocr):
+    """
+    Save the preview and thumbnail rendered by the OCR service next to the
+    original. Returns the keys to record; a failure only costs the preview.
+    """
+    folder = receipt.file_key.rsplit("/", 1)[0]
+    content_type = ocr.get("preview_content_type", "image/jpeg")
+    keys = {}
+    for name, field in (("preview", "preview_key"), ("thumbnail", "thumbnail_key")):
+        if not ocr.get(name):
+            continue
+        key = f"{folder}/{name}.jpg"
+        try:
+            get_storage().write(key, base64.b64decode(ocr[name]), content_type)
+        except Exception:
+            logger.warning("could not store %s for receipt %s", name, receipt.id, exc_info=True)
+            continue
+        keys[field] = key
+    return keys
+
+
+def extract_fields(ocr_text):
+    raw, parsed = generate_json_sync(EXTRACT_PROMPT.format(ocr_text=ocr_text))
+    if not isinstance(parsed, dict):
+        parsed = {
+            "merchant_name": None,
+            "total_amount": None,
+            "currency": None,
+            "purchase_date": None,
+            "parse_error": True,
+            "raw_output": raw,
+        }
+
+    merchant = parsed.get("merchant_name")
+    fields = {
+        "merchant_name": merchant.strip()[:255] if isinstance(merchant, str) and merchant.strip() else None,
+        "total_amount": normalize_amount(parsed.get("total_amount")),
+        "currency": normalize_currency(parsed.get("currency")),
+        "purchase_date": normalize_date(parsed.get("purchase_date")),
+    }
+    return fields, parsed
+
+
+HEURISTIC_REQUIRED_FIELDS = ("merchant_name", "total_amount", "purchase_date")
+KNOWN_MERCHANT_MIN_CONFIDENCE = 0.6
+
+
+def _known_merchant(user_id, name):
+    return Receipt.objects.filter(user_id=user_id, status="READY", merchant_name__iexact=name.strip()).exists()
+
+
+def heuristic_fields(candidates, user_id=None):
+    """
+    Fields from the OCR service's rule-based candidates, or None when the
+    LLM is still needed. Merchant, total and date must each clear
+    INGESTION_HEURISTIC_MIN_CONFIDENCE; a detected currency must too, while
+    a missing one leaves the receipt default, as a null from the LLM does.
+    A merchant the user already has on a READY receipt only needs
+    KNOWN_MERCHANT_MIN_CONFIDENCE: the OCR rules alone score a header
+    without a business suffix below the threshold.
+    """
+    if not candidates:
+        return None
+    threshold = settings.INGESTION_HEURISTIC_MIN_CONFIDENCE
+
+    def trusted(name):
+        candidate = candidates.get(name)
+        if not candidate:
+            return None
+        confidence = candidate.get("confidence", 0)
+        if confidence >= threshold:
+            return candidate
+        if (
+            name == "merchant_name"
+            and user_id is not None
+            and confidence >= min(threshold, KNOWN_MERCHANT_MIN_CONFIDENCE)
+            and _known_merchant(user_id, str(candidate["value"]))
+        ):
+            return candidate
+        return None
+
+    # Merchant last: it may cost a query
+    total, purchase_date = trusted("total_amount"), trusted("purchase_date")
+    currency = trusted("currency")
+    if not total or not purchase_date or (candidates.get("currency") and not currency):
+        return None
+    merchant = trusted("merchant_name")
+    if not merchant:
+        return None
+
+    merchant = str(merchant["value"]).strip()
+    fields = {
+        "merchant_name": merchant[:255] or None,
+        "total_amount": normalize_amount(total["value"]),
+        "currency": normalize_currency(currency["value"]) if currency else None,
+        "purchase_date": normalize_date(purchase_date["value"]),
+    }
+    if any(fields[name] is None for name in HEURISTIC_REQUIRED_FIELDS):
+        return None
+    return fields, {"source": "ocr_heuristics", "candidates": candidates}
+
+
+def chunk_payload(receipt, fields, index, chunk):
+    return {
+        "user_id": receipt.user_id,
+        "receipt_id": receipt.id,
+        "chunk_index": index,
+        "chunk_type": chunk["chunk_type"],
+        "merchant_name": fields.get("merchant_name"),
+        "purchase_date": fields["purchase_date"].date().isoformat() if fields.get("purchase_date") else None,
+        "total_amount": float(fields["total_amount"]) if fields.get("total_amount") is not None else None,
+        "currency": fields.get("currency"),
+        "content": chunk["chunk_text"],
+        "chunk_hash": chunk["chunk_hash"],
+    }
+
+
+def embed_and_index(batcher, receipt, fields, chunks):
+    """
+    Embed and upsert only the chunks whose hash this receipt doesn't have
+    yet; unchanged chunks reuse their stored vector and Qdrant point. One
+    Qdrant batch request then refreshes the payloads of the reused points
+    (fields or chunk order may have changed) and deletes every other point
+    of the receipt. New vectors are stored as soon as they are indexed, so
+    a retry after a later failure reuses them. Returns vectors aligned
+    with ``chunks``.
+    """
+    known = {
+        content_hash: bytes_to_vector(vector)
+        for content_hash, vector in ReceiptEmbedding.objects.filter(receipt_id=receipt.id)
+        .exclude(content_hash="")
+        .values_list("content_hash", "vector")
+    }
+    ids = [point_id(receipt.id, chunk["chunk_hash"]) for chunk in chunks]
+    payloads = [chunk_payload(receipt, fields, index, chunk) for index, chunk in enumerate(chunks)]
+    changed = [index for index, chunk in enumerate(chunks) if chunk["chunk_hash"] not in known]
+
+    new_vectors = batcher.submit(
+        ids=[ids[index] for index in changed],
+        texts=[chunks[index]["chunk_text"] for index in changed],
+        payloads=[payloads[index] for index in changed],
+    ).result()
+
+    vectors = [known.get(chunk["chunk_hash"]) for chunk in chunks]
+    for index, vector in zip(changed, new_vectors):
+        vectors[index] = vector
+    save_embeddings(receipt, chunks, vectors, indexes=changed)
+
+    changed_set = set(changed)
+    qdrant.batch_update(
+        [
+            {"set_payload": {"payload": payloads[index], "points": [ids[index]]}}
+            for index in range(len(chunks))
+            if index not in changed_set
+        ]
+        + [{
+            "delete": {
+                "filter": {
+                    "must": [{"key": "receipt_id", "match": {"value": receipt.id}}],
+                    "must_not": [{"has_id": ids}],
+                }
+            }
+        }],
+        collection=batcher.collection,
+    )
+
+    metrics.counter("ingestion.chunks.embedded").inc(len(changed))
+    metrics.counter("ingestion.chunks.reused").inc(len(chunks) - len(changed))
+    return vectors
+
+
+def save_embeddings(receipt, chunks, vectors, indexes=None):
+    """
+    Upsert the ReceiptEmbedding rows of ``chunks`` (only those at
+    ``indexes`` if given); a full write also drops rows past the last chunk.
+    """
+    if indexes is None:
+        indexes = range(len(chunks))
+        ReceiptEmbedding.objects.filter(receipt_id=receipt.id, chunk_index__gte=len(chunks)).delete()
+    ReceiptEmbedding.objects.bulk_create(
+        [
+            ReceiptEmbedding(
+                receipt_id=receipt.id,
+                user_id=receipt.user_id,
+                chunk_index=index,
+                chunk_type=chunks[index]["chunk_type"],
+                content=chunks[index]["chunk_text"],
+                content_hash=chunks[index]["chunk_hash"],
+                vector=vector_to_bytes(vectors[index]),
+            )
+            for index in indexes
+        ],
+        update_conflicts=True,
+        unique_fields=["receipt", "chunk_index"],
+        update_fields=["chunk_type", "content", "content_hash", "vector", "updated_at"],
+    )
+
+
+def write_results(job, fields, ocr_text, extracted, chunks, vectors, previews=None):
+    with transaction.atomic():
+        receipt = Receipt.objects.select_for_update().filter(id=job.receipt_id).first()
+        if receipt is None:
+            raise PermanentError("receipt was deleted during processing")
+
+        for field, key in (previews or {}).items():
+            setattr(receipt, field, key)
+
+        receipt.merchant_name = fields["merchant_name"]
+        receipt.total_amount = fields["total_amount"]
+        receipt.purchase_date = fields["purchase_date"]
+        if fields["currency"]:
+            receipt.currency = fields["currency"]
+        receipt.status = "READY"
+        receipt.save()
+
+        ReceiptContent.bulk_upsert(
+            {receipt.id: {"ocr_text": ocr_text, "raw_extracted_json": extracted}},
+            ReceiptContent.CONTENT_FIELDS,
+        )
+
+        save_embeddings(receipt, chunks, vectors)
+
+        sync_duplicates([receipt.id])
+        ingestion.mark_done(job)
+
+
+def link_to_original(job, receipt, sha256):
+    """
+    Record the file hash; if the user already has this exact file, link the
+    receipt to it and finish the job. Returns True when the rest of the
+    pipeline can be skipped.
+    """
+    with transaction.atomic():
+        original = find_original(receipt.user_id, sha256, before_id=receipt.id)
+        if original is not None:
+            # Lock the original so it can't finish between the copy and the link
+            original = Receipt.objects.select_for_update().get(id=original.id)
+        receipt = Receipt.objects.select_for_update().filter(id=receipt.id).first()
+        if receipt is None:
+            raise PermanentError("receipt was deleted during processing")
+
+        if original is None:
+            receipt.content_sha256 = sha256
+            receipt.save(update_fields=["content_sha256", "updated_at"])
+            return False
+
+        link_duplicate(receipt, original)
+        ingestion.mark_done(job)
+
+    metrics.counter("ingestion.duplicates").inc()
+    return True
+
+
+def start_processing(job):
+    with transaction.atomic():
+        receipt = (
+            Receipt.objects.select_for_update()
+            .select_related("user")
+            .filter(id=job.receipt_id)
+            .first()
+        )
+        if receipt is None:
+            raise PermanentError("receipt no longer exists")
+        if job.kind == "reindex":
+            # Rebuilt from the stored fields; the receipt stays READY throughout
+            if receipt.status != "READY":
+                raise PermanentError(f"receipt is {receipt.status}, expected READY")
+            return receipt
+        if receipt.status not in ("PENDING", "UPLOADED", "PROCESSING"):
+            raise PermanentError(f"receipt is {receipt.status}, expected PENDING")
+        if receipt.status != "PROCESSING":
+            receipt.status = "PROCESSING"
+            receipt.save(update_fields=["status", "updated_at"])
+    return receipt
+
+
+def reindex(job, receipt, batcher):
+    """
+    Re-embed a READY receipt from its stored fields and OCR text, e.g.
+    after a callback corrected them. Only chunks whose text changed are
+    embedded; the rest keep their vectors and points.
+    """
+    content = ReceiptContent.objects.filter(receipt_id=receipt.id).first()
+    ocr_text = (content.ocr_text if content else None) or ""
+    fields = {
+        "merchant_name": receipt.merchant_name,
+        "total_amount": receipt.total_amount,
+        "currency": receipt.currency,
+        "purchase_date": receipt.purchase_date,
+    }
+    chunks = build_chunks(fields, ocr_text)
+
+    ingestion.set_stage(job, "embed")
+    vectors = embed_and_index(batcher, receipt, fields, chunks)
+
+    with transaction.atomic():
+        if not Receipt.objects.select_for_update().filter(id=receipt.id).exists():
+            raise PermanentError("receipt was deleted during processing")
+        save_embeddings(receipt, chunks, vectors)
+        ingestion.mark_done(job)
+        # bulk writes skip the signals
+        transaction.on_commit(lambda: receipts_changed([receipt.user_id]))
+
+
+def process_job(job, limiter, batcher):
+    receipt = start_processing(job)
+    if job.kind == "reindex":
+        reindex(job, receipt, batcher)
+        return
+
+    with limiter(job, "download"):
+        data = download(receipt)
+
+    if link_to_original(job, receipt, sha256_of(data)):
+        return
+
+    with limiter(job, "ocr"):
+        ocr = run_ocr(receipt.file_key, data)
+        ocr_text = clean_ocr_text(ocr.get("text", ""))
+        previews = store_previews(receipt, ocr)
+
+    heuristic = heuristic_fields(ocr.get("fields"), receipt.user_id)
+    if heuristic is not None:
+        # Confident rule-based fields: no LLM call
+        fields, extracted = heuristic
+        metrics.counter("ingestion.extract.heuristic").inc()
+    else:
+        with limiter(job, "extract"):
+            fields, extracted = extract_fields(ocr_text)
+        metrics.counter("ingestion.extract.llm").inc()
+
+    chunks = build_chunks(fields, ocr_text)
+
+    ingestion.set_stage(job, "embed")
+    vectors = embed_and_index(batcher, receipt, fields, chunks)
+
+    write_results(job, fields, ocr_text, extracted, chunks, vectors, previews)
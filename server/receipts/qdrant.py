@@ -0,0 +1,112 @@
+"""
+Thin synchronous Qdrant REST helpers used by ingestion and management commands.
+"""
+
+from django.conf import settings
+
+from .gemini import get_session
+
+# Every AIQueryView search filters on user_id; receipt_id drives the
+# per-receipt deletes in ingestion and purchase_date allows date-range filters
+PAYLOAD_INDEXES = {
+    "user_id": "integer",
+    "receipt_id": "integer",
+    "purchase_date": "datetime",
+}
+
+
+def collection_url(collection=None):
+    return f"{settings.QDRANT_URL}/collections/{collection or settings.QDRANT_COLLECTION}"
+
+
+def upsert_points(points, collection=None, wait=True, timeout=30):
+    if not points:
+        return
+    resp = get_session().put(
+        f"{collection_url(collection)}/points",
+        params={"wait": "true" if wait else "false"},
+        json={"points": points},
+        timeout=timeout,
+    )
+    resp.raise_for_status()
+
+
+def batch_update(operations, collection=None, wait=False, timeout=30):
+    """Apply several point operations (delete, set_payload, ...) in one request, in order."""
+    if not operations:
+        return
+    resp = get_session().post(
+        f"{collection_url(collection)}/points/batch",
+        params={"wait": "true" if wait else "false"},
+        json={"operations": operations},
+        timeout=timeout,
+    )
+    resp.raise_for_status()
+
+
+def get_collection(collection=None, timeout=10):
+    """Collection info (``result`` of GET /collections/{name}), or None if it doesn't exist."""
+    resp = get_session().get(collection_url(collection), timeout=timeout)
+    if resp.status_code == 404:
+        return None
+    resp.raise_for_status()
+    return resp.json()["result"]
+
+
+def create_collection(collection, body, timeout=60):
+    resp = get_session().put(collection_url(collection), json=body, timeout=timeout)
+    resp.raise_for_status()
+
+
+def update_collection(collection, body, timeout=60):
+    resp = get_session().patch(collection_url(collection), json=body, timeout=timeout)
+    resp.raise_for_status()
+
+
+def create_payload_index(collection, field_name, field_schema, timeout=300):
+    resp = get_session().put(
+        f"{collection_url(collection)}/index",
+        params={"wait": "true"},
+        json={"field_name": field_name, "field_schema": field_schema},
+        timeout=timeout,
+    )
+    resp.raise_for_status()
+
+
+def search(body, collection=None, timeout=30):
+    resp = get_session().post(f"{collection_url(collection)}/points/search", json=body, timeout=timeout)
+    resp.raise_for_status()
+    return resp.json()["result"]
+
+
+def scroll(body, collection=None, timeout=30):
+    """One page of POST /points/scroll: (points, next_page_offset)."""
+    resp = get_session().post(f"{collection_url(collection)}/points/scroll", json=body, timeout=timeout)
+    resp.raise_for_status()
+    result = resp.json()["result"]
+    return result.get("points", []), result.get("next_page_offset")
+
+
+def list_aliases(timeout=10):
+    """Map of alias name -> collection name."""
+    resp = get_session().get(f"{settings.QDRANT_URL}/aliases", timeout=timeout)
+    resp.raise_for_status()
+    return {
+        a["alias_name"]: a["collection_name"]
+        for a in resp.json()["result"]["aliases"]
+    }
+
+
+def switch_alias(alias, collection, timeout=30):
+    """Atomically point ``alias`` at ``collection`` (creating it if needed)."""
+    actions = []
+    if alias in list_aliases():
+        actions.append({"delete_alias": {"alias_name": alias}})
+    actions.append({"create_alias": {"collection_name": collection, "alias_name": alias}})
+
+    resp = get_session().post(
+        f"{settings.QDRANT_URL}/collections/aliases",
+        json={"actions": actions},
+        timeout=timeout,
+    )
+    resp.raise_for_status()
@@ -0,0 +1,296 @@
+"""
+Retrieval backends used by AIQueryView.
+
+Both backends return hits shaped like Qdrant search results
+(``{"id", "score", "payload": {...}}``) so callers don't care which one
+is configured via ``settings.RETRIEVAL_BACKEND``.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+from . import qdrant
+from .answers import get_answer_version
+from .gemini import get_async_client
+from .models import Receipt, ReceiptEmbedding
+
+
+def vector_to_bytes(values):
+    return np.asarray(values, dtype="<f4").tobytes()
+
+
+def bytes_to_vector(raw):
+    return np.frombuffer(bytes(raw), dtype="<f4")
+
+
+class QdrantRetrievalBackend:
+    name = "qdrant"
+
+    def _request(self, user_id, query_vector, limit):
+        search_url = (
+            f"{settings.QDRANT_URL}/collections/"
+            f"{settings.QDRANT_COLLECTION}/points/search"
+        )
+        search_payload = {
+            "vector": list(query_vector),
+            "limit": limit,
+            "with_payload": True,
+            "filter": {
+                "must": [
+                    {"key": "user_id", "match": {"value": user_id}},
+                ]
+            },
+        }
+        params = {}
+        if settings.QDRANT_SEARCH_HNSW_EF:
+            params["hnsw_ef"] = settings.QDRANT_SEARCH_HNSW_EF
+        if settings.QDRANT_SEARCH_OVERSAMPLING:
+            params["quantization"] = {"rescore": True, "oversampling": settings.QDRANT_SEARCH_OVERSAMPLING}
+        if params:
+            search_payload["params"] = params
+        return search_url, search_payload
+
+    def search(self, user_id, query_vector, limit):
+        url, payload = self._request(user_id, query_vector, limit)
+        resp = requests.post(url, json=payload, timeout=10)
+        resp.raise_for_status()
+        return resp.json().get("result", [])
+
+    async def asearch(self, user_id, query_vector, limit):
+        url, payload = self._request(user_id, query_vector, limit)
+        resp = await get_async_client().post(url, json=payload, timeout=10)
+        resp.raise_for_status()
+        return resp.json().get("result", [])
+
+
+class _UserMatrix:
+    __slots__ = ("ids", "payloads", "matrix", "loaded_at", "version")
+
+    def __init__(self, ids, payloads, matrix, version=0):
+        self.ids = ids
+        self.payloads = payloads
+        self.matrix = matrix
+        self.loaded_at = time.monotonic()
+        self.version = version
+
+
+class LocalRetrievalBackend:
+    """
+    Exact cosine search over a per-user float32 matrix held in process memory.
+
+    Matrices are built lazily from ReceiptEmbedding rows and kept in an LRU
+    of at most LOCAL_INDEX_MAX_USERS users. Each search compares the
+    matrix's data version with the user's answer version in the shared
+    cache, which every receipt or embedding write bumps on commit (see
+    receipts.signals), so a write in any process is seen by the next search
+    everywhere. LOCAL_INDEX_TTL_SECONDS only backs up a lost bump. A
+    per-user generation, bumped on every in-process invalidation, keeps a
+    load that raced an invalidation out of the cache.
+    """
+
+    name = "local"
+
+    def __init__(self, max_users=None, ttl_seconds=None):
+        self.max_users = max_users or settings.LOCAL_INDEX_MAX_USERS
+        self.ttl_seconds = ttl_seconds or settings.LOCAL_INDEX_TTL_SECONDS
+        self._cache = OrderedDict()
+        self._generations = {}  # user id -> invalidation count
+        self._lock = threading.Lock()
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._cache.pop(user_id, None)
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            # Fresh objects: loads still holding the old ones won't match
+            self._generations = {}
+
+    def _load(self, user_id, version=0):
+        rows = list(
+            ReceiptEmbedding.objects.filter(user_id=user_id)
+            .order_by("receipt_id", "chunk_index")
+            .values_list("id", "receipt_id", "chunk_index", "chunk_type", "content", "vector")
+        )
+
+        ids = []
+        payloads = []
+        vectors = []
+        for pk, receipt_id, chunk_index, chunk_type, content, vector in rows:
+            ids.append(pk)
+            payloads.append({
+                "user_id": user_id,
+                "receipt_id": receipt_id,
+                "chunk_index": chunk_index,
+                "chunk_type": chunk_type,
+                "content": content,
+            })
+            vectors.append(bytes_to_vector(vector))
+
+        if vectors:
+            matrix = np.vstack(vectors)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            matrix = matrix / norms
+        else:
+            matrix = np.empty((0, 0), dtype=np.float32)
+
+        return _UserMatrix(ids, payloads, matrix, version)
+
+    def _get(self, user_id):
+        # Read before loading: a write committing mid-load bumps it again
+        version = get_answer_version(user_id)
+        with self._lock:
+            entry = self._cache.get(user_id)
+            if (
+                entry is not None
+                and entry.version == version
+                and time.monotonic() - entry.loaded_at < self.ttl_seconds
+            ):
+                self._cache.move_to_end(user_id)
+                return entry
+            generations = self._generations
+            generation = generations.get(user_id, 0)
+
+        # Load outside the lock; a concurrent load for the same user just
+        # wins or loses the race below.
+        entry = self._load(user_id, version)
+
+        with self._lock:
+            if self._generations is not generations or generations.get(user_id, 0) != generation:
+                # Invalidated mid-load: answer this search, but don't cache
+                # what may predate the change
+                return entry
+            self._cache[user_id] = entry
+            self._cache.move_to_end(user_id)
+            while len(self._cache) > self.max_users:
+                self._cache.popitem(last=False)
+
+        return entry
+
+    def search(self, user_id, query_vector, limit):
+        entry = self._get(user_id)
+        if not entry.ids:
+            return []
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        if query.shape[0] != entry.matrix.shape[1]:
+            raise ValueError(
+                f"query dimension {query.shape[0]} does not match index dimension {entry.matrix.shape[1]}"
+            )
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        scores = entry.matrix @ query
+        k = min(limit, scores.shape[0])
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        return [
+            {"id": entry.ids[i], "score": float(scores[i]), "payload": entry.payloads[i]}
+            for i in top
+        ]
+
+    async def asearch(self, user_id, query_vector, limit):
+        # Cache misses hit the ORM, so run the whole search off the event loop.
+        return await sync_to_async(self.search)(user_id, query_vector, limit)
+
+
+_BACKENDS = {
+    QdrantRetrievalBackend.name: QdrantRetrievalBackend,
+    LocalRetrievalBackend.name: LocalRetrievalBackend,
+}
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def get_retrieval_backend(name=None):
+    name = name or settings.RETRIEVAL_BACKEND
+    with _instances_lock:
+        if name not in _instances:
+            try:
+                _instances[name] = _BACKENDS[name]()
+            except KeyError:
+                raise ValueError(f"Unknown RETRIEVAL_BACKEND {name!r}") from None
+        return _instances[name]
+
+
+def invalidate_user(user_id):
+    backend = _instances.get(LocalRetrievalBackend.name)
+    if backend is not None:
+        backend.invalidate(user_id)
+
+
+def embedding_rows(points):
+    """ReceiptEmbedding rows for Qdrant points (with payload and vector) of receipts that exist."""
+    receipt_ids = {p["payload"].get("receipt_id") for p in points if p.get("payload")}
+    known = set(Receipt.objects.filter(id__in=receipt_ids).values_list("id", flat=True))
+    rows = []
+    for p in points:
+        payload = p.get("payload") or {}
+        if payload.get("receipt_id") not in known:
+            continue
+        rows.append(ReceiptEmbedding(
+            receipt_id=payload["receipt_id"],
+            user_id=payload["user_id"],
+            chunk_index=payload.get("chunk_index", 0),
+            chunk_type=payload.get("chunk_type") or "",
+            content=payload.get("content") or "",
+            content_hash=payload.get("chunk_hash") or "",
+            vector=vector_to_bytes(p["vector"]),
+        ))
+    return rows
+
+
+def save_embedding_rows(rows):
+    from .signals import receipts_changed
+
+    ReceiptEmbedding.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=["receipt", "chunk_index"],
+        update_fields=["chunk_type", "content", "content_hash", "vector", "updated_at"],
+    )
+    # bulk writes skip the signals; every process reloads on the new version
+    user_ids = {row.user_id for row in rows}
+    if user_ids:
+        transaction.on_commit(lambda: receipts_changed(user_ids))
+
+
+def mirror_receipts(receipt_ids, page_size=256):
+    """
+    Replace the ReceiptEmbedding rows of ``receipt_ids`` with their Qdrant
+    points. n8n indexes straight into Qdrant, so this is what makes its
+    receipts searchable with the local backend.
+    """
+    receipt_ids = list(receipt_ids)
+    points, offset = [], None
+    while True:
+        body = {
+            "limit": page_size,
+            "with_payload": True,
+            "with_vector": True,
+            "filter": {"must": [{"key": "receipt_id", "match": {"any": receipt_ids}}]},
+        }
+        if offset is not None:
+            body["offset"] = offset
+        page, offset = qdrant.scroll(body)
+        points.extend(page)
+        if offset is None:
+            break
+
+    rows = embedding_rows(points)
+    with transaction.atomic():
+        ReceiptEmbedding.objects.filter(receipt_id__in=receipt_ids).delete()
+        save_embedding_rows(rows)
+    return len(rows)
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Receipt
+from .models import Receipt, ReceiptContent
 
 class ReceiptListSerializer(serializers.ModelSerializer):
     class Meta:
@@ -7,7 +7,85 @@ class ReceiptListSerializer(serializers.ModelSerializer):
         fields = ("id", "merchant_name", "total_amount", "purchase_date", "status", "created_at")
 
 class ReceiptDetailSerializer(serializers.ModelSerializer):
+    """
+    Receipt plus its ReceiptContent side-table fields. ``ocr_text`` and
+    ``raw_extracted_json`` are only read back when the serializer context
+    has ``include_content=True``; they can always be written.
+    """
+
+    ocr_text = serializers.CharField(required=False, allow_null=True, allow_blank=True, write_only=True)
+    raw_extracted_json = serializers.JSONField(required=False, allow_null=True, write_only=True)
+
     class Meta:
         model = Receipt
         fields = "__all__"
-        read_only_fields = ("user", "created_at", "updated_at")
+        read_only_fields = ("user", "content_sha256", "duplicate_of", "created_at", "updated_at")
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if self.context.get("include_content"):
+            content = getattr(instance, "content", None)
+            data["ocr_text"] = content.ocr_text if content else None
+            data["raw_extracted_json"] = content.raw_extracted_json if content else None
+        return data
+
+    def update(self, instance, validated_data):
+        content = {name: validated_data.pop(name) for name in ReceiptContent.CONTENT_FIELDS if name in validated_data}
+        instance = super().update(instance, validated_data)
+        if content:
+            ReceiptContent.bulk_upsert({instance.id: content}, list(content))
+            instance._state.fields_cache.pop("content", None)
+        return instance
+
+class ReceiptBulkUpdateItemSerializer(serializers.ModelSerializer):
+    """One partial update in a pipeline bulk-update request; unknown keys are ignored."""
+
+    id = serializers.IntegerField()
+    ocr_text = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+    raw_extracted_json = serializers.JSONField(required=False, allow_null=True)
+
+    class Meta:
+        model = Receipt
+        fields = (
+            "id",
+            "status",
+            "ocr_text",
+            "merchant_name",
+            "total_amount",
+            "currency",
+            "purchase_date",
+            "raw_extracted_json",
+        )
+        extra_kwargs = {
+            name: {"required": False}
+            for name in fields
+            if name not in ("id", *ReceiptContent.CONTENT_FIELDS)
+        }
+
+class ReceiptExportParamsSerializer(serializers.Serializer):
+    """Query parameters of GET /receipts/export/."""
+
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    # Comma-separated, e.g. status=READY,FAILED
+    status = serializers.CharField(required=False)
+    merchant = serializers.CharField(required=False, max_length=255)
+    include = serializers.CharField(required=False, default="")
+    gzip = serializers.BooleanField(required=False, default=False)
+
+    def validate_status(self, value):
+        statuses = [s.strip().upper() for s in value.split(",") if s.strip()]
+        allowed = {choice for choice, _ in Receipt.STATUS_CHOICES}
+        unknown = sorted(set(statuses) - allowed)
+        if unknown:
+            raise serializers.ValidationError(f"unknown status: {', '.join(unknown)}")
+        return statuses
+
+    def validate_include(self, value):
+        return "content" in value.split(",")
+
+    def validate(self, attrs):
+        date_from, date_to = attrs.get("date_from"), attrs.get("date_to")
+        if date_from and date_to and date_from > date_to:
+            raise serializers.ValidationError("date_from must not be after date_to")
+        return attrs
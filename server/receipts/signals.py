@@ -0,0 +1,41 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import events
+from .answers import bump_answer_version
+from .models import Receipt, ReceiptEmbedding
+from .retrieval import invalidate_user
+
+
+@receiver(post_save, sender=Receipt)
+@receiver(post_delete, sender=Receipt)
+@receiver(post_save, sender=ReceiptEmbedding)
+@receiver(post_delete, sender=ReceiptEmbedding)
+def drop_cached_user_index(sender, instance, **kwargs):
+    # After commit: a process reloading on the new version must see the write
+    user_id = instance.user_id
+    transaction.on_commit(lambda: receipts_changed([user_id]))
+
+
+@receiver(post_save, sender=Receipt)
+def record_receipt_event(sender, instance, **kwargs):
+    events.record([instance])
+
+
+@receiver(post_delete, sender=Receipt)
+def record_receipt_deleted(sender, instance, origin=None, **kwargs):
+    # Deleting the user cascades to the receipts and their events; nobody is left to tell
+    if isinstance(origin, Receipt) or getattr(origin, "model", None) is Receipt:
+        events.record_deleted(instance)
+
+
+def receipts_changed(user_ids):
+    """
+    Drop per-user caches; call on commit of bulk writes that skip signals.
+    The answer version lives in the shared cache, so other processes'
+    local indexes see the bump on their next search.
+    """
+    for user_id in user_ids:
+        invalidate_user(user_id)
+        bump_answer_version(user_id)
@@ -0,0 +1,91 @@
+"""
+Single-flight coalescing of identical in-flight calls.
+
+Concurrent callers with the same key share one execution: the first one
+becomes the leader and runs the coroutine, the others await its result.
+The result travels through a concurrent.futures.Future, so callers on
+different event loops (runserver/WSGI runs one loop per request) can
+share it too.
+
+Leaders also count against a per-user cap on concurrent executions;
+followers are free since they cost no upstream calls. Both are per
+process, like the other in-memory caches here.
+"""
+
+import asyncio
+import concurrent.futures
+import threading
+
+
+class UserLimitExceeded(Exception):
+    pass
+
+
+class _LeaderCancelled(Exception):
+    """The leader was cancelled (deadline, disconnect) before it had a result."""
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        self._active = {}  # user id -> running leaders
+        self._lock = threading.Lock()
+
+    def _join_or_lead(self, key, user_id, limit):
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            if limit and self._active.get(user_id, 0) >= limit:
+                raise UserLimitExceeded(user_id)
+            future = concurrent.futures.Future()
+            self._calls[key] = future
+            self._active[user_id] = self._active.get(user_id, 0) + 1
+            return future, True
+
+    def _release(self, key, user_id):
+        with self._lock:
+            self._calls.pop(key, None)
+            remaining = self._active.get(user_id, 0) - 1
+            if remaining > 0:
+                self._active[user_id] = remaining
+            else:
+                self._active.pop(user_id, None)
+
+    async def run(self, key, user_id, fn, limit=0):
+        """
+        Await ``fn()`` once per ``key`` across concurrent callers. Returns
+        ``(result, shared)``; ``shared`` is True for callers that waited on
+        another caller's execution. Raises UserLimitExceeded when
+        ``user_id`` already has ``limit`` executions running (0: no cap).
+        """
+        while True:
+            future, leader = self._join_or_lead(key, user_id, limit)
+            if not leader:
+                try:
+                    # shield: a cancelled follower must not cancel the shared future
+                    return await asyncio.shield(asyncio.wrap_future(future)), True
+                except _LeaderCancelled:
+                    # Take over (or join whoever did) within our own deadline
+                    continue
+
+            try:
+                result = await fn()
+            except asyncio.CancelledError:
+                future.set_exception(_LeaderCancelled())
+                raise
+            except BaseException as e:
+                future.set_exception(e)
+                raise
+            else:
+                future.set_result(result)
+                return result, False
+            finally:
+                self._release(key, user_id)
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+
+ai_queries = SingleFlight()
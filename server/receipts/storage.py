@@ -0,0 +1,171 @@
+"""
+Receipt file storage.
+
+Uploads go straight from the browser to a signed PUT URL and views use a
+signed GET URL, whichever backend is configured (STORAGE_BACKEND):
+
+- ``gcs``: Google Cloud Storage V4 signed URLs (the original setup).
+- ``local``: files under LOCAL_STORAGE_ROOT, served by LocalFileView
+  through signed, expiring Django URLs. Workers on the same machine read
+  the files from disk instead of downloading them.
+"""
+
+import io
+import mimetypes
+import os
+import re
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from django.urls import reverse
+
+SIGNING_SALT = "receipts.storage"
+
+
+# Served inline from the API origin: anything that can run script (HTML,
+# SVG, XML, ...) must not be on this list
+INLINE_CONTENT_TYPES = ("image/png", "image/jpeg", "image/gif", "image/webp", "image/heic", "image/tiff", "application/pdf")
+
+_UNSAFE_FILENAME_CHARS = re.compile(r"[^\w.\- ]")
+
+
+class ObjectNotFound(Exception):
+    pass
+
+
+def safe_filename(name, max_length=128):
+    """Basename of a client-supplied filename, safe to embed in an object key."""
+    name = str(name).replace("\\", "/").rsplit("/", 1)[-1]
+    name = _UNSAFE_FILENAME_CHARS.sub("_", name).strip(" .")
+    return name[-max_length:] or "upload"
+
+
+def _check_key(key):
+    # Keys are "<user>/<receipt>/<name>": relative, no empty, "." or ".." segments
+    if not key or key.startswith("/") or "\\" in key or "\x00" in key:
+        raise ObjectNotFound(key)
+    if any(part in ("", ".", "..") for part in key.split("/")):
+        raise ObjectNotFound(key)
+
+
+class GCSStorage:
+    name = "gcs"
+
+    def __init__(self):
+        from google.cloud import storage
+
+        self._bucket = storage.Client().bucket(settings.GCS_BUCKET_NAME)
+
+    def _signed_url(self, key, method, **kwargs):
+        return self._bucket.blob(key).generate_signed_url(
+            version="v4",
+            expiration=timedelta(seconds=settings.SIGNED_URL_EXPIRY_SECONDS),
+            method=method,
+            **kwargs,
+        )
+
+    def upload_url(self, key, content_type):
+        return self._signed_url(key, "PUT", content_type=content_type)
+
+    def download_url(self, key):
+        return self._signed_url(key, "GET")
+
+    def write(self, key, data, content_type):
+        self._bucket.blob(key).upload_from_string(data, content_type=content_type)
+
+    def read(self, key):
+        from google.api_core.exceptions import NotFound
+
+        try:
+            return self._bucket.blob(key).download_as_bytes()
+        except NotFound:
+            raise ObjectNotFound(key)
+
+    def local_path(self, key):
+        return None
+
+
+class LocalStorage:
+    name = "local"
+
+    def __init__(self, root=None):
+        self.root = Path(root or settings.LOCAL_STORAGE_ROOT).resolve()
+
+    def local_path(self, key):
+        _check_key(key)
+        path = (self.root / key).resolve()
+        # Symlinks could still point elsewhere; never let a key escape the root
+        if not path.is_relative_to(self.root) or path == self.root:
+            raise ObjectNotFound(key)
+        return path
+
+    def _signed_url(self, key, method):
+        token = signing.dumps([method, key], salt=SIGNING_SALT, compress=True)
+        path = reverse("receipt-file", kwargs={"token": token})
+        return f"{settings.PUBLIC_BASE_URL.rstrip('/')}{path}"
+
+    def upload_url(self, key, content_type):
+        return self._signed_url(key, "PUT")
+
+    def download_url(self, key):
+        return self._signed_url(key, "GET")
+
+    def read(self, key):
+        try:
+            return self.local_path(key).read_bytes()
+        except FileNotFoundError:
+            raise ObjectNotFound(key)
+
+    def write(self, key, data, content_type):
+        self.save(key, io.BytesIO(data))
+
+    def save(self, key, stream, chunk_size=64 * 1024):
+        """Write ``stream`` to ``key`` atomically; returns the byte count."""
+        path = self.local_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".upload-")
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as f:
+                while chunk := stream.read(chunk_size):
+                    size += len(chunk)
+                    if size > settings.LOCAL_STORAGE_MAX_UPLOAD_BYTES:
+                        raise ValueError("upload too large")
+                    f.write(chunk)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        return size
+
+    @staticmethod
+    def content_type(path):
+        """Content type to serve ``path`` with; None unless it is safe to show inline."""
+        content_type = mimetypes.guess_type(path.name)[0]
+        return content_type if content_type in INLINE_CONTENT_TYPES else None
+
+
+def verify_token(token, method):
+    """Key of a signed local-storage URL, or None if invalid, expired or for another method."""
+    try:
+        signed_method, key = signing.loads(
+            token,
+            salt=SIGNING_SALT,
+            max_age=settings.SIGNED_URL_EXPIRY_SECONDS,
+        )
+    except (signing.BadSignature, ValueError):
+        return None
+    return key if signed_method == method else None
+
+
+_storage = None
+
+
+def get_storage():
+    global _storage
+    if _storage is None or _storage.name != settings.STORAGE_BACKEND:
+        _storage = LocalStorage() if settings.STORAGE_BACKEND == "local" else GCSStorage()
+    return _storage
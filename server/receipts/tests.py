@@ -0,0 +1,423 @@
+import hashlib
+import tempfile
+from concurrent.futures import Future
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from rest_framework.test import APIClient
+
+from . import events, ingestion
+from .answers import bump_answer_version
+from .storage import get_storage
+from .models import IngestionJob, Receipt, ReceiptContent, ReceiptEmbedding, ReceiptEvent, ReindexCheckpoint
+from .pipeline import heuristic_fields, process_job
+from .retrieval import LocalRetrievalBackend
+
+
+class RecordingBatcher:
+    """Stands in for EmbeddingBatcher: records the texts sent for embedding."""
+
+    collection = "receipts"
+
+    def __init__(self):
+        self.texts = []
+
+    def submit(self, ids, texts, payloads):
+        self.texts.extend(texts)
+        future = Future()
+        future.set_result([[float(len(text)), 1.0, 0.0] for text in texts])
+        return future
+
+
+OCR_LINES = [f"ITEM {n:03d} GROCERIES AND HOUSEHOLD SUPPLIES {n * 7}.00" for n in range(60)]
+
+
+@override_settings(INGESTION_BACKEND="native", CHUNK_MAX_TOKENS=64, N8N_SECRET="secret")
+@mock.patch("receipts.pipeline.qdrant.batch_update")
+class ReindexTests(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_user(email="reindex@example.com", password="x")
+        self.receipt = Receipt.objects.create(
+            user=user, file_key="k", status="READY", merchant_name="AMAZON", total_amount="12.50",
+        )
+        ReceiptContent.bulk_upsert({self.receipt.id: {"ocr_text": "\n".join(OCR_LINES)}}, ["ocr_text"])
+
+    def run_reindex(self):
+        ingestion.enqueue_reindex([self.receipt.id])
+        jobs = ingestion.claim_jobs("test-worker", 10)
+        self.assertEqual([job.kind for job in jobs], ["reindex"])
+        batcher = RecordingBatcher()
+        process_job(jobs[0], None, batcher)
+        return batcher.texts
+
+    def test_only_edited_chunk_is_re_embedded(self, batch_update):
+        first = self.run_reindex()
+        chunk_count = ReceiptEmbedding.objects.filter(receipt=self.receipt).count()
+        self.assertGreater(chunk_count, 2)
+        self.assertEqual(len(first), chunk_count)
+
+        # Past the summary's OCR snippet, so only one full-text chunk changes
+        lines = list(OCR_LINES)
+        lines[-1] = "TOTAL 9999.00"
+        response = self.client.patch(
+            f"/receipts/{self.receipt.id}/",
+            {"ocr_text": "\n".join(lines)},
+            content_type="application/json",
+            HTTP_X_N8N_SECRET="secret",
+        )
+        self.assertEqual(response.status_code, 200)
+
+        second = self.run_reindex()
+        self.assertEqual(len(second), 1)
+        self.assertIn("TOTAL 9999.00", second[0])
+        self.assertEqual(self.receipt.ingestion_jobs.filter(status="DONE").count(), 2)
+        self.receipt.refresh_from_db()
+        self.assertEqual(self.receipt.status, "READY")
+
+    def test_retry_reuses_vectors_embedded_before_the_failure(self, batch_update):
+        ingestion.enqueue_reindex([self.receipt.id])
+        job = ingestion.claim_jobs("test-worker", 1)[0]
+        batcher = RecordingBatcher()
+        with mock.patch("receipts.pipeline.ingestion.mark_done", side_effect=RuntimeError("crash")):
+            with self.assertRaises(RuntimeError):
+                process_job(job, None, batcher)
+        self.assertTrue(batcher.texts)
+
+        IngestionJob.objects.filter(id=job.id).delete()
+        self.assertEqual(self.run_reindex(), [])
+
+    def test_edit_during_a_running_job_runs_it_again(self, batch_update):
+        self.run_reindex()
+        ingestion.enqueue_reindex([self.receipt.id])
+        job = ingestion.claim_jobs("test-worker", 1)[0]
+        set_stage = ingestion.set_stage
+
+        def edited_meanwhile(job, stage):
+            # The job has read the receipt; a callback edits it now
+            response = self.client.patch(
+                f"/receipts/{self.receipt.id}/",
+                {"merchant_name": "AMAZON FRESH"},
+                content_type="application/json",
+                HTTP_X_N8N_SECRET="secret",
+            )
+            self.assertEqual(response.status_code, 200)
+            set_stage(job, stage)
+
+        batcher = RecordingBatcher()
+        with mock.patch("receipts.pipeline.ingestion.set_stage", side_effect=edited_meanwhile):
+            process_job(job, None, batcher)
+        self.assertFalse(any("AMAZON FRESH" in text for text in batcher.texts))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.kind, job.rerun), ("QUEUED", "reindex", False))
+
+        texts = self.run_reindex()
+        self.assertTrue(any("AMAZON FRESH" in text for text in texts))
+        job.refresh_from_db()
+        self.assertEqual(job.status, "DONE")
+
+    def test_status_only_callback_does_not_reindex(self, batch_update):
+        response = self.client.post(
+            "/receipts/bulk-update/",
+            {"updates": [{"id": self.receipt.id, "status": "READY"}]},
+            content_type="application/json",
+            HTTP_X_N8N_SECRET="secret",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(IngestionJob.objects.exists())
+
+
+class LocalRetrievalTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email="local@example.com", password="x")
+        self.receipt = Receipt.objects.create(user=self.user, file_key="k", status="PROCESSING")
+
+    def test_invalidation_during_load_is_not_lost(self):
+        backend = LocalRetrievalBackend(max_users=4, ttl_seconds=300)
+        load = backend._load
+
+        def load_racing_a_write(user_id, version):
+            entry = load(user_id, version)
+            backend.invalidate(user_id)
+            return entry
+
+        with mock.patch.object(backend, "_load", side_effect=load_racing_a_write):
+            backend._get(self.user.id)
+        self.assertNotIn(self.user.id, backend._cache)
+
+        backend._get(self.user.id)
+        self.assertIn(self.user.id, backend._cache)
+
+    def test_write_in_another_process_reloads_the_index(self):
+        backend = LocalRetrievalBackend(max_users=4, ttl_seconds=300)
+        first = backend._get(self.user.id)
+        self.assertIs(backend._get(self.user.id), first)
+        # What receipts_changed does in the writing process, minus the local invalidation
+        bump_answer_version(self.user.id)
+        self.assertIsNot(backend._get(self.user.id), first)
+
+    @override_settings(RETRIEVAL_BACKEND="local", INGESTION_BACKEND="n8n", N8N_SECRET="secret")
+    @mock.patch("receipts.retrieval.qdrant.scroll")
+    def test_n8n_ready_callback_mirrors_points(self, scroll):
+        scroll.return_value = ([
+            {"id": "p0", "vector": [1.0, 0.0], "payload": {
+                "user_id": self.user.id, "receipt_id": self.receipt.id, "chunk_index": 0, "content": "Receipt from AMAZON",
+            }},
+        ], None)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f"/receipts/{self.receipt.id}/",
+                {"status": "READY", "merchant_name": "AMAZON"},
+                content_type="application/json",
+                HTTP_X_N8N_SECRET="secret",
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            list(ReceiptEmbedding.objects.filter(receipt=self.receipt).values_list("content", flat=True)),
+            ["Receipt from AMAZON"],
+        )
+
+
+@override_settings(INGESTION_LEASE_SECONDS=60, INGESTION_MAX_ATTEMPTS=1)
+class LeaseTests(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_user(email="lease@example.com", password="x")
+        self.receipt = Receipt.objects.create(user=user, file_key="k", status="UPLOADED")
+        ingestion.enqueue([self.receipt.id])
+
+    def expire_leases(self):
+        IngestionJob.objects.update(locked_at=timezone.now() - timedelta(minutes=5))
+
+    def test_reclaimed_job_cannot_be_completed_by_the_old_worker(self):
+        stale = ingestion.claim_jobs("worker-a", 1)[0]
+        self.expire_leases()
+        current = ingestion.claim_jobs("worker-b", 1)[0]
+
+        with self.assertRaises(ingestion.LeaseLost):
+            ingestion.mark_done(stale)
+        ingestion.mark_failed(stale, RuntimeError("late"), permanent=True)
+        job = IngestionJob.objects.get(id=current.id)
+        self.assertEqual((job.status, job.locked_by), ("RUNNING", "worker-b"))
+
+        ingestion.mark_done(current)
+        self.assertEqual(IngestionJob.objects.get(id=current.id).status, "DONE")
+
+    def test_same_worker_reclaim_invalidates_the_earlier_claim(self):
+        stale = ingestion.claim_jobs("worker-a", 1)[0]
+        self.expire_leases()
+        ingestion.claim_jobs("worker-a", 1)
+        with self.assertRaises(ingestion.LeaseLost):
+            ingestion.mark_done(stale)
+
+    def test_entering_a_stage_renews_the_lease(self):
+        job = ingestion.claim_jobs("worker-a", 1)[0]
+        self.expire_leases()
+        ingestion.set_stage(job, "ocr")
+        self.assertEqual(ingestion.claim_jobs("worker-b", 1), [])
+
+        self.expire_leases()
+        ingestion.claim_jobs("worker-b", 1)
+        with self.assertRaises(ingestion.LeaseLost):
+            ingestion.set_stage(job, "extract")
+
+    def test_dead_letter_fails_uploaded_receipt(self):
+        job = ingestion.claim_jobs("worker-a", 1)[0]
+        ingestion.mark_failed(job, RuntimeError("ocr down"))
+        self.assertEqual(IngestionJob.objects.get(id=job.id).status, "DEAD")
+        self.receipt.refresh_from_db()
+        self.assertEqual(self.receipt.status, "FAILED")
+
+
+@override_settings(STORAGE_BACKEND="local")
+class ReceiptEventTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email="events@example.com", password="x")
+
+    def test_upload_init_emits_one_event_per_receipt(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(
+                "/receipts/upload/",
+                {"files": [{"filename": "a.jpg"}, {"filename": "b.jpg"}]},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 200)
+
+        changes = events.fetch(self.user.id, 0)
+        self.assertEqual(len(changes), 2)
+        uploads = response.json()["uploads"]
+        self.assertEqual([e["receipt_id"] for e in changes], [u["receipt_id"] for u in uploads])
+
+    def test_saves_then_delete_in_one_transaction_emit_one_deletion(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            receipt = Receipt.objects.create(user=self.user, file_key="k", status="READY")
+        with self.captureOnCommitCallbacks(execute=True):
+            receipt.merchant_name = "AMAZON"
+            receipt.save()
+            receipt.delete()
+
+        changes = events.fetch(self.user.id, 0)
+        self.assertEqual([e["kind"] for e in changes], ["updated", "deleted"])
+        self.assertEqual(events.fetch(self.user.id, changes[0]["id"]), changes[1:])
+
+    def test_change_after_a_rolled_back_savepoint_emits_an_event(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(ValueError), transaction.atomic():
+                Receipt.objects.create(user=self.user, file_key="rolled-back")
+                raise ValueError
+            kept = Receipt.objects.create(user=self.user, file_key="kept")
+
+        self.assertEqual([e["receipt_id"] for e in events.fetch(self.user.id, 0)], [kept.id])
+
+    def test_nothing_is_written_before_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            Receipt.objects.create(user=self.user, file_key="k")
+        self.assertFalse(ReceiptEvent.objects.exists())
+        for callback in callbacks:
+            callback()
+        self.assertEqual(ReceiptEvent.objects.count(), 1)
+
+
+@override_settings(STORAGE_BACKEND="local", INGESTION_BACKEND="n8n", N8N_WEBHOOK_URL="")
+class DuplicateUploadTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email="dedup@example.com", password="x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.enterContext(override_settings(LOCAL_STORAGE_ROOT=root.name))
+        self.data = b"receipt image bytes"
+        self.sha256 = hashlib.sha256(self.data).hexdigest()
+
+    def init(self):
+        response = self.client.post(
+            "/receipts/upload/", {"files": [{"filename": "r.jpg", "sha256": self.sha256}]}, format="json",
+        )
+        return response.json()["uploads"][0]
+
+    def complete(self, upload, data):
+        get_storage().write(upload["object_name"], data, "image/jpeg")
+        self.client.post("/receipts/complete/", {"receipt_ids": [upload["receipt_id"]]}, format="json")
+        return Receipt.objects.get(id=upload["receipt_id"])
+
+    def test_unfinished_upload_is_not_an_original(self):
+        first = self.init()
+        second = self.init()
+        self.assertIsNotNone(second["upload_url"])
+        self.assertIsNone(second["duplicate_of"])
+        self.assertIsNone(Receipt.objects.get(id=first["receipt_id"]).content_sha256)
+
+        self.assertEqual(self.complete(second, self.data).status, "UPLOADED")
+        third = self.init()
+        self.assertEqual(third["duplicate_of"], second["receipt_id"])
+
+    def test_hash_comes_from_the_stored_object(self):
+        # The client claims one hash but uploads other bytes
+        receipt = self.complete(self.init(), b"something else")
+        self.assertEqual(receipt.content_sha256, hashlib.sha256(b"something else").hexdigest())
+        self.assertIsNone(self.init()["duplicate_of"])
+
+    def test_same_bytes_uploaded_again_are_linked_at_complete(self):
+        original = self.complete(self.init(), self.data)
+        upload = self.client.post("/receipts/upload/", {"files": [{"filename": "r.jpg"}]}, format="json").json()["uploads"][0]
+        duplicate = self.complete(upload, self.data)
+        self.assertEqual(duplicate.duplicate_of_id, original.id)
+        self.assertEqual(duplicate.status, "PENDING")
+
+
+@override_settings(STORAGE_BACKEND="local", LOCAL_STORAGE_MAX_UPLOAD_BYTES=1024)
+class LocalFileUploadTests(TestCase):
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.enterContext(override_settings(LOCAL_STORAGE_ROOT=root.name))
+        self.url = get_storage().upload_url("1/upload/r.jpg", "image/jpeg")
+
+    def put(self, length):
+        return self.client.put(self.url, b"receipt", content_type="image/jpeg", CONTENT_LENGTH=length)
+
+    def test_bad_content_length_is_rejected(self):
+        for length in ("abc", "-1", "1e3"):
+            with self.subTest(length=length):
+                self.assertEqual(self.put(length).status_code, 400)
+        self.assertEqual(self.put("2048").status_code, 413)
+        self.assertEqual(self.put("7").status_code, 200)
+
+
+@mock.patch("receipts.embedding.embed_texts_sync", side_effect=lambda texts, model=None: [[1.0, 0.0]] * len(texts))
+@mock.patch("receipts.embedding.upsert_points")
+@mock.patch.multiple(
+    "receipts.management.commands.reindex_receipts.qdrant",
+    list_aliases=mock.Mock(return_value={"receipts": "receipts_v1"}),
+    get_collection=mock.Mock(return_value={"status": "green", "points_count": 0}),
+    upsert_points=mock.DEFAULT,
+    batch_update=mock.DEFAULT,
+    switch_alias=mock.DEFAULT,
+)
+class ReindexCommandTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email="reindex-cmd@example.com", password="x")
+        self.receipts = [
+            Receipt.objects.create(user=self.user, file_key=f"k{n}", status="READY", merchant_name=f"SHOP {n}")
+            for n in range(3)
+        ]
+
+    def reindex(self):
+        call_command("reindex_receipts", "receipts_v2", "--alias", "receipts", "--embed-model", "m", stdout=mock.Mock())
+
+    def test_backfill_is_applied_before_the_switch(self, batched_upserts, embed, **qdrant):
+        calls = []
+        qdrant["upsert_points"].side_effect = lambda *a, **k: calls.append(("upsert", k["wait"]))
+        qdrant["switch_alias"].side_effect = lambda *a: calls.append(("switch",))
+        self.reindex()
+        self.assertTrue(batched_upserts.call_args_list)
+        self.assertFalse(any(call.kwargs["wait"] for call in batched_upserts.call_args_list))
+        self.assertEqual(calls[-2:], [("upsert", True), ("switch",)])
+
+    def test_receipts_changed_during_the_backfill_are_copied_again(self, batched_upserts, embed, **qdrant):
+        with mock.patch(
+            "receipts.management.commands.reindex_receipts.Command._catch_up"
+        ):
+            call_command("reindex_receipts", "receipts_v2", "--alias", "receipts", "--embed-model", "m", "--no-switch", stdout=mock.Mock())
+        ReindexCheckpoint.objects.update(started_at=timezone.now() - timedelta(hours=1))
+        Receipt.objects.filter(id=self.receipts[0].id).update(updated_at=timezone.now() - timedelta(hours=2))
+        Receipt.objects.filter(id=self.receipts[2].id).update(updated_at=timezone.now() - timedelta(hours=2))
+        edited = self.receipts[1]
+        edited.merchant_name = "EDITED"
+        edited.save()
+        ReceiptEvent.objects.create(user=self.user, receipt_id=999, kind="deleted", data={"id": 999})
+        batched_upserts.reset_mock()
+
+        self.reindex()
+        deleted = qdrant["batch_update"].call_args_list[0].args[0][0]["delete"]["filter"]["must"][0]["match"]["any"]
+        self.assertEqual(sorted(deleted), [edited.id, 999])
+        copied = {p["payload"]["receipt_id"] for call in batched_upserts.call_args_list for p in call.args[0]}
+        self.assertEqual(copied, {edited.id})
+        qdrant["switch_alias"].assert_called_once_with("receipts", "receipts_v2")
+
+
+@override_settings(INGESTION_HEURISTIC_MIN_CONFIDENCE=0.8)
+class HeuristicFieldsTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email="heuristic@example.com", password="x")
+        self.candidates = {
+            "merchant_name": {"value": "BIG BAZAAR", "confidence": 0.665},
+            "total_amount": {"value": "120.00", "confidence": 0.9},
+            "purchase_date": {"value": "2025-02-13", "confidence": 0.9},
+        }
+
+    def test_weak_merchant_needs_the_llm(self):
+        self.assertIsNone(heuristic_fields(self.candidates, self.user.id))
+
+    def test_known_merchant_is_trusted(self):
+        Receipt.objects.create(user=self.user, file_key="k", status="READY", merchant_name="Big Bazaar")
+        fields, extracted = heuristic_fields(self.candidates, self.user.id)
+        self.assertEqual(fields["merchant_name"], "BIG BAZAAR")
+        self.assertEqual(extracted["source"], "ocr_heuristics")
@@ -0,0 +1,114 @@
+"""
+Low-overhead request tracing.
+
+Every trace times its spans with perf_counter and feeds the per-stage
+latency histograms in receipts.metrics. Only a sampled fraction of traces
+(TRACE_SAMPLE_RATE), plus any trace slower than TRACE_SLOW_MS or marked as
+failed, is written to the log. Attributes may be passed as zero-argument
+callables; they are evaluated only when the trace is actually logged.
+
+    trace = start_trace("ai_query", user_id=lambda: request.user.id)
+    with trace.span("embed") as span:
+        vector = await embed_text(question)
+        span.set(vector_len=lambda: len(vector))
+    trace.finish(status=200)
+"""
+
+import logging
+import random
+import time
+
+from django.conf import settings
+
+from . import metrics
+
+logger = logging.getLogger("receipts.tracing")
+
+
+def _resolve(attrs):
+    out = {}
+    for key, value in attrs.items():
+        if callable(value):
+            try:
+                value = value()
+            except Exception as e:
+                value = f"<error: {e}>"
+        out[key] = value
+    return out
+
+
+class Span:
+    __slots__ = ("trace", "name", "start", "duration_ms", "attrs", "error")
+
+    def __init__(self, trace, name, attrs):
+        self.trace = trace
+        self.name = name
+        self.attrs = attrs
+        self.start = None
+        self.duration_ms = None
+        self.error = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration_ms = (time.perf_counter() - self.start) * 1000
+        metrics.histogram(f"{self.trace.name}.{self.name}_ms").observe(self.duration_ms)
+        if exc is not None and not isinstance(exc, GeneratorExit):
+            self.error = exc
+            self.trace.failed = True
+        return False
+
+
+class Trace:
+    def __init__(self, name, sampled, attrs):
+        self.name = name
+        self.sampled = sampled
+        self.attrs = attrs
+        self.spans = []
+        self.failed = False
+        self.start = time.perf_counter()
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def span(self, name, **attrs):
+        span = Span(self, name, attrs)
+        self.spans.append(span)
+        return span
+
+    def finish(self, **attrs):
+        total_ms = (time.perf_counter() - self.start) * 1000
+        metrics.histogram(f"{self.name}.total_ms").observe(total_ms)
+        self.attrs.update(attrs)
+
+        slow = total_ms >= settings.TRACE_SLOW_MS
+        if not (self.sampled or slow or self.failed):
+            return
+
+        spans = []
+        for span in self.spans:
+            entry = {"name": span.name, "ms": None if span.duration_ms is None else round(span.duration_ms, 1)}
+            entry.update(_resolve(span.attrs))
+            if span.error is not None:
+                entry["error"] = repr(span.error)
+            spans.append(entry)
+
+        level = logging.WARNING if (slow or self.failed) else logging.INFO
+        logger.log(
+            level,
+            "%s%s total_ms=%.1f attrs=%s spans=%s",
+            self.name,
+            " SLOW" if slow else "",
+            total_ms,
+            _resolve(self.attrs),
+            spans,
+        )
+
+
+def start_trace(name, **attrs):
+    return Trace(name, random.random() < settings.TRACE_SAMPLE_RATE, attrs)
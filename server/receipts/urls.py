@@ -1,12 +1,18 @@
 from django.urls import path
-from .views import ReceiptUploadInitView, ReceiptListView, ReceiptUpdateView, ReceiptUploadCompleteView, ReceiptViewURL, AIQueryView
+from .views import ReceiptUploadInitView, ReceiptListView, ReceiptUpdateView, ReceiptUploadCompleteView, ReceiptViewURL, AIQueryView, MetricsView, ReceiptBulkUpdateView, LocalFileView, ReceiptEventStreamView, ReceiptChangesView, ReceiptExportView
 
 urlpatterns = [
     path("upload/", ReceiptUploadInitView.as_view(), name="receipt-upload-init"),
     path("complete/", ReceiptUploadCompleteView.as_view(), name="receipt-upload-complete"),
     path("", ReceiptListView.as_view(), name="receipt-list"),
     path("<int:id>/", ReceiptUpdateView.as_view(), name="receipt-detail"),
+    path("bulk-update/", ReceiptBulkUpdateView.as_view(), name="receipt-bulk-update"),
     path("analytics/", ReceiptListView.as_view(), name="receipt-analytics"),
     path("<int:receipt_id>/view-url/", ReceiptViewURL.as_view()),
     path("ai/query/", AIQueryView.as_view()),
+    path("metrics/", MetricsView.as_view(), name="receipt-metrics"),
+    path("events/", ReceiptEventStreamView.as_view(), name="receipt-events"),
+    path("changes/", ReceiptChangesView.as_view(), name="receipt-changes"),
+    path("export/", ReceiptExportView.as_view(), name="receipt-export"),
+    path("files/<str:token>/", LocalFileView.as_view(), name="receipt-file"),
 ]
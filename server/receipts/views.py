@@ -5,19 +5,48 @@ import requests
 import os
 from django.conf import settings
 from rest_framework import generics, status, permissions
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from .models import Receipt
-from .serializers import ReceiptListSerializer, ReceiptDetailSerializer
-from rest_framework.exceptions import PermissionDenied
-from .helper import generate_signed_upload_url, generate_signed_download_url, generate_signed_view_url
+from .models import Receipt, ReceiptContent
+from .serializers import ReceiptListSerializer, ReceiptDetailSerializer, ReceiptBulkUpdateItemSerializer, ReceiptExportParamsSerializer
+from rest_framework.exceptions import NotFound, PermissionDenied
+from .storage import LocalStorage, ObjectNotFound, get_storage, safe_filename, verify_token
+from .retrieval import get_retrieval_backend, mirror_receipts
+from .ingestion import enqueue, enqueue_reindex, touches_index
+from .dedup import find_original, link_duplicate, normalize_sha256, sha256_of, sync_duplicates
 from rest_framework.permissions import IsAuthenticated
-import time
-import traceback
+import asyncio
+import hmac
+import logging
+import re
+from urllib.parse import quote
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from django.db import transaction
+from django.utils import timezone
+from .signals import receipts_changed
+from adrf.views import APIView as AsyncAPIView
+from . import events, export, metrics
+from .answers import aget_cached_answer, aset_cached_answer, normalise_question
+from .gemini import embed_text, generate_text
+from .singleflight import UserLimitExceeded, ai_queries
+from .tracing import start_trace
 # from qdrant_client import QdrantClient
 # from sentence_transformers import SentenceTransformer
 # from rest_framework.exceptions import ValidationError
 
+logger = logging.getLogger(__name__)
+
+def check_pipeline_secret(request):
+    secret = request.headers.get("X-N8N-SECRET")
+    if not settings.N8N_SECRET or not secret or not hmac.compare_digest(secret, settings.N8N_SECRET):
+        raise PermissionDenied("Invalid n8n secret")
+
+
 class ReceiptUploadInitView(APIView):
     permission_classes = (permissions.IsAuthenticated,)
 
@@ -37,30 +66,47 @@ class ReceiptUploadInitView(APIView):
             if not filename:
                 continue
 
-            # 1️⃣ Create receipt
-            receipt = Receipt.objects.create(
-                user=user,
-                status="PENDING",
-                file_key="pending",
-            )
+            sha256 = normalize_sha256(file.get("sha256"))
+            original = find_original(user.id, sha256) if sha256 else None
 
-            # 2️⃣ Build object path
-            object_name = f"{user.id}/{receipt.id}/{uuid.uuid4().hex}_{filename}"
+            # One transaction per receipt: its saves become one receipt event
+            with transaction.atomic():
+                # 1️⃣ Create receipt
+                receipt = Receipt.objects.create(
+                    user=user,
+                    status="PENDING",
+                    file_key="pending",
+                )
 
-            receipt.file_key = object_name
-            receipt.save(update_fields=["file_key"])
+                # ♻️ Same file already uploaded: link it, nothing to upload or process
+                if original is not None:
+                    link_duplicate(receipt, original)
+                else:
+                    # 2️⃣ Build object path
+                    object_name = f"{user.id}/{receipt.id}/{uuid.uuid4().hex}_{safe_filename(filename)}"
+
+                    receipt.file_key = object_name
+                    receipt.save(update_fields=["file_key"])
+
+            if original is not None:
+                results.append({
+                    "receipt_id": receipt.id,
+                    "object_name": None,
+                    "upload_url": None,
+                    "status": receipt.status,
+                    "duplicate_of": original.id,
+                })
+                continue
 
             # 3️⃣ Signed PUT URL
-            upload_url = generate_signed_upload_url(
-                object_name=object_name,
-                content_type=content_type,
-            )
+            upload_url = get_storage().upload_url(object_name, content_type)
 
             results.append({
                 "receipt_id": receipt.id,
                 "object_name": object_name,
                 "upload_url": upload_url,
                 "status": receipt.status,
+                "duplicate_of": None,
             })
 
         return Response({"uploads": results})
@@ -80,21 +126,43 @@ class ReceiptUploadCompleteView(APIView):
 
         n8n_url = settings.N8N_WEBHOOK_URL
 
+        # Linked duplicates take their original's result; nothing to ingest
         receipts = Receipt.objects.filter(
             id__in=receipt_ids,
             user=user,
             status="PENDING",
+            duplicate_of__isnull=True,
         )
 
+        if settings.INGESTION_BACKEND == "native":
+            # Receipts stay PENDING until a worker claims the job
+            enqueue(receipts.values_list("id", flat=True))
+            return Response({"ok": True})
+
+        storage = get_storage()
         for receipt in receipts:
-            # 1️⃣ Mark uploaded
-            receipt.status = "UPLOADED"
-            receipt.save(update_fields=["status"])
+            # 1️⃣ Hash what was actually stored; nothing there yet means not uploaded
+            try:
+                sha256 = sha256_of(storage.read(receipt.file_key))
+            except ObjectNotFound:
+                continue
+
+            with transaction.atomic():
+                original = find_original(user.id, sha256, before_id=receipt.id)
+                if original is not None:
+                    # ♻️ Same file already uploaded: take its result instead
+                    link_duplicate(receipt, original)
+                    continue
 
-            # 2️⃣ Generate signed GET URL
-            download_url = generate_signed_download_url(receipt.file_key)
+                # 2️⃣ Mark uploaded
+                receipt.status = "UPLOADED"
+                receipt.content_sha256 = sha256
+                receipt.save(update_fields=["status", "content_sha256", "updated_at"])
 
-            # 3️⃣ Notify n8n
+            # 3️⃣ Generate signed GET URL
+            download_url = storage.download_url(receipt.file_key)
+
+            # 4️⃣ Notify n8n
             if n8n_url:
                 try:
                     requests.post(
@@ -116,28 +184,27 @@ class ReceiptViewURL(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, receipt_id):
-        try:
-            receipt = Receipt.objects.get(id=receipt_id)
-        except Receipt.DoesNotExist:
+        # 🔐 Ownership check in the query itself: one lookup, no user fetch
+        receipt = (
+            Receipt.objects.filter(id=receipt_id, user_id=request.user.id)
+            .only("id", "status", "file_key", "preview_key", "thumbnail_key")
+            .first()
+        )
+        if receipt is None:
             raise NotFound("Receipt not found")
 
-        # 🔐 Ownership check
-        if receipt.user != request.user:
-            raise PermissionDenied("You do not have access to this receipt")
-
-        GCS_BUCKET_NAME = settings.GCS_BUCKET_NAME
-        # print("GCS_BUCKET_NAME:", GCS_BUCKET_NAME)
-
-        signed_url = generate_signed_view_url(
-            bucket_name=GCS_BUCKET_NAME,
-            blob_name=receipt.file_key,  # e.g. user_id/receipt_id/file.png
-        )
+        storage = get_storage()
+        # Compressed preview by default; the original (e.g. user_id/receipt_id/file.png) with ?original=1
+        original = request.query_params.get("original") in ("1", "true") or not receipt.preview_key
+        view_key = receipt.file_key if original else receipt.preview_key
 
         return Response({
             "receipt_id": receipt.id,
             "status": receipt.status,
-            "view_url": signed_url,
-            "expires_in_minutes": 60,
+            "view_url": storage.download_url(view_key),
+            "is_preview": not original,
+            "thumbnail_url": storage.download_url(receipt.thumbnail_key) if receipt.thumbnail_key else None,
+            "expires_in_minutes": settings.SIGNED_URL_EXPIRY_SECONDS // 60,
         })
 
 
@@ -148,17 +215,206 @@ class ReceiptListView(generics.ListAPIView):
     def get_queryset(self):
         return Receipt.objects.filter(user=self.request.user).order_by("-created_at")
 
+    def list(self, request, *args, **kwargs):
+        # Read before the list: a change racing the query is replayed, never lost
+        last_event_id = events.latest_id(request.user.id)
+        response = super().list(request, *args, **kwargs)
+        response["X-Last-Event-ID"] = str(last_event_id)
+        return response
+
+
+def _event_id(value):
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Lets EventSource requests (Accept: text/event-stream) through content negotiation."""
+
+    media_type = "text/event-stream"
+    format = "sse"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Only error bodies get here; the stream itself is a StreamingHttpResponse
+        return json.dumps(data).encode()
+
+
+class ReceiptEventStreamView(APIView):
+    """
+    GET /receipts/events/   (text/event-stream)
+
+    Server-sent ``receipt`` events carrying the receipt as the list
+    endpoint renders it (``kind`` "updated" or "deleted"), pushed as the
+    views and the pipeline write them (receipts.events). Resumes after the
+    Last-Event-ID header or ``?last_event_id=`` (the list's X-Last-Event-ID
+    header); without either the stream starts from now. A ``reset`` event
+    means the requested id is older than the retained history: refetch
+    the list once. Streams end after RECEIPT_STREAM_MAX_SECONDS and the
+    browser reconnects with its Last-Event-ID.
+    """
+
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [JSONRenderer, EventStreamRenderer]
+
+    def get(self, request):
+        user_id = request.user.id
+        after_id = _event_id(request.headers.get("Last-Event-ID") or request.query_params.get("last_event_id"))
+        if after_id is None:
+            after_id, stale = events.latest_id(user_id), False
+        else:
+            stale = events.is_stale(after_id)
+
+        # Under ASGI an idle stream is a parked coroutine, under WSGI a blocked thread
+        if isinstance(request._request, ASGIRequest):
+            content = events.astream(user_id, after_id, stale)
+        else:
+            content = events.stream(user_id, after_id, stale)
+
+        response = StreamingHttpResponse(content, content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"  # nginx: flush every event
+        return response
+
+
+class ReceiptChangesView(APIView):
+    """
+    GET /receipts/changes/?since=<event id>
+
+    Polling fallback for the event stream: the same events as JSON, oldest
+    first, with ``last_event_id`` to pass as ``since`` next time.
+    ``reset: true`` means ``since`` is older than the retained history and
+    the client should refetch the list.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        user_id = request.user.id
+        since = _event_id(request.query_params.get("since"))
+        if since is None:
+            return Response({"detail": "since must be a non-negative integer"}, status=400)
+
+        if events.is_stale(since):
+            return Response({"events": [], "last_event_id": events.latest_id(user_id), "has_more": False, "reset": True})
+
+        changes = events.fetch(user_id, since)
+        return Response({
+            "events": [events.serialize(e) for e in changes],
+            "last_event_id": max([since, *(e["id"] for e in changes)]),
+            "has_more": len(changes) >= events.FETCH_LIMIT,
+            "reset": False,
+        })
+
+class _ExportRenderer(BaseRenderer):
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Only error bodies get here; the export itself is a StreamingHttpResponse
+        return json.dumps(data).encode()
+
+
+class CSVExportRenderer(_ExportRenderer):
+    media_type = "text/csv"
+    format = "csv"
+
+
+class NDJSONExportRenderer(_ExportRenderer):
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+
+
+class ReceiptExportView(APIView):
+    """
+    GET /receipts/export/?format=csv|ndjson
+
+    Streams all of the user's receipts, ordered by purchase date, as CSV
+    (default) or NDJSON; the format can also come from the Accept header.
+    Filters: ``date_from``/``date_to`` (YYYY-MM-DD, inclusive, on
+    purchase_date), ``status`` (comma-separated), ``merchant``
+    (substring). ``include=content`` adds the OCR text; ``gzip=1``
+    returns a .gz file. Memory use does not depend on the row count
+    (see receipts.export).
+    """
+
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [CSVExportRenderer, NDJSONExportRenderer]
+
+    def get(self, request):
+        params = ReceiptExportParamsSerializer(data=request.query_params)
+        if not params.is_valid():
+            return Response(params.errors, status=400)
+        options = params.validated_data
+        fmt = request.accepted_renderer.format
+
+        queryset = export.export_queryset(
+            request.user.id,
+            date_from=options.get("date_from"),
+            date_to=options.get("date_to"),
+            statuses=options.get("status"),
+            merchant=options.get("merchant"),
+            include_content=options["include"],
+        )
+        stream = export.astream if isinstance(request._request, ASGIRequest) else export.stream
+        content = stream(queryset, fmt, include_content=options["include"], gzip=options["gzip"])
+
+        content_type = "application/gzip" if options["gzip"] else export.CONTENT_TYPES[fmt]
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="{export.filename(fmt, options["gzip"])}"'
+        response["Cache-Control"] = "no-store"
+        response["X-Accel-Buffering"] = "no"
+        metrics.counter(f"receipt_export.{fmt}").inc()
+        return response
+
+def _mirror_for_local_search(receipt_ids):
+    """
+    After the n8n workflow marks receipts READY, copy their Qdrant points
+    into ReceiptEmbedding so the local retrieval backend can find them
+    (the native pipeline writes those rows itself).
+    """
+    if not receipt_ids or settings.RETRIEVAL_BACKEND != "local" or settings.INGESTION_BACKEND == "native":
+        return
+
+    def mirror():
+        try:
+            mirror_receipts(receipt_ids)
+        except Exception:
+            # sync_local_index catches up later
+            logger.warning("could not mirror Qdrant points for receipts %s", receipt_ids, exc_info=True)
+
+    transaction.on_commit(mirror)
+
+
 class ReceiptUpdateView(generics.RetrieveUpdateAPIView):
+    """
+    OCR text and raw extraction JSON live in the ReceiptContent side table
+    and are only loaded and returned with ?include=content.
+    """
+
     serializer_class = ReceiptDetailSerializer
     lookup_field = "id"
 
+    def include_content(self):
+        return "content" in self.request.query_params.get("include", "").split(",")
+
     def get_queryset(self):
         # User access (GET)
         if self.request.method == "GET":
-            return Receipt.objects.filter(user=self.request.user)
-
+            queryset = Receipt.objects.filter(user=self.request.user)
         # n8n access (PATCH)
-        return Receipt.objects.all()
+        else:
+            queryset = Receipt.objects.all()
+
+        if self.include_content():
+            queryset = queryset.select_related("content")
+        return queryset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["include_content"] = self.include_content()
+        return context
 
     def get_permissions(self):
         if self.request.method == "GET":
@@ -167,142 +423,224 @@ class ReceiptUpdateView(generics.RetrieveUpdateAPIView):
 
     def patch(self, request, *args, **kwargs):
         # 🔐 n8n authentication
-        secret = request.headers.get("X-N8N-SECRET")
-        if secret != settings.N8N_SECRET:
-            raise PermissionDenied("Invalid n8n secret")
+        check_pipeline_secret(request)
 
         return super().patch(request, *args, **kwargs)
 
-class AIQueryView(APIView):
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        sync_duplicates([serializer.instance.id])
+        # Corrected fields or OCR text: rebuild the changed chunks
+        if touches_index(serializer.validated_data):
+            enqueue_reindex([serializer.instance.id])
+        if serializer.validated_data.get("status") == "READY":
+            _mirror_for_local_search([serializer.instance.id])
+
+class ReceiptBulkUpdateView(APIView):
     """
-    POST /api/ai/query/
+    POST /receipts/bulk-update/   (X-N8N-SECRET)
     {
-      "question": "How much did I pay to AARYAN?"
+      "updates": [
+        {"id": 12, "status": "PROCESSING"},
+        {"id": 13, "ocr_text": "...", "merchant_name": "AMAZON", "total_amount": 1299.0}
+      ]
     }
+
+    Validates every item, then applies the valid ones in one transaction
+    with one bulk_update per distinct set of fields. Returns a result per
+    item in request order.
     """
 
-    permission_classes = [IsAuthenticated]
+    authentication_classes = []
+    permission_classes = []
 
-    TOP_K = 5
+    MAX_ITEMS = 500
 
     def post(self, request):
+        check_pipeline_secret(request)
 
-        t0 = time.time()
+        updates = request.data.get("updates")
+        if not isinstance(updates, list) or not updates:
+            return Response({"detail": "updates must be a non-empty list"}, status=400)
+        if len(updates) > self.MAX_ITEMS:
+            return Response({"detail": f"at most {self.MAX_ITEMS} updates per request"}, status=400)
 
-        def dbg(msg, **kwargs):
-            prefix = "[AIQueryView]"
-            if kwargs:
-                print(prefix, msg, "|", json.dumps(kwargs, default=str))
-            else:
-                print(prefix, msg)
+        results = [None] * len(updates)
+        valid = {}  # receipt id -> (position, validated data)
+
+        for pos, item in enumerate(updates):
+            if not isinstance(item, dict) or "id" not in item:
+                results[pos] = {"id": None, "ok": False, "errors": {"id": ["This field is required."]}}
+                continue
+            serializer = ReceiptBulkUpdateItemSerializer(data=item, partial=True)
+            if not serializer.is_valid():
+                results[pos] = {"id": item["id"], "ok": False, "errors": serializer.errors}
+                continue
+            data = dict(serializer.validated_data)
+            receipt_id = data.pop("id")
+            if receipt_id in valid:
+                results[pos] = {"id": receipt_id, "ok": False, "errors": {"id": ["Duplicate id in request."]}}
+                continue
+            valid[receipt_id] = (pos, data)
+
+        with transaction.atomic():
+            receipts = Receipt.objects.select_for_update().in_bulk(list(valid))
+            now = timezone.now()
+            groups = {}
+
+            content_groups = {}
+            reindex_ids = []
+            ready_ids = []
+
+            for receipt_id, (pos, data) in valid.items():
+                receipt = receipts.get(receipt_id)
+                if receipt is None:
+                    results[pos] = {"id": receipt_id, "ok": False, "errors": {"id": ["Receipt not found."]}}
+                    continue
+                content = {name: data.pop(name) for name in ReceiptContent.CONTENT_FIELDS if name in data}
+                if content:
+                    content_groups.setdefault(tuple(sorted(content)), {})[receipt_id] = content
+                if touches_index([*data, *content]):
+                    reindex_ids.append(receipt_id)
+                if data.get("status") == "READY":
+                    ready_ids.append(receipt_id)
+                for field, value in data.items():
+                    setattr(receipt, field, value)
+                receipt.updated_at = now
+                groups.setdefault(tuple(sorted(data)), []).append(receipt)
+                results[pos] = {"id": receipt_id, "ok": True}
+
+            for fields, objs in groups.items():
+                Receipt.objects.bulk_update(objs, [*fields, "updated_at"])
+                events.record(objs)
+            for fields, values in content_groups.items():
+                ReceiptContent.bulk_upsert(values, fields)
+
+            sync_duplicates([r.id for objs in groups.values() for r in objs])
+            enqueue_reindex(reindex_ids)
+            _mirror_for_local_search(ready_ids)
+
+            # bulk_update skips post_save; drop caches for the affected users
+            user_ids = {r.user_id for objs in groups.values() for r in objs}
+            transaction.on_commit(lambda: receipts_changed(user_ids))
+
+        updated = sum(1 for r in results if r["ok"])
+        return Response({"updated": updated, "failed": len(results) - updated, "results": results})
+
+class AIQueryView(AsyncAPIView):
+    """
+    POST /api/ai/query/
+    {
+      "question": "How much did I pay to AARYAN?"
+    }
+
+    Native async view: under ASGI the upstream calls only hold the event
+    loop, not a worker thread. The answer-cache lookup runs concurrently
+    with the query embedding, and the whole chain is bounded by
+    AI_QUERY_DEADLINE_SECONDS. Each stage is timed as a span of the
+    "ai_query" trace (see receipts.tracing).
+
+    Concurrent requests with the same user and normalised question wait
+    on one chain and share its response (receipts.singleflight); a user
+    may run at most AI_QUERY_MAX_CONCURRENT_PER_USER distinct chains per
+    process at once, further ones get 429.
+    """
 
-        dbg("ENTER post()", user_id=getattr(request.user, "id", None))
-        dbg("Incoming request.data keys", keys=list(getattr(request, "data", {}).keys()))
+    permission_classes = [IsAuthenticated]
+
+    TOP_K = 5
 
+    async def post(self, request):
         # accept both "query" and "question" to reduce client mismatch issues
         question = request.data.get("query") or request.data.get("question")
-        dbg("Parsed question", has_question=bool(question), length=(len(question) if question else 0))
 
         if not question:
-            dbg("BAD REQUEST: missing question/query field")
             return Response(
                 {"error": "question is required"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
         user_id = request.user.id
-        dbg("Resolved user_id", user_id=user_id)
+        trace = start_trace("ai_query", user_id=user_id, question_len=lambda: len(question))
 
-        # 1️⃣ Generate query embedding (Gemini)
+        async def answer():
+            response = await self._answer(user_id, question, trace)
+            return response.data, response.status_code
+
+        coalesced = False
         try:
-            embed_url = (
-                f"https://generativelanguage.googleapis.com/v1beta/"
-                f"{settings.GEMINI_EMBED_MODEL}:embedContent"
-                f"?key={settings.GEMINI_API_KEY}"
+            async with asyncio.timeout(settings.AI_QUERY_DEADLINE_SECONDS):
+                # Identical questions in flight for this user share one chain
+                (data, status_code), coalesced = await ai_queries.run(
+                    (user_id, normalise_question(question)),
+                    user_id,
+                    answer,
+                    limit=settings.AI_QUERY_MAX_CONCURRENT_PER_USER,
+                )
+            response = Response(data, status=status_code)
+        except UserLimitExceeded:
+            metrics.counter("ai_query.rejected").inc()
+            response = Response(
+                {"error": "Too many AI queries in progress. Please wait for them to finish."},
+                status=status.HTTP_429_TOO_MANY_REQUESTS,
+                headers={"Retry-After": "2"},
             )
-            safe_embed_url = embed_url.split("?key=")[0] + "?key=<redacted>"
-            dbg("STEP 1: embedding request prepared", url=safe_embed_url, model=str(settings.GEMINI_EMBED_MODEL))
-
-            embed_payload = {"content": {"parts": [{"text": question}]}}
-            dbg("STEP 1: embedding payload prepared", payload_size=len(json.dumps(embed_payload)))
-
-            t1 = time.time()
-            embed_resp = requests.post(embed_url, json=embed_payload, timeout=15)
-            dbg(
-                "STEP 1: embedding response received",
-                status_code=embed_resp.status_code,
-                elapsed_ms=int((time.time() - t1) * 1000),
+        except TimeoutError:
+            trace.failed = True
+            response = Response(
+                {"error": "AI query timed out. Please try again."},
+                status=status.HTTP_504_GATEWAY_TIMEOUT,
             )
 
-            if embed_resp.status_code >= 400:
-                dbg(
-                    "STEP 1: embedding error body",
-                    body_preview=embed_resp.text[:1500],
-                )
-
-            embed_resp.raise_for_status()
+        if coalesced:
+            metrics.counter("ai_query.coalesced").inc()
+        trace.finish(status=response.status_code, coalesced=coalesced)
+        return response
 
-            embed_json = embed_resp.json()
-            dbg("STEP 1: embedding JSON parsed", top_keys=list(embed_json.keys()))
-
-            query_vector = embed_json["embedding"]["values"]
-            dbg("STEP 1: embedding vector extracted", vector_len=len(query_vector))
-        except Exception as e:
-            dbg("STEP 1 FAILED: embedding generation", error=str(e))
-            dbg("TRACEBACK", tb=traceback.format_exc())
+    async def _answer(self, user_id, question, trace):
+        # 1️⃣ Answer-cache lookup and query embedding (Gemini), concurrently
+        embed_task = asyncio.create_task(embed_text(question))
+        version = None
+        try:
+            with trace.span("cache_lookup") as span:
+                try:
+                    version, cached = await aget_cached_answer(user_id, question)
+                except Exception as e:
+                    span.set(error=repr(e))
+                    cached = None
+                span.set(hit=cached is not None)
+
+            if cached is not None:
+                return Response(cached)
+
+            with trace.span("embed") as span:
+                query_vector = await embed_task
+                span.set(vector_len=lambda: len(query_vector))
+        except Exception:
+            logger.exception("AI query embedding failed")
             return Response(
                 {"error": "Embedding generation failed. Check server logs for details."},
                 status=status.HTTP_502_BAD_GATEWAY,
             )
+        finally:
+            # Cache hit, failure or deadline: don't leave the embed call running.
+            if not embed_task.done():
+                embed_task.cancel()
 
-        # 2️⃣ Qdrant semantic search (user-scoped)
+        # 2️⃣ Semantic search (user-scoped)
         try:
-            search_url = (
-                f"{settings.QDRANT_URL}/collections/"
-                f"{settings.QDRANT_COLLECTION}/points/search"
-            )
-            dbg("STEP 2: qdrant search prepared", url=search_url, collection=str(settings.QDRANT_COLLECTION))
-
-            search_payload = {
-                "vector": query_vector,
-                "limit": self.TOP_K,
-                "with_payload": True,
-                "filter": {
-                    "must": [
-                        {"key": "user_id", "match": {"value": user_id}},
-                    ]
-                },
-            }
-            dbg("STEP 2: qdrant payload prepared", limit=self.TOP_K, payload_size=len(json.dumps(search_payload)))
-
-            t2 = time.time()
-            search_resp = requests.post(search_url, json=search_payload, timeout=10)
-            dbg(
-                "STEP 2: qdrant response received",
-                status_code=search_resp.status_code,
-                elapsed_ms=int((time.time() - t2) * 1000),
-            )
-
-            if search_resp.status_code >= 400:
-                dbg("STEP 2: qdrant error body", body_preview=search_resp.text[:1500])
-
-            search_resp.raise_for_status()
-
-            search_json = search_resp.json()
-            dbg("STEP 2: qdrant JSON parsed", top_keys=list(search_json.keys()))
-
-            results = search_json.get("result", [])
-            dbg("STEP 2: qdrant results extracted", result_count=len(results))
-        except Exception as e:
-            dbg("STEP 2 FAILED: qdrant search", error=str(e))
-            dbg("TRACEBACK", tb=traceback.format_exc())
+            backend = get_retrieval_backend()
+            with trace.span("search", backend=backend.name) as span:
+                results = await backend.asearch(user_id, query_vector, self.TOP_K)
+                span.set(result_count=lambda: len(results))
+        except Exception:
+            logger.exception("AI query vector search failed")
             return Response(
                 {"error": "Vector search failed. Check server logs for details."},
                 status=status.HTTP_502_BAD_GATEWAY,
             )
 
         if not results:
-            dbg("NO RESULTS: returning fallback answer", total_elapsed_ms=int((time.time() - t0) * 1000))
             return Response(
                 {
                     "answer": "I do not have enough information to answer that.",
@@ -311,43 +649,20 @@ class AIQueryView(APIView):
             )
 
         # 3️⃣ Build grounded context
-        try:
-            dbg("STEP 3: building context from results")
+        with trace.span("context") as span:
             context_blocks = []
             source_receipts = set()
 
-            for idx, r in enumerate(results):
+            for r in results:
                 payload = r.get("payload", {}) or {}
-                content = payload.get("content", "") or ""
-                receipt_id = payload.get("receipt_id")
-
-                dbg(
-                    "STEP 3: result item",
-                    idx=idx,
-                    has_payload=bool(payload),
-                    content_len=len(content),
-                    receipt_id=receipt_id,
-                )
-
-                context_blocks.append(content)
+                context_blocks.append(payload.get("content", "") or "")
 
+                receipt_id = payload.get("receipt_id")
                 if receipt_id:
                     source_receipts.add(receipt_id)
 
             context = "\n\n---\n\n".join(context_blocks)
-            dbg(
-                "STEP 3: context built",
-                blocks=len(context_blocks),
-                context_len=len(context),
-                sources_count=len(source_receipts),
-            )
-        except Exception as e:
-            dbg("STEP 3 FAILED: context building", error=str(e))
-            dbg("TRACEBACK", tb=traceback.format_exc())
-            return Response(
-                {"error": "Failed to build context. Check server logs for details."},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            )
+            span.set(blocks=len(context_blocks), context_len=lambda: len(context))
 
         # 4️⃣ Strict RAG prompt (anti-hallucination)
         prompt = f"""
@@ -364,59 +679,143 @@ Rules:
 - If the answer is not present, say:
   "I do not have enough information to answer that."
 """.strip()
-        dbg("STEP 4: prompt prepared", prompt_len=len(prompt))
 
         # 5️⃣ Generate final answer (Gemini text model)
         try:
-            gen_url = (
-                f"https://generativelanguage.googleapis.com/v1beta/"
-                f"models/{settings.GEMINI_TEXT_MODEL}:generateContent"
-                f"?key={settings.GEMINI_API_KEY}"
-            )
-            safe_gen_url = gen_url.split("?key=")[0] + "?key=<redacted>"
-            dbg("STEP 5: generation request prepared", url=safe_gen_url, model=str(settings.GEMINI_TEXT_MODEL))
-
-            gen_payload = {
-                "contents": [{"parts": [{"text": prompt}]}],
-                "generationConfig": {"temperature": 0.2},
-            }
-            dbg("STEP 5: generation payload prepared", payload_size=len(json.dumps(gen_payload)))
-
-            t3 = time.time()
-            gen_resp = requests.post(gen_url, json=gen_payload, timeout=30)
-            dbg(
-                "STEP 5: generation response received",
-                status_code=gen_resp.status_code,
-                elapsed_ms=int((time.time() - t3) * 1000),
+            with trace.span("generate", prompt_len=lambda: len(prompt)) as span:
+                answer = await generate_text(prompt)
+                span.set(answer_len=lambda: len(answer))
+        except Exception:
+            logger.exception("AI query answer generation failed")
+            return Response(
+                {"error": "Answer generation failed. Check server logs for details."},
+                status=status.HTTP_502_BAD_GATEWAY,
             )
 
-            if gen_resp.status_code >= 400:
-                dbg("STEP 5: generation error body", body_preview=gen_resp.text[:1500])
+        data = {
+            "answer": answer,
+            "sources": list(source_receipts),
+        }
+        if version is not None:
+            try:
+                await aset_cached_answer(user_id, version, question, data)
+            except Exception:
+                logger.warning("AI answer cache store failed", exc_info=True)
 
-            gen_resp.raise_for_status()
+        return Response(data)
 
-            gen_json = gen_resp.json()
-            dbg("STEP 5: generation JSON parsed", top_keys=list(gen_json.keys()))
 
-            answer = (
-                gen_json.get("candidates", [{}])[0]
-                .get("content", {})
-                .get("parts", [{}])[0]
-                .get("text", "Unable to generate answer.")
-            )
-            dbg("STEP 5: answer extracted", answer_len=len(answer))
-        except Exception as e:
-            dbg("STEP 5 FAILED: answer generation", error=str(e))
-            dbg("TRACEBACK", tb=traceback.format_exc())
-            return Response(
-                {"error": "Answer generation failed. Check server logs for details."},
-                status=status.HTTP_502_BAD_GATEWAY,
-            )
+class MetricsView(APIView):
+    """Per-process counters and latency histograms (staff only)."""
 
-        dbg("SUCCESS: returning response", total_elapsed_ms=int((time.time() - t0) * 1000))
-        return Response(
-            {
-                "answer": answer,
-                "sources": list(source_receipts),
-            }
-        )
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(metrics.snapshot())
+
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _iter_range(f, remaining, chunk_size=64 * 1024):
+    with f:
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _harden_file_response(response, path, inline):
+    disposition = "inline" if inline else "attachment"
+    response["Content-Disposition"] = f"{disposition}; filename*=UTF-8''{quote(path.name)}"
+    response["X-Content-Type-Options"] = "nosniff"
+    # Even an inline file gets no script, frames or connections
+    response["Content-Security-Policy"] = "default-src 'none'; img-src 'self'; style-src 'unsafe-inline'"
+    return response
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class LocalFileView(View):
+    """
+    GET/HEAD/PUT /receipts/files/<token>/
+
+    Signed, expiring URLs for the local storage backend; the token carries
+    the method and object key (see receipts.storage). GET honours single
+    byte ranges. Whole-file responses are FileResponses, which WSGI servers
+    send with sendfile; with LOCAL_STORAGE_ACCEL_PREFIX set, nginx serves
+    the file itself via X-Accel-Redirect (ranges included).
+    """
+
+    def get(self, request, token):
+        key = verify_token(token, "GET")
+        storage = get_storage()
+        if key is None or not isinstance(storage, LocalStorage):
+            return HttpResponse(status=403)
+        try:
+            path = storage.local_path(key)
+            size = path.stat().st_size
+        except (ObjectNotFound, FileNotFoundError):
+            return HttpResponse(status=404)
+
+        # Files are served from the API origin: only images and PDFs inline,
+        # everything else as an opaque download
+        content_type = storage.content_type(path)
+        inline = content_type is not None
+        content_type = content_type or "application/octet-stream"
+
+        if settings.LOCAL_STORAGE_ACCEL_PREFIX:
+            response = HttpResponse(content_type=content_type)
+            response["X-Accel-Redirect"] = f"{settings.LOCAL_STORAGE_ACCEL_PREFIX.rstrip('/')}/{quote(key)}"
+            return _harden_file_response(response, path, inline)
+
+        match = RANGE_RE.match(request.headers.get("Range", ""))
+        if match and any(match.groups()):
+            start, end = match.groups()
+            if start:
+                start = int(start)
+                end = min(int(end), size - 1) if end else size - 1
+            else:
+                # bytes=-N: the last N bytes
+                start = max(size - int(end), 0)
+                end = size - 1
+            if start > end or start >= size:
+                response = HttpResponse(status=416)
+                response["Content-Range"] = f"bytes */{size}"
+                return response
+
+            f = open(path, "rb")
+            f.seek(start)
+            length = end - start + 1
+            response = StreamingHttpResponse(_iter_range(f, length), status=206, content_type=content_type)
+            response["Content-Range"] = f"bytes {start}-{end}/{size}"
+            response["Content-Length"] = str(length)
+        else:
+            response = FileResponse(open(path, "rb"), content_type=content_type)
+
+        response["Accept-Ranges"] = "bytes"
+        response["Cache-Control"] = "private, max-age=300"
+        return _harden_file_response(response, path, inline)
+
+    def put(self, request, token):
+        key = verify_token(token, "PUT")
+        storage = get_storage()
+        if key is None or not isinstance(storage, LocalStorage):
+            return HttpResponse(status=403)
+
+        try:
+            length = int(request.headers.get("Content-Length") or 0)
+        except ValueError:
+            return HttpResponse(status=400)
+        if length < 0:
+            return HttpResponse(status=400)
+        if length > settings.LOCAL_STORAGE_MAX_UPLOAD_BYTES:
+            return HttpResponse(status=413)
+        try:
+            storage.save(key, request)
+        except ObjectNotFound:
+            return HttpResponse(status=400)
+        except ValueError:
+            return HttpResponse(status=413)
+        return HttpResponse(status=200)